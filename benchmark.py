@@ -0,0 +1,600 @@
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from functools import wraps
+
+import duckdb
+import httpx
+import pandas as pd
+from selectolax.parser import HTMLParser
+
+import cleaning
+import compression
+import converter
+import frames
+import replay_server
+from proxy_pool import ProxyPool, load_proxies
+from records import ProductSchema
+from scraper import SEO_HTML_PATTERN, FTScraper, FetchResult
+from tests.legacy import (
+	legacy_clean_handle, legacy_clean_html, legacy_clean_text_2, legacy_csv_to_jsonl, legacy_jsonl_lines,
+	legacy_to_handle, regex_seo_html, two_pass_lookup
+)
+
+# Files get_data and transform_product_datas read from the working directory
+PIPELINE_FILES = ['shopify_schema.json', 'variant_unused_columns.csv', 'images_unused_columns.csv']
+PARSE_FUNCTIONS = ['parse_product_html', 'extract_product_data', 'clean_json_string', 'clean_html', 'get_price']
+
+
+def record_corpus(database_name, corpus_dir, limit=None):
+	# Dump stored pages into corpus_dir so benchmarks run without network access
+	conn = duckdb.connect(database_name, read_only=True)
+	try:
+		tables = [row[0] for row in conn.execute("SELECT table_name FROM information_schema.tables").fetchall()]
+		for table_name, folder in (('product_src', 'products'), ('search_src', 'search')):
+			if table_name not in tables:
+				continue
+			os.makedirs(os.path.join(corpus_dir, folder), exist_ok=True)
+			codec = FTScraper().page_codec(conn, table_name)
+			query = f"SELECT url, html FROM {table_name}"
+			if limit:
+				query += f" LIMIT {int(limit)}"
+			curr = conn.execute(query)
+			urls = list()
+			while rows := curr.fetchmany(100):
+				for url, html in rows:
+					with open(os.path.join(corpus_dir, folder, f'{len(urls):06d}.html'), 'wb') as file:
+						file.write(codec.decompress(html))
+					urls.append(url)
+			with open(os.path.join(corpus_dir, folder, 'urls.json'), 'w') as file:
+				json.dump(urls, file)
+			print(f'{len(urls)} pages recorded from {table_name}')
+	finally:
+		conn.close()
+
+
+def load_corpus(corpus_dir, folder):
+	with open(os.path.join(corpus_dir, folder, 'urls.json'), 'r') as file:
+		urls = json.load(file)
+	pages = list()
+	for i, url in enumerate(urls):
+		with open(os.path.join(corpus_dir, folder, f'{i:06d}.html'), 'rb') as file:
+			pages.append((url, file.read()))
+
+	return pages
+
+
+def scale_pages(pages, scale):
+	# Synthetic scale-up: cycle through the recorded pages under unique urls
+	if not scale:
+		yield from pages
+		return
+	for i in range(scale):
+		url, html = pages[i % len(pages)]
+		yield (url if i < len(pages) else f'{url}-{i}'), html
+
+
+def build_database(scraper, pages, table_name, batch_size=1000):
+	conn = duckdb.connect('thelashop.db')
+	try:
+		scraper.create_tables(conn, table_name)
+		batch = list()
+		for url, html in pages:
+			batch.append(FetchResult(url, html=html, http_status=200))
+			if len(batch) >= batch_size:
+				scraper.write_pages(conn, table_name, batch)
+				batch = list()
+		if batch:
+			scraper.write_pages(conn, table_name, batch)
+	finally:
+		conn.close()
+
+
+class FunctionTimer:
+	# Wraps attributes of an object or module to accumulate call counts and wall time
+
+	def __init__(self):
+		self.stats = dict()
+		self.patched = list()
+
+	def instrument(self, target, names):
+		for name in names:
+			original = getattr(target, name)
+			stat = self.stats.setdefault(name, {'calls': 0, 'seconds': 0.0})
+
+			def timed(*args, __original=original, __stat=stat, **kwargs):
+				start = time.perf_counter()
+				try:
+					return __original(*args, **kwargs)
+				finally:
+					__stat['calls'] += 1
+					__stat['seconds'] += time.perf_counter() - start
+
+			setattr(target, name, wraps(original)(timed))
+			self.patched.append((target, name, original))
+
+	def restore(self):
+		for target, name, original in reversed(self.patched):
+			if isinstance(target, type) or not hasattr(type(target), name):
+				setattr(target, name, original)
+			else:
+				delattr(target, name)
+		self.patched = list()
+
+
+@contextlib.contextmanager
+def measure(results, stage, count=None, unit='items', trace_memory=True):
+	# Records seconds, throughput and peak traced memory of the wrapped block in results[stage]
+	entry = results.setdefault(stage, dict())
+	if trace_memory:
+		tracemalloc.start()
+	start = time.perf_counter()
+	try:
+		yield entry
+	finally:
+		seconds = time.perf_counter() - start
+		entry['seconds'] = round(seconds, 4)
+		count = entry.pop('count', count)
+		if count is not None:
+			entry[unit] = count
+			entry[f'{unit}_per_sec'] = round(count / seconds, 2) if seconds else None
+		if trace_memory:
+			entry['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+			tracemalloc.stop()
+
+
+def cleaning_stages(stages, frame, fragments, trace_memory=True):
+	# Row by row .apply of the legacy cleaners against the cleaning.py *_series entry points
+	html = pd.Series(fragments, dtype=object)
+	titles = frame['Title'].astype(object)
+	alt_titles = frame['Handle'].astype(object)
+	texts = frame['Body (HTML)'].astype(object)
+	handles = frame['Handle'].astype(object)
+	cases = {
+		'clean_html': (lambda: html.apply(legacy_clean_html), lambda: cleaning.clean_html_series(html), len(html)),
+		'to_handle': (
+			lambda: frame.apply(lambda x: legacy_to_handle(x['Title'], x['Handle']), axis=1),
+			lambda: cleaning.to_handle_series(titles, alt_titles),
+			len(frame)
+		),
+		'clean_text_2': (lambda: texts.apply(legacy_clean_text_2), lambda: cleaning.clean_text_2_series(texts), len(texts)),
+		'clean_handle': (lambda: handles.apply(legacy_clean_handle), lambda: cleaning.clean_handle_series(handles), len(handles))
+	}
+	for name, (legacy, series, count) in cases.items():
+		with measure(stages, f'{name}[apply]', count=count, unit='rows', trace_memory=trace_memory):
+			legacy()
+		with measure(stages, f'{name}[series]', count=count, unit='rows', trace_memory=trace_memory):
+			series()
+
+
+def response_bodies(pages, decode):
+	# The fetch -> write_pages -> HTMLParser path of a page body: decode=True is the old
+	# response.text, re-encoded before hashing and storing, decode=False keeps the raw bytes
+	for url, html in pages:
+		response = httpx.Response(200, content=html, headers={'content-type': 'text/html; charset=utf-8'})
+		body = bytes(response.text, 'utf-8') if decode else response.content
+		hashlib.md5(body).hexdigest()
+		HTMLParser(body)
+
+
+def stored_mb(table_name):
+	conn = duckdb.connect('thelashop.db', read_only=True)
+	try:
+		return round((conn.execute(f"SELECT sum(octet_length(html)) FROM {table_name}").fetchone()[0] or 0) / 1024 / 1024, 2)
+	finally:
+		conn.close()
+
+
+def parse_breakdown(scraper, pages, product_schema):
+	# Average per-page milliseconds of each phase of parse_product_html
+	phases = dict.fromkeys(['html_parser', 'extract_page', 'build_product_html', 'two_pass_lookup'], 0.0)
+	for url, html in pages:
+		start = time.perf_counter()
+		tree = HTMLParser(html)
+		parsed = time.perf_counter()
+		page = scraper.extract_page(tree)
+		extracted = time.perf_counter()
+		scraper.build_product_html(url, page, product_schema)
+		built = time.perf_counter()
+		two_pass_lookup(tree)
+		phases['html_parser'] += parsed - start
+		phases['extract_page'] += extracted - parsed
+		phases['build_product_html'] += built - extracted
+		phases['two_pass_lookup'] += time.perf_counter() - built
+
+	return {f'{name}_ms_per_page': round(seconds * 1000 / len(pages), 4) for name, seconds in phases.items()}
+
+
+def bulk_frame(df):
+	# Add the columns csv_to_jsonl expects from the product id lookup and image merge steps
+	df = converter.deduplicate_handles(df.fillna(''))
+	df['id'] = [f'gid://shopify/Product/{i}' for i in range(len(df))]
+	df['variant_id'] = [f'gid://shopify/ProductVariant/{i}' for i in range(len(df))]
+	df['Link'] = df['Image Src'].apply(lambda x: [x] if x else '')
+	df['Image Alt Text'] = df['Image Alt Text'].apply(lambda x: [x] if x else '')
+
+	return df
+
+
+def run_benchmark(corpus_dir, scale=None, workers=1, trace_memory=True, jsonl_modes=('pc', 'pu', 'vc', 'vup', 'ap', 'pp'), legacy_rows=5000):
+	repo_dir = os.path.dirname(os.path.abspath(__file__))
+	corpus_dir = os.path.abspath(corpus_dir)
+	products = load_corpus(corpus_dir, 'products')
+	searches = load_corpus(corpus_dir, 'search') if os.path.exists(os.path.join(corpus_dir, 'search')) else []
+	scraper = FTScraper()
+	stages = dict()
+	functions = FunctionTimer()
+	cwd = os.getcwd()
+	work_dir = tempfile.mkdtemp(prefix='thelashop-bench-')
+
+	try:
+		for name in PIPELINE_FILES:
+			shutil.copy(os.path.join(repo_dir, name), work_dir)
+		os.chdir(work_dir)
+		page_count = scale or len(products)
+		build_database(scraper, scale_pages(products, scale), 'product_src')
+		build_database(scraper, searches, 'search_src')
+
+		with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+			if searches:
+				with measure(stages, 'get_product_urls', count=len(searches), unit='pages', trace_memory=trace_memory):
+					scraper.get_product_urls()
+
+			if workers == 1:
+				# Instrumented methods cannot be pickled into the process pool
+				functions.instrument(scraper, PARSE_FUNCTIONS)
+			for name, decode in (('response_body[text]', True), ('response_body[bytes]', False)):
+				with measure(stages, name, count=page_count, unit='pages', trace_memory=trace_memory):
+					response_bodies(scale_pages(products, scale), decode)
+
+			with measure(stages, 'get_data', count=page_count, unit='pages', trace_memory=trace_memory):
+				df = scraper.get_data(workers=workers)
+			functions.restore()
+
+			if compression.zstandard is not None:
+				# The same pages again with their bodies zstd compressed in product_src
+				with measure(stages, 'migrate_compression[zstd]', count=page_count, unit='pages', trace_memory=trace_memory) as entry:
+					entry['html_mb_before'] = stored_mb('product_src')
+					FTScraper(compression='zstd').migrate_compression()
+					entry['html_mb_after'] = stored_mb('product_src')
+				with measure(stages, 'get_data[zstd]', count=page_count, unit='pages', trace_memory=trace_memory):
+					scraper.get_data(workers=workers)
+
+			with measure(stages, 'transform_product_datas', unit='rows', trace_memory=trace_memory) as entry:
+				transformed = scraper.transform_product_datas(df)
+				entry['count'] = len(transformed)
+
+			product_schema = ProductSchema.load()
+			with measure(stages, 'parse_breakdown', count=len(products), unit='pages', trace_memory=False) as entry:
+				entry.update(parse_breakdown(scraper, products, product_schema))
+
+			fragments = list()
+			blobs = list()
+			for _, html in products:
+				tree = HTMLParser(html)
+				body = tree.css_first('div.pg__tabs > div > div > div')
+				if body is not None:
+					fragments.append(body.html)
+				for script in tree.css('script'):
+					text = script.text()
+					if 'var seo_html' in text:
+						blobs.append(text)
+						break
+
+			with measure(stages, 'clean_html', count=len(fragments), unit='calls', trace_memory=trace_memory):
+				for fragment in fragments:
+					scraper.clean_html(fragment)
+
+			with measure(stages, 'extract_product_data', count=len(blobs), unit='calls', trace_memory=trace_memory):
+				for blob in blobs:
+					scraper.extract_product_data(blob)
+
+			with measure(stages, 'seo_html[jsliteral]', count=len(blobs), unit='calls', trace_memory=trace_memory):
+				for blob in blobs:
+					scraper.clean_json_string(blob, SEO_HTML_PATTERN.search(blob).end())
+
+			with measure(stages, 'seo_html[regex]', count=len(blobs), unit='calls', trace_memory=trace_memory):
+				for blob in blobs:
+					regex_seo_html(blob)
+
+			cleaning_stages(stages, transformed, fragments * max(1, len(transformed) // max(1, len(fragments))), trace_memory)
+
+			bulk = bulk_frame(transformed)
+			for extension in ('csv', 'parquet'):
+				# The handoff between converter steps, csv as it was and the Parquet files that replaced it
+				bulk_path = os.path.join(work_dir, f'bulk.{extension}')
+				with measure(stages, f'save_frame[{extension}]', count=len(bulk), unit='rows', trace_memory=trace_memory) as entry:
+					frames.save_frame(bulk, bulk_path)
+				entry['mb'] = round(os.path.getsize(bulk_path) / 1024 / 1024, 3)
+				with measure(stages, f'load_frame[{extension}]', count=len(bulk), unit='rows', trace_memory=trace_memory):
+					frames.load_frame(bulk_path)
+			# The df.iloc version only gets the first legacy_rows rows, at full scale it runs for minutes. It reads
+			# them from a csv, the intermediate it was written for, the builders from Parquet
+			legacy_path = os.path.join(work_dir, 'bulk_legacy.csv')
+			frames.save_frame(bulk.head(legacy_rows), legacy_path)
+			rows_path = os.path.join(work_dir, 'bulk_legacy.parquet')
+			frames.save_frame(bulk.head(legacy_rows), rows_path)
+			for mode in jsonl_modes:
+				with measure(stages, f'csv_to_jsonl[{mode}]', count=len(bulk), unit='rows', trace_memory=trace_memory):
+					converter.csv_to_jsonl(bulk_path, os.path.join(work_dir, f'{mode}.jsonl'), mode=mode, progress=100000)
+				with measure(stages, f'csv_to_jsonl[{mode}][iloc]', count=min(len(bulk), legacy_rows), unit='rows', trace_memory=trace_memory) as entry:
+					legacy_csv_to_jsonl(legacy_path, os.path.join(work_dir, f'{mode}_iloc.jsonl'), mode=mode)
+				converter.csv_to_jsonl(rows_path, os.path.join(work_dir, f'{mode}_rows.jsonl'), mode=mode, progress=100000)
+				with open(os.path.join(work_dir, f'{mode}_rows.jsonl')) as file:
+					entry['identical'] = legacy_jsonl_lines(os.path.join(work_dir, f'{mode}_iloc.jsonl')) == file.read().splitlines()
+
+			with measure(stages, 'create_csv', count=len(transformed), unit='rows', trace_memory=trace_memory):
+				scraper.create_csv(transformed, os.path.join(work_dir, 'thelashop_products.csv'))
+	finally:
+		functions.restore()
+		os.chdir(cwd)
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+	return {
+		'meta': {
+			'created_at': datetime.now().isoformat(timespec='seconds'),
+			'corpus': corpus_dir,
+			'corpus_pages': len(products),
+			'scale': scale,
+			'workers': workers,
+			'python': platform.python_version(),
+			'machine': platform.machine(),
+			'trace_memory': trace_memory
+		},
+		'stages': stages,
+		'functions': {name: {'calls': stat['calls'], 'seconds': round(stat['seconds'], 4)} for name, stat in functions.stats.items()}
+	}
+
+
+def throughput(entry):
+	for key, value in entry.items():
+		if key.endswith('_per_sec'):
+			return key, value
+
+	return None, None
+
+
+def compare(results, baseline):
+	# Stages are compared on throughput so runs at different scales stay comparable
+	if results['meta'].get('scale') != baseline.get('meta', dict()).get('scale'):
+		print('Warning: baseline was recorded at a different scale')
+	print(f"{'stage':<28}{'metric':<18}{'baseline':>12}{'current':>12}{'speedup':>10}{'peak mb':>16}")
+	for stage, entry in results['stages'].items():
+		key, value = throughput(entry)
+		base = baseline.get('stages', dict()).get(stage, dict())
+		_, base_value = throughput(base)
+		peak = f"{base.get('peak_mb', '-')} -> {entry.get('peak_mb', '-')}"
+		if not value or not base_value:
+			print(f"{stage:<28}{'seconds':<18}{base.get('seconds', '-'):>12}{entry['seconds']:>12}{'-':>10}{peak:>16}")
+			continue
+		print(f"{stage:<28}{key:<18}{base_value:>12}{value:>12}{value / base_value:>9.2f}x{peak:>16}")
+
+
+def print_results(results):
+	for stage, entry in results['stages'].items():
+		print(f'{stage}: ' + ', '.join(f'{key}={value}' for key, value in entry.items()))
+	for name, stat in sorted(results['functions'].items(), key=lambda x: -x[1]['seconds']):
+		print(f"  {name}: {stat['calls']} calls, {stat['seconds']:.3f}s")
+
+
+def percentile(values, fraction):
+	if not values:
+		return None
+	values = sorted(values)
+
+	return values[min(len(values) - 1, max(0, math.ceil(len(values) * fraction) - 1))]
+
+
+def replay_pages(corpus_dir, scale=None, synthetic=None):
+	if synthetic:
+		return replay_server.synthetic_pages(synthetic)
+
+	return list(scale_pages(load_corpus(os.path.abspath(corpus_dir), 'products'), scale))
+
+
+@contextlib.contextmanager
+def replay_process(pages, config, port=None):
+	# Replay server in a separate process so it does not compete with the crawler for the GIL
+	if port is None:
+		with socket.socket() as sock:
+			sock.bind(('127.0.0.1', 0))
+			port = sock.getsockname()[1]
+	ready = multiprocessing.Event()
+	process = multiprocessing.Process(target=replay_server.run, args=(pages, config, '127.0.0.1', port, ready), daemon=True)
+	process.start()
+	try:
+		if not ready.wait(60):
+			raise RuntimeError('replay server did not start')
+		yield f'http://127.0.0.1:{port}'
+	finally:
+		process.terminate()
+		process.join()
+
+
+def load_test(pages, config, mode='crawl', concurrency=50, requests_per_second=500.0):
+	# Drive the crawler against the replay server and report throughput, per-attempt latency and retries
+	latencies = list()
+	statuses = dict()
+	policies = list()
+
+	# Subclasses record the requests and policies of this run only, the classes themselves are left alone
+	class TimedProxyPool(ProxyPool):
+		async def get(self, url, **kwargs):
+			start = time.perf_counter()
+			try:
+				response = await super().get(url, **kwargs)
+			except httpx.HTTPError as e:
+				statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+				raise
+			finally:
+				latencies.append(time.perf_counter() - start)
+			statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+			return response
+
+	class RecordingScraper(FTScraper):
+		def fetch_policy(self):
+			policy = super().fetch_policy()
+			policies.append(policy)
+
+			return policy
+
+		def proxy_pool(self):
+			return TimedProxyPool(load_proxies(self.proxies, self.proxy_file))
+
+	cwd = os.getcwd()
+	work_dir = tempfile.mkdtemp(prefix='thelashop-loadtest-')
+	with replay_process(pages, config) as base_url:
+		scraper = RecordingScraper(
+			base_url=base_url,
+			proxies=['direct'],
+			max_concurrency=concurrency,
+			initial_concurrency=concurrency,
+			requests_per_second=requests_per_second
+		)
+		database_name = os.path.join(work_dir, 'thelashop.db')
+		scraper_logger = logging.getLogger('scraper')
+		level = scraper_logger.level
+		scraper_logger.setLevel(logging.WARNING)
+		try:
+			os.chdir(work_dir)
+			start = time.perf_counter()
+			if mode == 'crawl':
+				asyncio.run(scraper.crawl_to_db(f'{base_url}/collections/all', database_name))
+			elif mode == 'sitemap':
+				asyncio.run(scraper.sitemap_crawl_to_db(f'{base_url}/sitemap.xml', database_name))
+			else:
+				urls = [f"{base_url}/products/{url.rstrip('/').rsplit('/', 1)[-1]}" for url, _ in pages]
+				asyncio.run(scraper.fetch_all_to_db(urls, database_name, 'product_src'))
+			seconds = time.perf_counter() - start
+		finally:
+			scraper_logger.setLevel(level)
+			os.chdir(cwd)
+		server_stats = httpx.get(f'{base_url}/__stats').json()
+
+	try:
+		conn = duckdb.connect(database_name, read_only=True)
+		stored = conn.execute("SELECT count(*) FROM product_src WHERE html IS NOT NULL").fetchone()[0]
+		conn.close()
+	finally:
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+	return {
+		'mode': mode,
+		'products': len(pages),
+		'stored': stored,
+		'seconds': round(seconds, 3),
+		'pages_per_sec': round(stored / seconds, 2) if seconds else None,
+		'requests': len(latencies),
+		'requests_per_sec': round(len(latencies) / seconds, 2) if seconds else None,
+		'latency_ms': {
+			name: round(percentile(latencies, fraction) * 1000, 1) if latencies else None
+			for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))
+		},
+		'retries': sum(policy.retries for policy in policies),
+		'statuses': statuses,
+		'server': server_stats,
+		'config': dataclasses.asdict(config)
+	}
+
+
+def print_load_test(report):
+	latency = report['latency_ms']
+	print(f"{report['mode']}: {report['stored']}/{report['products']} products in {report['seconds']}s, {report['pages_per_sec']} pages/sec")
+	print(f"requests: {report['requests']} ({report['requests_per_sec']}/sec), retries: {report['retries']}")
+	print('latency ms: ' + ', '.join(f'{name}={value}' for name, value in latency.items()))
+	print('responses: ' + ', '.join(f'{status}={count}' for status, count in sorted(report['statuses'].items())))
+	print('server: ' + ', '.join(f'{name}={count}' for name, count in sorted(report['server'].items())))
+
+
+def replay_config(args):
+	return replay_server.ReplayConfig(
+		latency=args.latency,
+		jitter=args.jitter,
+		rate_429=args.rate_429,
+		retry_after=args.retry_after,
+		rate_5xx=args.rate_5xx,
+		slow_body_rate=args.slow_body_rate,
+		slow_body_seconds=args.slow_body_seconds,
+		seed=args.seed
+	)
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark the scrape -> parse -> transform pipeline on a recorded corpus')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	record_parser = subparsers.add_parser('record', help='record stored pages from a crawl database into a corpus')
+	record_parser.add_argument('--database', default='thelashop.db')
+	record_parser.add_argument('--corpus', default='benchmarks/corpus')
+	record_parser.add_argument('--limit', type=int, default=None)
+
+	run_parser = subparsers.add_parser('run', help='run the benchmark against a recorded corpus')
+	run_parser.add_argument('--corpus', default='benchmarks/corpus')
+	run_parser.add_argument('--scale', type=int, default=None, help='synthetic number of product pages, e.g. 100000')
+	run_parser.add_argument('--workers', type=int, default=1)
+	run_parser.add_argument('--no-trace-memory', action='store_true', help='skip tracemalloc, which slows down Python code')
+	run_parser.add_argument('--output', default=None, help='write results as json')
+	run_parser.add_argument('--baseline', default=None, help='results json to compare against')
+
+	fault_parser = argparse.ArgumentParser(add_help=False)
+	fault_parser.add_argument('--corpus', default='benchmarks/corpus')
+	fault_parser.add_argument('--scale', type=int, default=None, help='serve this many product pages cycled from the corpus')
+	fault_parser.add_argument('--synthetic', type=int, default=None, help='serve this many generated pages instead of the corpus')
+	fault_parser.add_argument('--latency', type=float, default=0.05, help='median response latency in seconds')
+	fault_parser.add_argument('--jitter', type=float, default=0.5, help='lognormal sigma of the latency')
+	fault_parser.add_argument('--rate-429', type=float, default=0.0)
+	fault_parser.add_argument('--retry-after', type=float, default=1.0)
+	fault_parser.add_argument('--rate-5xx', type=float, default=0.0)
+	fault_parser.add_argument('--slow-body-rate', type=float, default=0.0)
+	fault_parser.add_argument('--slow-body-seconds', type=float, default=2.0)
+	fault_parser.add_argument('--seed', type=int, default=None)
+
+	serve_parser = subparsers.add_parser('serve', parents=[fault_parser], help='serve the corpus as a local stand-in for the shop')
+	serve_parser.add_argument('--port', type=int, default=8765)
+
+	load_parser = subparsers.add_parser('loadtest', parents=[fault_parser], help='crawl the replay server and report throughput, latency and retries')
+	load_parser.add_argument('--mode', choices=['crawl', 'sitemap', 'fetch_all'], default='crawl')
+	load_parser.add_argument('--concurrency', type=int, default=50)
+	load_parser.add_argument('--rps', type=float, default=500.0, help='requests per second allowed by the fetch policy')
+	load_parser.add_argument('--output', default=None, help='write the report as json')
+
+	args = parser.parse_args()
+	if args.command == 'record':
+		record_corpus(args.database, args.corpus, limit=args.limit)
+	elif args.command == 'serve':
+		replay_server.run(replay_pages(args.corpus, args.scale, args.synthetic), replay_config(args), port=args.port)
+	elif args.command == 'loadtest':
+		pages = replay_pages(args.corpus, args.scale, args.synthetic)
+		report = load_test(pages, replay_config(args), mode=args.mode, concurrency=args.concurrency, requests_per_second=args.rps)
+		print_load_test(report)
+		if args.output:
+			with open(args.output, 'w') as file:
+				json.dump(report, file, indent=2)
+	else:
+		results = run_benchmark(args.corpus, scale=args.scale, workers=args.workers, trace_memory=not args.no_trace_memory)
+		print_results(results)
+		if args.output:
+			with open(args.output, 'w') as file:
+				json.dump(results, file, indent=2)
+		if args.baseline:
+			with open(args.baseline, 'r') as file:
+				compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+	main()
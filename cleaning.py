@@ -0,0 +1,85 @@
+import re
+import pandas as pd
+
+# Text cleaning shared by scraper.py, converter.py and data_transformation.ipynb. Patterns are
+# compiled once at import; every cleaner has a scalar form for single values and a *_series
+# form that runs the same patterns over a whole column without a per-row .apply lambda.
+
+DATA_ATTRIBUTE_PATTERN = re.compile(r'\sdata-[\w-]+="[^"]*"')
+BETWEEN_TAGS_PATTERN = re.compile(r'>\s+<')
+SPAN_GAP_PATTERN = re.compile(r'(<span[^>]*>)\s*(<)')
+NEWLINE_PATTERN = re.compile(r'\s*\n\s*')
+HANDLE_WORD_PATTERN = re.compile(r'\b[a-zA-Z0-9]+\b')
+# clean_text_2 used to run \byescomusa\b and \bthelashop\b before \w*yescom\w* and \w*lashop\w*;
+# the whole-word pass is covered by the second one, so a single pattern gives the same text
+BRAND_TEXT_PATTERN = re.compile(r'\w*(?:yescom|lashop)\w*', re.IGNORECASE)
+BRAND_HANDLE_PATTERN = re.compile(r'yescomusa|yescom|thelashop', re.IGNORECASE)
+
+
+def clean_html(html_content):
+	# 1. Remove non-standard attributes that Shopify may not recognize
+	cleaned_html = DATA_ATTRIBUTE_PATTERN.sub('', html_content)
+
+	# 2. Encode quotes and apostrophes. html.escape followed by decoding &lt;, &gt; and &amp;
+	# again, as this used to do, only leaves these two encoded
+	cleaned_html = cleaned_html.replace('"', '&quot;').replace("'", '&#x27;')
+
+	# 3. Remove excessive whitespace between tags
+	cleaned_html = BETWEEN_TAGS_PATTERN.sub('><', cleaned_html)
+
+	# 4. Ensure spaces between inline elements where necessary
+	cleaned_html = SPAN_GAP_PATTERN.sub(r'\1 <', cleaned_html)
+
+	# 5. Remove excess spaces and newlines in text nodes
+	return NEWLINE_PATTERN.sub('', cleaned_html)
+
+
+def clean_html_series(html_contents):
+	# One pass per fragment: chaining five .str calls copies the column five times and is
+	# slower than the scalar cleaner for fragments this size
+	return html_contents.map(clean_html, na_action='ignore')
+
+
+def to_handle(title, alt_title):
+	if (pd.isna(title)) | (title == 0):
+		if pd.isna(alt_title):
+			return None
+		title = alt_title
+
+	return '-'.join(HANDLE_WORD_PATTERN.findall(title.lower().strip()))
+
+
+def to_handle_series(titles, alt_titles):
+	missing = titles.isna() | (titles == 0)
+	source = titles.where(~missing, alt_titles)
+	handles = source.str.lower().str.strip().str.findall(HANDLE_WORD_PATTERN).str.join('-')
+
+	return handles.astype(object).where(source.notna(), None)
+
+
+def clean_text_2(text):
+	if pd.isna(text):
+		return text
+	text = BRAND_TEXT_PATTERN.sub('Trendtimes', str(text)).strip()
+
+	return text if text else pd.NA
+
+
+def clean_text_2_series(texts):
+	present = texts.notna()
+	cleaned = texts[present].astype(str).str.replace(BRAND_TEXT_PATTERN, 'Trendtimes', regex=True).str.strip()
+	result = texts.astype(object).copy()
+	result[present] = cleaned.where(cleaned != '', pd.NA)
+
+	return result
+
+
+def clean_handle(text):
+	if pd.isna(text):
+		return text
+
+	return BRAND_HANDLE_PATTERN.sub('trendtimes', text)
+
+
+def clean_handle_series(texts):
+	return texts.str.replace(BRAND_HANDLE_PATTERN, 'trendtimes', regex=True)
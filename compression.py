@@ -0,0 +1,86 @@
+from dataclasses import dataclass, field
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# Page bodies can be stored as zstd frames. Every frame starts with the zstd magic number, which
+# never starts an HTML or JSON body, so compressed and plain rows can share one BLOB column and
+# are told apart on read. Frames carry the id of the dictionary they were compressed with.
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def is_compressed(blob):
+	return blob[:4] == ZSTD_MAGIC
+
+
+def require_zstandard():
+	if zstandard is None:
+		raise RuntimeError('zstd page compression needs the zstandard package: pip install zstandard')
+
+
+def train_dictionary(samples, dict_size=112640):
+	# Pages share one template, a dictionary trained on a sample of them lets every frame
+	# reference it instead of repeating it. Returns (dict_id, dictionary bytes)
+	require_zstandard()
+	dictionary = zstandard.train_dictionary(dict_size, list(samples))
+
+	return dictionary.dict_id(), dictionary.as_bytes()
+
+
+@dataclass
+class PageCodec:
+	level: int = 3
+	# dict_id -> dictionary bytes, every stored dictionary can be read back
+	dictionaries: dict = field(default_factory=dict)
+	# Dictionary new frames are compressed with, None compresses without one
+	dict_id: int | None = None
+	_compressor: object = field(default=None, init=False, repr=False, compare=False)
+	_decompressors: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+	def __getstate__(self):
+		# zstandard contexts cannot be pickled, process pool workers rebuild them on first use
+		state = self.__dict__.copy()
+		state['_compressor'] = None
+		state['_decompressors'] = dict()
+
+		return state
+
+	def add_dictionary(self, dict_id, dictionary):
+		self.dictionaries[dict_id] = dictionary
+		self.dict_id = dict_id
+		self._compressor = None
+
+	def compression_dict(self, dict_id):
+		if not dict_id:
+			return None
+
+		return zstandard.ZstdCompressionDict(self.dictionaries[dict_id])
+
+	def compress(self, html):
+		require_zstandard()
+		if self._compressor is None:
+			dictionary = self.compression_dict(self.dict_id)
+			self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary, write_content_size=True)
+
+		return self._compressor.compress(html)
+
+	def frame_dict_id(self, blob):
+		require_zstandard()
+
+		return zstandard.get_frame_parameters(blob).dict_id
+
+	def decompress(self, blob):
+		# Plain rows are returned as they are, so tables can be migrated one batch at a time
+		if (blob is None) or (not is_compressed(blob)):
+			return blob
+		dict_id = self.frame_dict_id(blob)
+		decompressor = self._decompressors.get(dict_id)
+		if decompressor is None:
+			if dict_id and (dict_id not in self.dictionaries):
+				raise KeyError(f'zstd dictionary {dict_id} is not stored in page_dictionaries')
+			decompressor = zstandard.ZstdDecompressor(dict_data=self.compression_dict(dict_id))
+			self._decompressors[dict_id] = decompressor
+
+		return decompressor.decompress(blob)
@@ -1,31 +1,19 @@
 import os
+import numpy as np
 import pandas as pd
-import re
 import json
-from urllib.parse import quote, unquote
 from ast import literal_eval
+from urllib.parse import quote, unquote
 from html import unescape
+import cleaning
+from frames import iter_frames, load_frame, save_frame
 
 weight_unit_mapper = {'lb': 'POUNDS', 'kg': 'KILOGRAMS', 'g': 'GRAMS', 'oz': 'OUNCES'}
 tracker_mapper = {'shopify': True, '': False}
 
 
 def to_handle(title, alt_title):
-    if (pd.isna(title)) | (title == 0):
-        if pd.isna(alt_title):
-            result = None
-        else:
-            alt_title.replace('-', '')
-            pattern = re.compile(r"\b[a-zA-Z0-9]+\b")
-            matches = pattern.findall(alt_title.lower().strip())
-            result = '-'.join(matches)
-    else:
-        title.replace('-', '')
-        pattern = re.compile(r"\b[a-zA-Z0-9]+\b")
-        matches = pattern.findall(title.lower().strip())
-        result = '-'.join(matches)
-
-    return result
+    return cleaning.to_handle(title, alt_title)
 
 
 def get_title(title, alt_title):
@@ -96,7 +84,7 @@ def to_body_html(desc):
 def to_shopify(morris_file_path):
     morris_df = pd.read_excel(morris_file_path)
     shopify_df = pd.DataFrame()
-    shopify_df['Handle'] = morris_df.apply(lambda x: to_handle(x['ProductName'], alt_title=x['FormattedName']), axis=1)
+    shopify_df['Handle'] = cleaning.to_handle_series(morris_df['ProductName'], morris_df['FormattedName'])
     shopify_df['Title'] = morris_df.apply(lambda x: get_title(x['FormattedName'], alt_title=x['ProductName']), axis=1)
     shopify_df['Body (HTML)'] = morris_df['FullDescription'].apply(to_body_html)
     shopify_df['Vendor'] = morris_df['Brand']
@@ -167,7 +155,7 @@ def to_shopify(morris_file_path):
     shopify_df.fillna('', inplace=True)
     shopify_df = deduplicate_handles(shopify_df)
 
-    shopify_df.to_csv('data/temp.csv', index=False)
+    save_frame(shopify_df, 'data/temp.parquet')
 
 
 def fill_opt(opt_name=None, opt_value=None):
@@ -197,14 +185,15 @@ def fill_media(original_src, alt):
 
 def fill_variant_id(shopify_df, product_id_filepath, mode):
     # Fill variant id
-    variant_ids_df = pd.read_csv(product_id_filepath)
+    variant_ids_df = load_frame(product_id_filepath)
     shopify_df = pd.merge(shopify_df, variant_ids_df, how='left', left_on='id', right_on='product_id')
     shopify_df.fillna('', inplace=True)
-    shopify_df.drop(columns=['Unnamed: 0', 'handle', 'product_id'], inplace=True)
+    # 'Unnamed: 0' is the index column of a variant id csv
+    shopify_df.drop(columns=['Unnamed: 0', 'handle', 'product_id'], inplace=True, errors='ignore')
     if mode == 'create':
-        shopify_df.to_csv('data/create_product_variants_with_vids_invids.csv', index=False)
+        save_frame(shopify_df, 'data/create_product_variants_with_vids_invids.parquet')
     elif mode == 'update':
-        shopify_df.to_csv('data/update_product_variants_with_vids_invids.csv', index=False)
+        save_frame(shopify_df, 'data/update_product_variants_with_vids_invids.parquet')
     else:
         print('Mode is undefined')
 
@@ -224,13 +213,13 @@ def str_to_bool(s):
 
 
 def get_skus():
-    shopify_df = pd.read_csv('data/temp.csv')
+    shopify_df = load_frame('data/temp.parquet', columns=['Variant SKU'])
 
     return list(shopify_df['Variant SKU'])
 
 
 def get_handles(filepath, nrows=250):
-    shopify_df = pd.read_csv(filepath)
+    shopify_df = load_frame(filepath)
     try:
         handles = list(shopify_df['Unique Handle'])
     except Exception:
@@ -243,9 +232,9 @@ def get_handles(filepath, nrows=250):
 def chunk_data(filepath, usecols=None, nrows=250):
     chunked_df = list()
     if usecols:
-        df = pd.read_csv(filepath, usecols=usecols)
+        df = load_frame(filepath, columns=usecols)
     else:
-        df = pd.read_csv(filepath)
+        df = load_frame(filepath)
     for start in range(0, len(df), nrows):
         chunked_df.append(df[start:start + nrows])
 
@@ -254,353 +243,315 @@ def chunk_data(filepath, usecols=None, nrows=250):
 
 def group_create_update():
     # Fill product id
-    shopify_df = pd.read_csv('data/temp.csv')
-    product_ids_df = pd.read_csv('data/product_ids.csv')
+    shopify_df = load_frame('data/temp.parquet')
+    product_ids_df = load_frame('data/product_ids.csv')
     shopify_df = pd.merge(shopify_df, product_ids_df, how='left', left_on='Unique Handle', right_on='handle')
     shopify_df.fillna('', inplace=True)
 
     # group update create
     create_df = shopify_df[shopify_df['id'] == '']
     update_df = shopify_df[shopify_df['id'] != '']
-    create_df.to_csv('data/create_products.csv')
-    update_df.to_csv('data/update_products.csv')
+    save_frame(create_df, 'data/create_products.parquet')
+    save_frame(update_df, 'data/update_products.parquet')
 
 
 def fill_product_id(product_df, product_id_filepath, mode):
     # Fill product id
     shopify_df = product_df
-    product_ids_df = pd.read_csv(product_id_filepath)
+    product_ids_df = load_frame(product_id_filepath)
     shopify_df = pd.merge(shopify_df, product_ids_df, how='left', left_on='Unique Handle', right_on='handle')
     shopify_df.fillna('', inplace=True)
     shopify_df.drop(columns=['handle_x', 'id_x', 'handle_y'], inplace=True)
     shopify_df.rename({'id_y': 'id'}, axis=1, inplace=True)
     if mode == 'create':
-        shopify_df.to_csv('data/create_products_with_id.csv', index=False)
+        save_frame(shopify_df, 'data/create_products_with_id.parquet')
     elif mode == 'update':
-        shopify_df.to_csv('data/update_products_with_id.csv', index=False)
+        save_frame(shopify_df, 'data/update_products_with_id.parquet')
     else:
         print('Mode is undefined')
 
 
-def csv_to_jsonl(csv_filename, jsonl_filename, mode='pc'):
-    print("Converting csv to jsonl file...")
-    df = pd.read_csv(csv_filename)
-    df.fillna('', inplace=True)
-    datas = None
-    opts = ['Option1 Name', 'Option2 Name', 'Option3 Name']
-    if mode == 'vc':
-        # Create formatted dictionary
-        datas = []
-        for index in df.index:
-            data_dict = {"productId": str, "strategy": "REMOVE_STANDALONE_VARIANT", "variants": list()}
-            data_dict['productId'] = df.iloc[index]['id']
-
-            variants = list()
-            metafields = list()
-            variant = dict()
-            variant['barcode'] = str(df.iloc[index]['Variant Barcode'])
-            if df.iloc[index]['Variant Compare At Price'] == '':
-                pass
-            else:
-                variant['compareAtPrice'] = round(float(df.iloc[index]['Variant Compare At Price']), 2)
-            # variant['id'] = df.iloc[index]['id']
-
-            variant_inv_item = dict()
-            variant_inv_item['cost'] = str(df.iloc[index]['Cost per item'])
-            # variant_inv_item['countryCodeOfOrigin'] = df.iloc[index]['Variant Barcode']
-            # variant_inv_item['countryHarmonizedSystemCodes'] = df.iloc[index]['Variant Barcode']
-            # variant_inv_item['harmonizedSystemCode'] = df.iloc[index]['Variant Barcode']
-
-            variant_measure = {'weight': {'unit': 'GRAMS', 'value': 0.0}}
-            try:
-                variant_measure['weight']['unit'] = weight_unit_mapper[df.iloc[index]['Variant Weight Unit']]
-                variant_measure['weight']['value'] = float(df.iloc[index]['Variant Grams'])
-            except:
-                pass
-
-            variant_inv_item['measurement'] = variant_measure
-            # variant_inv_item['provinceCodeOfOrigin'] = df.iloc[index]['Variant Barcode']
-            # variant_inv_item['requiresShipping'] = df.iloc[index]['Variant Requires Shipping']
-            variant_inv_item['requiresShipping'] = str_to_bool('true')
-            variant_inv_item['sku'] = df.iloc[index]['Variant SKU']
-            variant_inv_item['tracked'] = tracker_mapper[df.iloc[index]['Variant Inventory Tracker']]
-            variant['inventoryItem'] = variant_inv_item
-            variant['inventoryPolicy'] = df.iloc[index]['Variant Inventory Policy'].upper()
-
-            variants_inv_qty = list()
-            if df.iloc[index]['Variant Inventory Qty'] == '':
-                variant_inv_qty = {'availableQuantity': 0, 'locationId': os.getenv('SHOPIFY_LOCATION_ID')}
-            else:
-                variant_inv_qty = {'availableQuantity': 0, 'locationId': os.getenv('SHOPIFY_LOCATION_ID')}
-                try:
-                    variant_inv_qty['availableQuantity'] = int(df.iloc[index]['Variant Inventory Qty'])
-                except ValueError:
-                    variant_inv_qty['availableQuantity'] = int(df.iloc[index]['Variant Inventory Qty'].replace(',', ''))
-                variant_inv_qty['locationId'] = os.getenv('SHOPIFY_LOCATION_ID')
-
-            variants_inv_qty.append(variant_inv_qty)
-            variant['inventoryQuantities'] = variants_inv_qty
-
-            # variant['mediaId'] = df.iloc[index]['Variant Barcode']
-            # variant['mediaSrc'] = df.iloc[index]['Variant Barcode']
-
-            # metafield = dict()
-            # metafield['id'] = df.iloc[index]['Variant Barcode']
-            # metafield['key'] = 'custom'
-            # metafield['namespace'] = 'enable_best_price'
-            # metafield['type'] = 'boolean'
-            # metafield['value'] = str(df.iloc[index]['enable_best_price (product.metafields.custom.enable_best_price)'])
-            # metafields.append(metafield)
-
-            # variant['metafields'] = metafields
-
-            product_options = [fill_opt_var(df.iloc[index][opt], df.iloc[index][opt.replace('Name', 'Value')]) for opt in opts]
-
-            if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
-                product_options = [x for x in product_options if x is not None]
-                variant['optionValues'] = product_options
+jsonl_options = ['Option1 Name', 'Option2 Name', 'Option3 Name']
+jsonl_option_columns = [column for opt in jsonl_options for column in (opt, opt.replace('Name', 'Value'))]
+publication_ids = ['gid://shopify/Publication/131749707833', 'gid://shopify/Publication/131749773369', 'gid://shopify/Publication/131749838905', 'gid://shopify/Publication/132635131961']
 
-            try:
-                variant['price'] = round(float(df.iloc[index]['Variant Price']), 2)
-            except:
-                variant['price'] = 0.00
-
-            # variant['taxCode'] = df.iloc[index]['Variant Barcode']
-            # variant['taxable'] = df.iloc[index]['Variant Taxable']
-            variant['taxable'] = str_to_bool('true')
-            variants.append(variant)
-
-            data_dict['variants'] = variants
-            datas.append(data_dict.copy())
-
-    elif mode == 'pc':
-        # Create formatted dictionary
-        datas = []
-        for index in df.index:
-            data_dict = {"input": dict(), "media": list()}
-            # data_dict['input']['category'] = ''
-            # data_dict['input']['claimOwnership'] = {'bundles': str_to_bool('False')}
-            # data_dict['input']['collectionToJoin'] = ''
-            # data_dict['input']['collectionToLeave'] = ''
-            # data_dict['input']['combinedListingRole'] = 'PARENT'
-            data_dict['input']['customProductType'] = df.iloc[index]['Type']
-            data_dict['input']['descriptionHtml'] = df.iloc[index]['Body (HTML)']
-            data_dict['input']['giftCard'] = str_to_bool('False') #df.iloc[index]['Gift Card']
-            # data_dict['input']['giftCardTemplateSuffix'] = ''
-            data_dict['input']['handle'] = df.iloc[index]['Unique Handle']
-            # data_dict['input']['id'] = ''
-            data_dict['input']['metafields'] = {#'id': '',
-                                                'key': 'enable_best_price',
-                                                'namespace': 'custom',
-                                                'type': 'boolean',
-                                                'value': str_to_bool(df.iloc[index]['enable_best_price (product.metafields.custom.enable_best_price)'])
-                                                }
-            product_options = [fill_opt(df.iloc[index][opt], df.iloc[index][opt.replace('Name', 'Value')]) for opt in opts]
-
-            if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
-                product_options = [x for x in product_options if x is not None]
-                data_dict['input']['productOptions'] = product_options
-
-            # data_dict['input']['productType'] = df.iloc[index]['Type']
-            data_dict['input']['redirectNewHandle'] = str_to_bool('True')
-            data_dict['input']['requiresSellingPlan'] = str_to_bool('False')
-            data_dict['input']['seo'] = {'description': df.iloc[index]['SEO Description'],
-                                         'title': df.iloc[index]['SEO Title']
-                                         }
-            data_dict['input']['status'] = df.iloc[index]['Status'].upper()
-            data_dict['input']['tags'] = df.iloc[index]['Tags']
-            # data_dict['input']['templateSuffix'] = ''
-            data_dict['input']['title'] = df.iloc[index]['Title']
-            data_dict['input']['vendor'] = df.iloc[index]['Vendor']
-
-            media_list = []
-            media = dict()
-            if (pd.isna(df.iloc[index]['Link'])) | (df.iloc[index]['Link'] == ''):
-                media_list.append(media)
-            else:
-                try:
-                    links = literal_eval(df.iloc[index]['Link'])
-                    alt_texts = literal_eval(df.iloc[index]['Image Alt Text'])
-                    print(links)
-                    for i in range(0, len(links)):
-                        try:
-                            media['alt'] = alt_texts[i]
-                        except:
-                            media['alt'] = ''
-                        media['mediaContentType'] = 'IMAGE'
-                        media['originalSource'] = links[i]
-                        media_list.append(media)
-                    data_dict['media'] = media_list
-                except Exception:
-                    pass
-
-            datas.append(data_dict.copy())
-
-    elif mode == 'pu':
-        datas = []
-        for index in df.index:
-            data_dict = {"input": dict(), "media": list()}
-            # data_dict['input']['category'] = ''
-            # data_dict['input']['claimOwnership'] = {'bundles': str_to_bool('False')}
-            # data_dict['input']['collectionToJoin'] = ''
-            # data_dict['input']['collectionToLeave'] = ''
-            # data_dict['input']['combinedListingRole'] = 'PARENT'
-            data_dict['input']['customProductType'] = df.iloc[index]['Type']
-            data_dict['input']['descriptionHtml'] = df.iloc[index]['Body (HTML)']
-            data_dict['input']['giftCard'] = str_to_bool('False') #df.iloc[index]['Gift Card']
-            # data_dict['input']['giftCardTemplateSuffix'] = ''
-            # data_dict['input']['handle'] = df.iloc[index]['Unique Handle']
-            data_dict['input']['id'] = df.iloc[index]['id']
-            # data_dict['input']['metafields'] = {'id': df.iloc[index]['metafield_id'],
-            #                                     'value': str_to_bool(df.iloc[index]['enable_best_price (product.metafields.custom.enable_best_price)'])
-            #                                     }
-            # product_options = [fill_opt(df.iloc[index][opt], df.iloc[index][opt.replace('Name', 'Value')]) for opt in opts]
-
-            # if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
-            #     product_options = [x for x in product_options if x is not None]
-            #     data_dict['input']['productOptions'] = product_options
-
-            # data_dict['input']['productType'] = df.iloc[index]['Type']
-            data_dict['input']['redirectNewHandle'] = str_to_bool('True')
-            data_dict['input']['requiresSellingPlan'] = str_to_bool('False')
-            data_dict['input']['seo'] = {'description': df.iloc[index]['SEO Description'],
-                                         'title': df.iloc[index]['SEO Title']
-                                         }
-            data_dict['input']['status'] = df.iloc[index]['Status'].upper()
-            data_dict['input']['tags'] = df.iloc[index]['Tags']
-            # data_dict['input']['templateSuffix'] = ''
-            data_dict['input']['title'] = df.iloc[index]['Title']
-            data_dict['input']['vendor'] = df.iloc[index]['Vendor']
-
-            media_list = []
-            media = dict()
-            if (pd.isna(df.iloc[index]['Link'])) | (df.iloc[index]['Link'] == ''):
-                media_list.append(media)
-            else:
-
-                links = literal_eval(df.iloc[index]['Link'])
-                alt_texts = literal_eval(df.iloc[index]['Image Alt Text'])
-                print(links)
-                for i in range(0, len(links)):
-                    try:
-                        media['alt'] = alt_texts[i]
-                    except:
-                        media['alt'] = ''
-                    media['mediaContentType'] = 'IMAGE'
-                    media['originalSource'] = links[i]
-                    media_list.append(media)
-                data_dict['media'] = media_list
-
-            datas.append(data_dict.copy())
-
-    elif mode == 'vup':
-        datas = []
-        for index in df.index:
-            data_dict = {"allowPartialUpdates": False, "productId": '', "variants": list()}
-            data_dict['productId'] = df.iloc[index]['id']
-
-            variants = list()
-            variant = dict()
-            variant['id'] = df.iloc[index]['variant_id']
-            variant['barcode'] = str(df.iloc[index]['Variant Barcode'])
-            if df.iloc[index]['Variant Compare At Price'] == '':
-                pass
-            else:
-                variant['compareAtPrice'] = round(float(df.iloc[index]['Variant Compare At Price']), 2)
-
-            variant_measure = {'weight': {'unit': 'GRAMS', 'value': 0.0}}
-            try:
-                variant_measure['weight']['unit'] = weight_unit_mapper[df.iloc[index]['Variant Weight Unit']]
-                variant_measure['weight']['value'] = float(df.iloc[index]['Variant Grams'])
-            except:
-                pass
-
-            variant['inventoryPolicy'] = df.iloc[index]['Variant Inventory Policy'].upper()
-
-            var_inv_item = dict()
-            var_inv_item['cost'] = str(df.iloc[index]['Cost per item'])
-            var_inv_item['tracked'] = True
-            var_inv_item['measurement'] = variant_measure
-            var_inv_item['requiresShipping'] = str_to_bool('true')
-            var_inv_item['sku'] = df.iloc[index]['Variant SKU']
-            var_inv_item['tracked'] = tracker_mapper[df.iloc[index]['Variant Inventory Tracker']]
-            variant['inventoryItem'] = var_inv_item
-
-            product_options = [fill_opt_var(df.iloc[index][opt], df.iloc[index][opt.replace('Name', 'Value')]) for opt in opts]
-            if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
-                product_options = [x for x in product_options if x is not None]
-                variant['optionValues'] = product_options
 
-            try:
-                variant['price'] = round(float(df.iloc[index]['Variant Price']), 2)
-            except:
-                variant['price'] = 0.00
-
-            variant['taxable'] = str_to_bool('true')
-            variants.append(variant)
-            data_dict['variants'] = variants
-            datas.append(data_dict.copy())
-
-    elif mode == 'ap':
-        datas = []
-        for index in df.index:
-            print(df.iloc[index])
-            data_dict = {"input": dict(), "media": list()}
-            data_dict['input']['id'] = df.iloc[index]['id']
-            data_dict['input']['status'] = 'ACTIVE'
-            datas.append(data_dict.copy())
-
-    elif mode == 'pp':
-        datas = []
-        for index in df.index:
-            data_dict = {"id": '', "input": list()}
-            data_dict['id'] = df.iloc[index]['id']
-            publication_ids = ['gid://shopify/Publication/131749707833', 'gid://shopify/Publication/131749773369', 'gid://shopify/Publication/131749838905', 'gid://shopify/Publication/132635131961']
-            publication_inputs = list()
-            publication_input = dict()
-            for publication_id in publication_ids:
-                publication_input['publicationId'] = publication_id
-                # publication_input['publishDate'] = None
-                publication_inputs.append(publication_input.copy())
-            data_dict['input'] = publication_inputs
-
-            datas.append(data_dict.copy())
+def column_values(series):
+    # The values of a column the way df.iloc[index][column] hands them out: numpy scalars from a numpy column,
+    # which json.dump(default=str) writes as strings ("1000" for an int64 sku), where tolist() would make
+    # python ones. Extension arrays give what indexing them gives
+    if isinstance(series.dtype, np.dtype):
+        return list(series.to_numpy())
+    values = series.array
 
-    else:
-        print('Mode value is not available')
+    return [values[i] for i in range(len(values))]
 
-    print(datas)
 
-    if datas:
-        with open(jsonl_filename, 'w') as jsonlfile:
-            for item in datas:
-                json.dump(item, jsonlfile, default=str)
-                jsonlfile.write('\n')
+def frame_rows(df, columns):
+    # One dict per row read from the column values, a df.iloc[index] per field builds the whole row every time
+    for values in zip(*[column_values(df[column]) for column in columns]):
+        yield dict(zip(columns, values))
+
+
+def list_cell(value):
+    # List columns read from a csv hold the repr of the list, revived like the converter did before Parquet
+    if isinstance(value, str) and value.startswith('['):
+        return literal_eval(value)
+
+    return value
+
+
+def fill_media_list(links, alt_texts):
+    media_list = []
+    media = dict()
+    for i in range(0, len(links)):
+        try:
+            media['alt'] = alt_texts[i]
+        except:
+            media['alt'] = ''
+        media['mediaContentType'] = 'IMAGE'
+        media['originalSource'] = links[i]
+        media_list.append(media)
+
+    return media_list
+
+
+def variant_weight(row):
+    variant_measure = {'weight': {'unit': 'GRAMS', 'value': 0.0}}
+    try:
+        variant_measure['weight']['unit'] = weight_unit_mapper[row['Variant Weight Unit']]
+        variant_measure['weight']['value'] = float(row['Variant Grams'])
+    except:
+        pass
+
+    return variant_measure
+
+
+def variant_price(row):
+    try:
+        return round(float(row['Variant Price']), 2)
+    except:
+        return 0.00
+
+
+def variant_create_jsonl(row):
+    data_dict = {"productId": row['id'], "strategy": "REMOVE_STANDALONE_VARIANT", "variants": list()}
+    variant = dict()
+    variant['barcode'] = str(row['Variant Barcode'])
+    if row['Variant Compare At Price'] != '':
+        variant['compareAtPrice'] = round(float(row['Variant Compare At Price']), 2)
+
+    variant_inv_item = dict()
+    variant_inv_item['cost'] = str(row['Cost per item'])
+    variant_inv_item['measurement'] = variant_weight(row)
+    variant_inv_item['requiresShipping'] = str_to_bool('true')
+    variant_inv_item['sku'] = row['Variant SKU']
+    variant_inv_item['tracked'] = tracker_mapper[row['Variant Inventory Tracker']]
+    variant['inventoryItem'] = variant_inv_item
+    variant['inventoryPolicy'] = row['Variant Inventory Policy'].upper()
+
+    variant_inv_qty = {'availableQuantity': 0, 'locationId': os.getenv('SHOPIFY_LOCATION_ID')}
+    if row['Variant Inventory Qty'] != '':
+        try:
+            variant_inv_qty['availableQuantity'] = int(row['Variant Inventory Qty'])
+        except ValueError:
+            variant_inv_qty['availableQuantity'] = int(row['Variant Inventory Qty'].replace(',', ''))
+    variant['inventoryQuantities'] = [variant_inv_qty]
+
+    product_options = [fill_opt_var(row[opt], row[opt.replace('Name', 'Value')]) for opt in jsonl_options]
+    if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
+        variant['optionValues'] = [x for x in product_options if x is not None]
+
+    variant['price'] = variant_price(row)
+    variant['taxable'] = str_to_bool('true')
+    data_dict['variants'] = [variant]
+
+    return data_dict
+
+
+def product_input(row):
+    # The input fields product create and product update share, in the order both write them
+    return {
+        'customProductType': row['Type'],
+        'descriptionHtml': row['Body (HTML)'],
+        'giftCard': str_to_bool('False')
+    }
+
+
+def product_details(data_dict, row):
+    data_dict['input']['redirectNewHandle'] = str_to_bool('True')
+    data_dict['input']['requiresSellingPlan'] = str_to_bool('False')
+    data_dict['input']['seo'] = {'description': row['SEO Description'], 'title': row['SEO Title']}
+    data_dict['input']['status'] = row['Status'].upper()
+    data_dict['input']['tags'] = row['Tags']
+    data_dict['input']['title'] = row['Title']
+    data_dict['input']['vendor'] = row['Vendor']
+    # Link and Image Alt Text are list columns, '' where the product has no images
+    links = list_cell(row['Link'])
+    if isinstance(links, list):
+        data_dict['media'] = fill_media_list(links, list_cell(row['Image Alt Text']))
+
+    return data_dict
+
+
+def product_create_jsonl(row):
+    data_dict = {"input": product_input(row), "media": list()}
+    data_dict['input']['handle'] = row['Unique Handle']
+    data_dict['input']['metafields'] = {
+        'key': 'enable_best_price',
+        'namespace': 'custom',
+        'type': 'boolean',
+        # MetafieldInput.value is a String, "True" / "False" as str() of the numpy bool always wrote it
+        'value': str(str_to_bool(row['enable_best_price (product.metafields.custom.enable_best_price)']))
+    }
+    product_options = [fill_opt(row[opt], row[opt.replace('Name', 'Value')]) for opt in jsonl_options]
+    if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
+        data_dict['input']['productOptions'] = [x for x in product_options if x is not None]
+
+    return product_details(data_dict, row)
+
+
+def product_update_jsonl(row):
+    data_dict = {"input": product_input(row), "media": list()}
+    data_dict['input']['id'] = row['id']
+
+    return product_details(data_dict, row)
+
+
+def variant_update_jsonl(row):
+    data_dict = {"allowPartialUpdates": False, "productId": row['id'], "variants": list()}
+    variant = dict()
+    variant['id'] = row['variant_id']
+    variant['barcode'] = str(row['Variant Barcode'])
+    if row['Variant Compare At Price'] != '':
+        variant['compareAtPrice'] = round(float(row['Variant Compare At Price']), 2)
+    variant['inventoryPolicy'] = row['Variant Inventory Policy'].upper()
+
+    var_inv_item = dict()
+    var_inv_item['cost'] = str(row['Cost per item'])
+    var_inv_item['tracked'] = True
+    var_inv_item['measurement'] = variant_weight(row)
+    var_inv_item['requiresShipping'] = str_to_bool('true')
+    var_inv_item['sku'] = row['Variant SKU']
+    var_inv_item['tracked'] = tracker_mapper[row['Variant Inventory Tracker']]
+    variant['inventoryItem'] = var_inv_item
+
+    product_options = [fill_opt_var(row[opt], row[opt.replace('Name', 'Value')]) for opt in jsonl_options]
+    if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
+        variant['optionValues'] = [x for x in product_options if x is not None]
+
+    variant['price'] = variant_price(row)
+    variant['taxable'] = str_to_bool('true')
+    data_dict['variants'] = [variant]
+
+    return data_dict
+
+
+def activate_product_jsonl(row):
+    return {"input": {'id': row['id'], 'status': 'ACTIVE'}, "media": list()}
+
+
+def publish_product_jsonl(row):
+    return {"id": row['id'], "input": [{'publicationId': publication_id} for publication_id in publication_ids]}
+
+
+variant_columns = [
+    'id', 'Variant Barcode', 'Variant Compare At Price', 'Cost per item', 'Variant Weight Unit', 'Variant Grams',
+    'Variant SKU', 'Variant Inventory Tracker', 'Variant Inventory Policy', 'Variant Price', *jsonl_option_columns
+]
+product_columns = [
+    'Type', 'Body (HTML)', 'SEO Description', 'SEO Title', 'Status', 'Tags', 'Title', 'Vendor', 'Link', 'Image Alt Text'
+]
+# mode -> (columns the builder reads, builder of one jsonl line from one row)
+jsonl_builders = {
+    'vc': ([*variant_columns, 'Variant Inventory Qty'], variant_create_jsonl),
+    'pc': ([*product_columns, 'Unique Handle', 'enable_best_price (product.metafields.custom.enable_best_price)', *jsonl_option_columns], product_create_jsonl),
+    'pu': ([*product_columns, 'id'], product_update_jsonl),
+    'vup': ([*variant_columns, 'variant_id'], variant_update_jsonl),
+    'ap': (['id'], activate_product_jsonl),
+    'pp': (['id'], publish_product_jsonl)
+}
+
+
+def jsonl_part_name(jsonl_filename, part):
+    root, extension = os.path.splitext(jsonl_filename)
+
+    return f'{root}_{part}{extension}'
+
+
+def csv_to_jsonl(csv_filename, jsonl_filename, mode='pc', chunk_size=10000, progress=None, max_bytes=None):
+    # Reads chunk_size rows at a time and writes every line as it is built, so memory does not grow with
+    # the file. Each line is printed as well, with progress=N a count every N lines is printed instead.
+    # With max_bytes the lines go to parts of at most max_bytes each, named <name>_1.jsonl, <name>_2.jsonl, ...
+    # A line bigger than max_bytes fits in no part and raises ValueError. Returns the paths written
+    print("Converting csv to jsonl file...")
+    if mode not in jsonl_builders:
+        print('Mode value is not available')
+        return []
+
+    columns, build = jsonl_builders[mode]
+    paths = []
+    count = 0
+    size = 0
+    jsonlfile = None
+    try:
+        for df in iter_frames(csv_filename, columns=columns, chunk_size=chunk_size):
+            df.fillna('', inplace=True)
+            for row in frame_rows(df, columns):
+                data = build(row)
+                if progress is None:
+                    print(data)
+                line = json.dumps(data, default=str)
+                # ensure_ascii keeps one byte per character, the newline is os.linesep in a text mode file
+                line_size = len(line) + len(os.linesep)
+                if (max_bytes is not None) and (line_size > max_bytes):
+                    raise ValueError(f'Line {count + 1} of {csv_filename} is {line_size} bytes, more than the {max_bytes} bytes of a part')
+                if (jsonlfile is not None) and (max_bytes is not None) and (size + line_size > max_bytes):
+                    jsonlfile.close()
+                    jsonlfile = None
+                # Opened on the first line, nothing is written for an empty file
+                if jsonlfile is None:
+                    paths.append(jsonl_filename if max_bytes is None else jsonl_part_name(jsonl_filename, len(paths) + 1))
+                    jsonlfile = open(paths[-1], 'w')
+                    size = 0
+                jsonlfile.write(line + '\n')
+                size += line_size
+                count += 1
+                if progress and (count % progress == 0):
+                    print(f'{count} lines written to {len(paths)} file(s)')
+    finally:
+        if jsonlfile is not None:
+            jsonlfile.close()
+    if progress and (count % progress != 0):
+        print(f'{count} lines written to {len(paths)} file(s)')
+
+    return paths
 
 
 def csv_to_quantities(csv_filename):
     print("Converting csv to quantities...")
-    df = pd.read_csv(csv_filename)
+    columns = ['inventory_id', 'Variant Inventory Qty', 'Variant Price']
+    df = load_frame(csv_filename, columns=columns)
     df.fillna('', inplace=True)
     quantities = list()
-    for index in df.index:
-        if (df.iloc[index]['Variant Inventory Qty'] == '') | (df.iloc[index]['Variant Price'] == 0):
+    for row in frame_rows(df, columns):
+        if (row['Variant Inventory Qty'] == '') | (row['Variant Price'] == 0):
             qty = {
-                "inventoryItemId": df.iloc[index]['inventory_id'],
+                "inventoryItemId": row['inventory_id'],
                 "locationId": "gid://shopify/Location/73063170105",
                 "quantity": 0
             }
         else:
             try:
-                variant_inv_qty = int(df.iloc[index]['Variant Inventory Qty'])
+                variant_inv_qty = int(row['Variant Inventory Qty'])
             except ValueError:
-                variant_inv_qty = int(df.iloc[index]['Variant Inventory Qty'].replace(',', ''))
+                variant_inv_qty = int(row['Variant Inventory Qty'].replace(',', ''))
             qty = {
-                "inventoryItemId": df.iloc[index]['inventory_id'],
+                "inventoryItemId": row['inventory_id'],
                 "locationId": "gid://shopify/Location/73063170105",
                 "quantity": variant_inv_qty
             }
-        quantities.append(qty.copy())
+        quantities.append(qty)
 
     return quantities
 
@@ -611,16 +562,16 @@ def merge_images(product_df: pd.DataFrame, image_df: pd.DataFrame, mode='create'
     print(grouped_image_df)
     result_df = product_df.merge(grouped_image_df, how='left', left_on='Handle', right_on='Handle')
     if mode == 'create':
-        result_df.to_csv('data/create_products_with_images.csv', index=False)
+        save_frame(result_df, 'data/create_products_with_images.parquet')
     elif mode == 'update':
-        result_df.to_csv('data/update_products_with_images.csv', index=False)
+        save_frame(result_df, 'data/update_products_with_images.parquet')
     else:
         print('Mode is undefined')
 
 
 def extract_video_url():
     df = pd.read_excel('data/All_Products_PWHSL.xlsx', usecols=['ProductName', 'FormattedName', 'FullDescription'])
-    df['Handle'] = df.apply(lambda x: to_handle(x['ProductName'], alt_title=x['FormattedName']), axis=1)
+    df['Handle'] = cleaning.to_handle_series(df['ProductName'], df['FormattedName'])
     sel_df = df[df['FullDescription'].str.contains('https://', na=False)]
     sel_df.to_csv('video_data.csv', index=False)
 
@@ -651,12 +602,12 @@ def deduplicate_handles(df):
 # if __name__ == '__main__':
     # to_shopify('data/All_Products_PWHSL.xlsx')
     #
-    # product_df = pd.read_csv('data/create_products.csv')
-    # image_df = pd.read_csv('data/product_images.csv')
+    # product_df = load_frame('data/create_products.parquet')
+    # image_df = load_frame('data/product_images.csv')
     # merge_images(product_df, image_df=image_df)
     # csv_to_jsonl()
 
-    # chunked_df = chunk_data('../data/create_products.csv', nrows=250)
+    # chunked_df = chunk_data('../data/create_products.parquet', nrows=250)
     # for df in chunked_df:
     #     print(df.head())
 
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from httpx import HTTPStatusError, TimeoutException, TransportError
+
+logger = logging.getLogger(__name__)
+
+
+def is_congestion_status(status_code):
+	return (status_code == 429) or ((status_code is not None) and (status_code >= 500))
+
+
+@dataclass
+class Slot:
+	status_code: int | None = None
+
+
+@dataclass
+class ConcurrencyController:
+	# AIMD limiter for in-flight requests: the window grows by `increase` after every healthy
+	# sample window and is multiplied by `decrease` on 429s, 5xx responses and timeouts.
+	min_limit: int = 2
+	max_limit: int = 50
+	initial_limit: int = 10
+	increase: float = 1.0
+	decrease: float = 0.5
+	latency_target: float = 5.0
+	error_threshold: float = 0.05
+	sample_size: int = 20
+	_window: float = field(init=False, default=0.0)
+	_in_flight: int = field(init=False, default=0)
+	_samples: deque = field(init=False, default_factory=deque)
+	_last_decrease: float = field(init=False, default=0.0)
+	_condition: asyncio.Condition = field(init=False, default_factory=asyncio.Condition)
+
+	def __post_init__(self):
+		self._window = float(min(max(self.initial_limit, self.min_limit), self.max_limit))
+
+	@property
+	def window(self):
+		return int(self._window)
+
+	@property
+	def in_flight(self):
+		return self._in_flight
+
+	def p95_latency(self):
+		latencies = sorted(latency for latency, _ in self._samples)
+		if not latencies:
+			return 0.0
+
+		return latencies[min(len(latencies) - 1, math.ceil(len(latencies) * 0.95) - 1)]
+
+	async def acquire(self):
+		async with self._condition:
+			await self._condition.wait_for(lambda: self._in_flight < self.window)
+			self._in_flight += 1
+
+	async def release(self, latency, congested=False, failed=False):
+		async with self._condition:
+			self._in_flight -= 1
+			now = time.monotonic()
+			if congested:
+				# Back off at most once per round trip, a burst of 429s is a single congestion event
+				if now - self._last_decrease > latency:
+					window = self.window
+					self._window = max(self.min_limit, self._window * self.decrease)
+					self._last_decrease = now
+					self._samples.clear()
+					if self.window < window:
+						logger.info(f'Concurrency window decreased to {self.window}')
+			else:
+				self._samples.append((latency, failed))
+				if len(self._samples) >= self.sample_size:
+					self.adjust()
+			self._condition.notify_all()
+
+	def adjust(self):
+		p95 = self.p95_latency()
+		error_rate = sum(failed for _, failed in self._samples) / len(self._samples)
+		self._samples.clear()
+		if (p95 <= self.latency_target) and (error_rate <= self.error_threshold):
+			self._window = min(self.max_limit, self._window + self.increase)
+		elif p95 > self.latency_target:
+			self._window = max(self.min_limit, self._window * self.decrease)
+			logger.info(f'Concurrency window decreased to {self.window} (p95 latency {p95:.2f}s)')
+
+	@asynccontextmanager
+	async def slot(self):
+		# The caller sets slot.status_code once the response arrives so it can be classified
+		await self.acquire()
+		slot = Slot()
+		start = time.monotonic()
+		try:
+			yield slot
+		except TimeoutException:
+			await self.release(time.monotonic() - start, congested=True)
+			raise
+		except BaseException:
+			await self.release(time.monotonic() - start, congested=is_congestion_status(slot.status_code), failed=True)
+			raise
+		else:
+			await self.release(time.monotonic() - start, congested=is_congestion_status(slot.status_code))
+
+
+@dataclass
+class TokenBucket:
+	rate: float
+	capacity: float
+	_tokens: float = field(init=False, default=0.0)
+	_updated: float = field(init=False, default=0.0)
+	_lock: asyncio.Lock = field(init=False, default_factory=asyncio.Lock)
+
+	def __post_init__(self):
+		self._tokens = self.capacity
+		self._updated = time.monotonic()
+
+	async def take(self):
+		# Waiters queue on the lock so tokens are handed out in arrival order
+		async with self._lock:
+			while True:
+				now = time.monotonic()
+				self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+				self._updated = now
+				if self._tokens >= 1:
+					self._tokens -= 1
+					return
+				await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class RetryBudget:
+	# Retries are allowed while they stay under `ratio` of the first attempts sent to a host,
+	# plus `min_retries` so a handful of early failures can still be retried
+	ratio: float = 0.2
+	min_retries: int = 10
+	requests: int = 0
+	retries: int = 0
+
+	def can_retry(self):
+		return self.retries < self.min_retries + self.ratio * self.requests
+
+
+@dataclass
+class FetchPolicy:
+	requests_per_second: float = 10.0
+	burst: int = 10
+	max_attempts: int = 4
+	backoff_base: float = 1.0
+	backoff_cap: float = 30.0
+	retry_budget_ratio: float = 0.2
+	retry_statuses: tuple = (429, 500, 502, 503, 504)
+	_buckets: dict = field(init=False, default_factory=dict)
+	_budgets: dict = field(init=False, default_factory=dict)
+
+	@property
+	def retries(self):
+		return sum(budget.retries for budget in self._budgets.values())
+
+	def bucket(self, host):
+		if host not in self._buckets:
+			self._buckets[host] = TokenBucket(rate=self.requests_per_second, capacity=self.burst)
+
+		return self._buckets[host]
+
+	def budget(self, host):
+		if host not in self._budgets:
+			self._budgets[host] = RetryBudget(ratio=self.retry_budget_ratio)
+
+		return self._budgets[host]
+
+	def backoff(self, attempt):
+		# Capped exponential backoff with full jitter
+		return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1)))
+
+	def is_retryable(self, error):
+		if isinstance(error, HTTPStatusError):
+			return error.response.status_code in self.retry_statuses
+
+		return isinstance(error, TransportError)
+
+	def retry_after(self, error):
+		if isinstance(error, HTTPStatusError):
+			try:
+				return min(self.backoff_cap, float(error.response.headers.get('retry-after', '')))
+			except ValueError:
+				pass
+
+		return None
+
+	async def call(self, url, send):
+		# Run send() for url under the host's rate limit, retrying retryable failures
+		host = urlsplit(url).netloc
+		budget = self.budget(host)
+		budget.requests += 1
+		attempt = 1
+		while True:
+			await self.bucket(host).take()
+			try:
+				return await send()
+			except (HTTPStatusError, TransportError) as e:
+				if (attempt >= self.max_attempts) or (not self.is_retryable(e)) or (not budget.can_retry()):
+					raise
+				delay = self.retry_after(e)
+				if delay is None:
+					delay = self.backoff(attempt)
+				budget.retries += 1
+				reason = e.response.status_code if isinstance(e, HTTPStatusError) else repr(e)
+				logger.warning(f'Retrying {url} in {delay:.1f}s (attempt {attempt} failed: {reason})')
+				await asyncio.sleep(delay)
+				attempt += 1
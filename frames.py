@@ -0,0 +1,243 @@
+import json
+import math
+from collections import defaultdict
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Tables handed from one converter step to the next are zstd compressed Parquet, written and read by DuckDB.
+# Columns are typed once when they are saved and list columns stay lists, where a csv turns both into text
+# that read_csv has to guess again and literal_eval to revive. A .csv path still reads and writes csv, for
+# the files Shopify imports and exports
+PARQUET_COMPRESSION = 'zstd'
+LIST_TYPES = (list, tuple, np.ndarray)
+
+
+def is_missing(value):
+	# What a csv cell leaves empty: None, NaN and the '' fillna('') puts in their place
+	if isinstance(value, str):
+		return value == ''
+	if isinstance(value, float):
+		return math.isnan(value)
+
+	return (value is None) or (value is pd.NA)
+
+
+def value_type(values):
+	# DuckDB type of non-missing scalars, the one read_csv would infer from their text
+	if all(isinstance(value, (bool, np.bool_)) for value in values):
+		return 'BOOLEAN'
+	if all(isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)) for value in values):
+		return 'BIGINT'
+	if all(isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)) for value in values):
+		return 'DOUBLE'
+
+	return 'VARCHAR'
+
+
+def column_type(values):
+	# Type of an object column: lists (None where missing), numbers and booleans ('' where missing),
+	# or text. Mixed columns are text, like in a csv
+	present = [value for value in values if not is_missing(value)]
+	if present and all(isinstance(value, LIST_TYPES) for value in present):
+		return value_type([item for value in present for item in value if not is_missing(item)]) + '[]'
+	if any(isinstance(value, LIST_TYPES) for value in present):
+		return 'VARCHAR'
+
+	return value_type(present)
+
+
+def convert_value(value, type):
+	if type == 'VARCHAR':
+		return value if isinstance(value, str) else (None if is_missing(value) else str(value))
+	if is_missing(value):
+		return None
+	if type == 'BOOLEAN':
+		return bool(value)
+	if type == 'BIGINT':
+		return int(value)
+
+	return float(value)
+
+
+def frame_column(series):
+	# (column DuckDB can read without sampling its rows, DuckDB type). Lists are handed over as JSON text
+	series = series.reset_index(drop=True)
+	if series.dtype != object:
+		return series, None
+	if pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+		null = series.isna()
+		return (series.where(~null, None) if null.any() else series), 'VARCHAR'
+	missing = series.isna() | (series == '')
+	inferred = pd.api.types.infer_dtype(series[~missing], skipna=False)
+	if inferred == 'boolean':
+		return series.where(~missing, None).astype('boolean'), 'BOOLEAN'
+	if inferred == 'integer':
+		return series.where(~missing, None).astype('Int64'), 'BIGINT'
+	if inferred in ('floating', 'mixed-integer-float'):
+		return series.where(~missing, None).astype('float64'), 'DOUBLE'
+
+	values = series.tolist()
+	type = column_type(values)
+	if type.endswith('[]'):
+		item_type = type[:-2]
+		return pd.Series([None if is_missing(value) else json.dumps([convert_value(item, item_type) for item in value]) for value in values], dtype=object), type
+
+	return pd.Series([convert_value(value, type) for value in values], dtype=object), type
+
+
+def quote_identifier(name):
+	return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def save_frame(df, path):
+	# Without the index, like to_csv(index=False)
+	if not path.endswith('.parquet'):
+		df.to_csv(path, index=False)
+		return
+
+	columns = dict()
+	selects = list()
+	for i, (name, series) in enumerate(df.items()):
+		key = f'c{i}'
+		columns[key], type = frame_column(series)
+		if type is None:
+			selects.append(f'{key} AS {quote_identifier(name)}')
+		elif type.endswith('[]'):
+			selects.append(f'CAST(CAST({key} AS JSON) AS {type}) AS {quote_identifier(name)}')
+		else:
+			selects.append(f'CAST({key} AS {type}) AS {quote_identifier(name)}')
+	# DuckDB names are case insensitive ('handle' next to 'Handle' becomes 'handle_1'), the pandas names
+	# are kept in the metadata of the file
+	names = json.dumps([str(name) for name in df.columns]).replace("'", "''")
+	conn = duckdb.connect()
+	try:
+		conn.register('frame', pd.DataFrame(columns, index=pd.RangeIndex(len(df))))
+		target = path.replace("'", "''")
+		conn.execute(f"""
+			COPY (SELECT {', '.join(selects)} FROM frame)
+			TO '{target}' (FORMAT parquet, COMPRESSION {PARQUET_COMPRESSION}, KV_METADATA {{columns: '{names}'}})
+		""")
+	finally:
+		conn.close()
+
+
+def stored_names(conn, path, columns):
+	# The pandas names save_frame kept for the columns of path, the DuckDB ones for files it did not write
+	rows = conn.execute("SELECT value FROM parquet_kv_metadata(?) WHERE key = 'columns'", [path]).fetchall()
+	names = json.loads(rows[0][0].decode()) if rows else list()
+
+	return names if len(names) == len(columns) else list(columns)
+
+
+def parquet_columns(conn, path, columns=None):
+	# (relation over path, selected DuckDB columns, DuckDB -> pandas names, DuckDB -> DuckDB type names)
+	relation = conn.read_parquet(path)
+	names = dict(zip(relation.columns, stored_names(conn, path, relation.columns)))
+	types = dict(zip(relation.columns, map(str, relation.types)))
+	# Like usecols, the selected columns keep their order in the file
+	selected = [column for column in relation.columns if (columns is None) or (names[column] in columns)]
+
+	return relation, selected, names, types
+
+
+def load_frame(path, columns=None):
+	if not path.endswith('.parquet'):
+		return pd.read_csv(path, usecols=columns)
+
+	conn = duckdb.connect()
+	try:
+		relation, selected, names, types = parquet_columns(conn, path, columns)
+		# Lists come back as python lists from fetchall, df() makes numpy arrays of them
+		list_columns = [column for column in selected if types[column].endswith('[]')]
+		other_columns = [column for column in selected if column not in list_columns]
+		df = relation.select(', '.join(map(quote_identifier, other_columns))).df() if other_columns else pd.DataFrame(index=pd.RangeIndex(len(relation)))
+		for column in list_columns:
+			df[column] = [row[0] for row in relation.select(quote_identifier(column)).fetchall()]
+		df = df[selected]
+	finally:
+		conn.close()
+	df.columns = [names[column] for column in selected]
+
+	return df
+
+
+def csv_dtypes(path, columns=None, chunk_size=10000):
+	# read_csv(chunksize) types every chunk on its own. A first pass over the chunks finds the dtype a
+	# whole file read_csv gives each column: (dtype= for read_csv, boolean columns to make object)
+	kinds = defaultdict(set)
+	missing = set()
+	chunks = 0
+	for df in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+		chunks += 1
+		for column, series in df.items():
+			null = series.isna()
+			if null.any():
+				missing.add(column)
+			if null.all():
+				continue
+			# Booleans with missing values are read as object columns of bools, not of text
+			if (series.dtype == object) and (pd.api.types.infer_dtype(series, skipna=True) == 'boolean'):
+				kinds[column].add('b')
+			else:
+				kinds[column].add(series.dtype.kind)
+	dtypes = dict()
+	booleans = list()
+	if chunks < 2:
+		return dtypes, booleans
+	for column, kind in kinds.items():
+		numeric = bool(kind & set('iuf'))
+		if ('O' in kind) or (('b' in kind) and numeric):
+			# Text somewhere, or booleans next to numbers: the whole column stays the text of the cells
+			dtypes[column] = object
+		elif numeric and (('f' in kind) or (column in missing)):
+			dtypes[column] = 'float64'
+		elif (kind == {'b'}) and (column in missing):
+			booleans.append(column)
+
+	return dtypes, booleans
+
+
+def iter_frames(path, columns=None, chunk_size=10000):
+	# load_frame chunk_size rows at a time, for files that should not be held in memory at once. Parquet
+	# chunks are streamed by DuckDB in whole vectors of 2048 rows, csv chunks come from read_csv(chunksize)
+	# with the dtypes of a whole file read
+	if not path.endswith('.parquet'):
+		dtypes, booleans = csv_dtypes(path, columns, chunk_size)
+		for df in pd.read_csv(path, usecols=columns, chunksize=chunk_size, dtype=dtypes or None):
+			for column in booleans:
+				df[column] = df[column].astype(object)
+			yield df
+		return
+
+	conn = duckdb.connect()
+	try:
+		relation, selected, names, types = parquet_columns(conn, path, columns)
+		list_columns = [column for column in selected if types[column].endswith('[]')]
+		# df() of a whole file makes integer columns with a NULL float64 and boolean ones object, a chunk
+		# without NULLs would keep them int64 / bool
+		checked = [column for column in selected if column not in list_columns]
+		counts = relation.aggregate(', '.join(f'count(*) - count({quote_identifier(column)})' for column in checked)).fetchone() if checked else ()
+		nullable = {column for column, count in zip(checked, counts) if count}
+		result = relation.select(', '.join(map(quote_identifier, selected)))
+		vectors = max(1, chunk_size // 2048)
+		start = 0
+		while True:
+			df = result.fetch_df_chunk(vectors)
+			if not len(df):
+				break
+			for column in nullable:
+				if df[column].dtype.kind in 'iu':
+					df[column] = df[column].astype('float64')
+				elif df[column].dtype.kind == 'b':
+					df[column] = df[column].astype(object)
+			for column in list_columns:
+				# NULL lists are NaN here and None from fetchall
+				df[column] = [value.tolist() if isinstance(value, np.ndarray) else None for value in df[column]]
+			df.index = pd.RangeIndex(start, start + len(df))
+			df.columns = [names[column] for column in selected]
+			start += len(df)
+			yield df
+	finally:
+		conn.close()
@@ -0,0 +1,347 @@
+import json
+import math
+import re
+from json.decoder import scanstring
+
+# Tolerant parser for the JavaScript object literals thelashop embeds in its pages
+# (var seo_html, window.dataLayer.push, initData). Accepts unquoted keys, single quoted
+# and backtick strings, trailing commas, comments and raw newlines inside strings.
+# Tokens are matched with compiled patterns so the work per token, not per character,
+# happens in Python.
+
+WHITESPACE = re.compile(r'(?:\s+|//[^\n]*|/\*.*?\*/)*', re.DOTALL)
+NUMBER = re.compile(r'[-+]?(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+IDENTIFIER = re.compile(r'[A-Za-z_$][\w$]*')
+STRING_BODY = {
+	'"': re.compile(r'[^"\\]*'),
+	"'": re.compile(r"[^'\\]*"),
+	'`': re.compile(r'[^`\\]*')
+}
+# A quote only closes a string when a delimiter follows it, otherwise it is a stray quote
+# inside the text (e.g. 5" pole in a description) and is kept as part of the string
+STRING_END = re.compile(r'\s*(?:[,:}\]);]|$)')
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0', '\n': ''}
+CONSTANTS = {'true': True, 'false': False, 'null': None, 'undefined': None, 'NaN': math.nan, 'Infinity': math.inf}
+# scan() reads the common case with one match per object member (key, ':', a scalar value and the ',' after
+# it) or array item, and a loop with an explicit stack for the nesting. Strings end at the first quote
+# STRING_END allows, like in Parser. Whatever it is not sure about, a comment, a stray quote that needs
+# backtracking, an escape it cannot decode exactly or a syntax error, is left to Parser
+QUOTED = '|'.join(
+	fr'{quote}[^{quote}\\]*(?:(?:\\.|{quote}(?!{STRING_END.pattern}))[^{quote}\\]*)*{quote}(?={STRING_END.pattern})'
+	for quote in STRING_BODY
+)
+SCALAR = fr'(?:{QUOTED}|{NUMBER.pattern}|{IDENTIFIER.pattern})'
+# (key, scalar value, ',' after it, '{' or '[' opening the value, '}', ',' after it)
+MEMBER = re.compile(fr'\s*(?:({SCALAR})\s*:\s*(?:({SCALAR})(\s*,)?|([{{\[]))|(\}})(\s*,)?)', re.DOTALL)
+# (scalar item, ',' after it, '{' or '[' opening the item, ']', ',' after it)
+ITEM = re.compile(fr'\s*(?:({SCALAR})(\s*,)?|([{{\[])|(\])(\s*,)?)', re.DOTALL)
+# (',', '}' or ']', ',' after it)
+NEXT = re.compile(r'\s*(?:(,)|([}\]])(\s*,)?)')
+NUMBER_START = frozenset('+-.0123456789')
+ESCAPE = re.compile(r'\\(?:u([0-9a-fA-F]{4})|x([0-9a-fA-F]{2})|(.))', re.DOTALL)
+
+
+class JSLiteralError(json.JSONDecodeError):
+	pass
+
+
+class Fallback(Exception):
+	pass
+
+
+def number(token):
+	unsigned = token.lstrip('+-')
+	if unsigned[:2] in ('0x', '0X'):
+		return int(token, 16)
+	if ('.' in token) or ('e' in token) or ('E' in token):
+		return float(token)
+
+	return int(token)
+
+
+class Parser:
+
+	def __init__(self, text):
+		self.text = text
+		self.length = len(text)
+
+	def error(self, message, pos):
+		raise JSLiteralError(message, self.text, pos)
+
+	def skip(self, pos):
+		return WHITESPACE.match(self.text, pos).end()
+
+	def value(self, pos):
+		pos = self.skip(pos)
+		if pos >= self.length:
+			self.error('Expecting value', pos)
+		char = self.text[pos]
+		if char == '{':
+			return self.object(pos + 1)
+		if char == '[':
+			return self.array(pos + 1)
+		if char in STRING_BODY:
+			return self.string(pos)
+		match = NUMBER.match(self.text, pos)
+		if match:
+			return number(match.group()), match.end()
+		match = IDENTIFIER.match(self.text, pos)
+		if match and (match.group() in CONSTANTS):
+			return CONSTANTS[match.group()], match.end()
+		self.error('Expecting value', pos)
+
+	def key(self, pos):
+		char = self.text[pos:pos + 1]
+		if char and (char in STRING_BODY):
+			return self.string(pos)
+		match = IDENTIFIER.match(self.text, pos) or NUMBER.match(self.text, pos)
+		if not match:
+			self.error('Expecting property name', pos)
+
+		return match.group(), match.end()
+
+	def object(self, pos):
+		result = dict()
+		retries = list()
+		while True:
+			try:
+				pos = self.skip(pos)
+				if self.text[pos:pos + 1] == '}':
+					return result, pos + 1
+				key, pos = self.key(pos)
+				pos = self.skip(pos)
+				if self.text[pos:pos + 1] != ':':
+					self.error("Expecting ':' delimiter", pos)
+				start = self.skip(pos + 1)
+				index = len(result)
+				result[key], pos = self.value(start)
+				if self.text[start] in STRING_BODY:
+					retries.append((index, key, start, pos))
+				pos, closed = self.next_item(pos, '}')
+			except JSLiteralError as e:
+				pos, closed = self.backtrack(e, retries, result, '}')
+			if closed:
+				return result, pos
+
+	def array(self, pos):
+		result = list()
+		retries = list()
+		while True:
+			try:
+				pos = self.skip(pos)
+				if self.text[pos:pos + 1] == ']':
+					return result, pos + 1
+				item, end = self.value(pos)
+				if self.text[pos] in STRING_BODY:
+					retries.append((len(result), None, pos, end))
+				result.append(item)
+				pos, closed = self.next_item(end, ']')
+			except JSLiteralError as e:
+				pos, closed = self.backtrack(e, retries, result, ']')
+			if closed:
+				return result, pos
+
+	def next_item(self, pos, close):
+		# (position after the delimiter that follows an item, whether it closed the container)
+		pos = self.skip(pos)
+		char = self.text[pos:pos + 1]
+		if char == ',':
+			return pos + 1, False
+		if char == close:
+			return pos + 1, True
+		self.error("Expecting ',' delimiter", pos)
+
+	def backtrack(self, error, retries, container, close):
+		# What came after a string item did not parse, so the quote that closed it was a stray one in the
+		# text (description: "Pole is 5", Weight: 3 lb ..."). The last string item is scanned on to its next
+		# closing quote and the items parsed after it are dropped, error is raised when none is left
+		while retries:
+			index, key, start, end = retries.pop()
+			try:
+				value, end = self.string(start, end - 1)
+				pos, closed = self.next_item(end, close)
+			except JSLiteralError:
+				continue
+			if isinstance(container, dict):
+				for stale in list(container)[index:]:
+					del container[stale]
+				container[key] = value
+			else:
+				del container[index:]
+				container.append(value)
+			retries.append((index, key, start, end))
+			return pos, closed
+		raise error
+
+	def string(self, start, after=-1):
+		# Quotes up to after are text, backtrack() passes the quote a string closed at before
+		quote = self.text[start]
+		if quote == '"':
+			value = self.json_string(start, after)
+			if value is not None:
+				return value
+		body = STRING_BODY[quote]
+		chunks = list()
+		pos = start + 1
+		while True:
+			match = body.match(self.text, pos)
+			chunks.append(match.group())
+			pos = match.end()
+			if pos >= self.length:
+				self.error('Unterminated string starting at', start)
+			if self.text[pos] == quote:
+				if (pos > after) and STRING_END.match(self.text, pos + 1):
+					return ''.join(chunks), pos + 1
+				chunks.append(quote)
+				pos += 1
+				continue
+			escape = self.text[pos + 1:pos + 2]
+			if escape == 'u':
+				code = self.hex(pos + 2, 4)
+				pos += 6
+				if (0xd800 <= code <= 0xdbff) and (self.text[pos:pos + 2] == '\\u'):
+					low = self.hex(pos + 2, 4)
+					if 0xdc00 <= low <= 0xdfff:
+						code = 0x10000 + ((code - 0xd800) << 10) + (low - 0xdc00)
+						pos += 6
+				chunks.append(chr(code))
+			elif escape == 'x':
+				chunks.append(chr(self.hex(pos + 2, 2)))
+				pos += 4
+			else:
+				chunks.append(ESCAPES.get(escape, escape))
+				pos += 2
+
+	def json_string(self, start, after=-1):
+		# Fast path for double quoted strings: json's C scanner handles the JSON escapes and,
+		# with strict=False, raw newlines. It is resumed after every stray quote; a non-JSON
+		# escape (\' or \x) returns None and the string is rescanned by string()
+		chunks = list()
+		pos = start + 1
+		while True:
+			try:
+				chunk, pos = scanstring(self.text, pos, False)
+			except ValueError:
+				return None
+			chunks.append(chunk)
+			if (pos - 1 > after) and STRING_END.match(self.text, pos):
+				return ''.join(chunks), pos
+			chunks.append('"')
+
+	def hex(self, pos, digits):
+		try:
+			return int(self.text[pos:pos + digits], 16)
+		except ValueError:
+			self.error('Invalid escape', pos - 2)
+
+
+def unescape(match):
+	if match.group(1) is not None:
+		code = int(match.group(1), 16)
+		if 0xd800 <= code <= 0xdfff:
+			# Surrogate pairs are joined by Parser
+			raise Fallback
+		return chr(code)
+	if match.group(2) is not None:
+		return chr(int(match.group(2), 16))
+	escape = match.group(3)
+	if escape in 'ux':
+		raise Fallback
+
+	return ESCAPES.get(escape, escape)
+
+
+def scalar(token, key=False):
+	# Value (or property name) of a token SCALAR matched
+	char = token[0]
+	if char in STRING_BODY:
+		body = token[1:-1]
+		return ESCAPE.sub(unescape, body) if '\\' in body else body
+	if key:
+		return token
+	if char in NUMBER_START:
+		return number(token)
+	if token in CONSTANTS:
+		return CONSTANTS[token]
+	raise Fallback
+
+
+def scan(text, pos):
+	match = ITEM.match(text, pos)
+	if (match is None) or (match.group(4) is not None):
+		raise Fallback
+	if match.group(1) is not None:
+		return scalar(match.group(1)), match.end(1)
+	container = dict() if match.group(3) == '{' else list()
+	pos = match.end()
+	stack = list()
+	expect_next = False
+	while True:
+		if expect_next:
+			match = NEXT.match(text, pos)
+			if match is None:
+				raise Fallback
+			pos = match.end()
+			if match.group(1) is not None:
+				expect_next = False
+				continue
+			if (match.group(2) == '}') != (type(container) is dict):
+				raise Fallback
+			end, comma = match.end(2), match.group(3)
+		elif type(container) is dict:
+			match = MEMBER.match(text, pos)
+			if match is None:
+				raise Fallback
+			key, value, comma, opened, closed, close_comma = match.groups()
+			pos = match.end()
+			if key is not None:
+				if value is not None:
+					container[scalar(key, True)] = scalar(value)
+					expect_next = comma is None
+				else:
+					stack.append((container, scalar(key, True)))
+					container = dict() if opened == '{' else list()
+				continue
+			end, comma = match.end(5), close_comma
+		else:
+			match = ITEM.match(text, pos)
+			if match is None:
+				raise Fallback
+			value, comma, opened, closed, close_comma = match.groups()
+			pos = match.end()
+			if value is not None:
+				container.append(scalar(value))
+				expect_next = comma is None
+				continue
+			if opened is not None:
+				stack.append((container, None))
+				container = dict() if opened == '{' else list()
+				continue
+			end, comma = match.end(4), close_comma
+		# The container closed at end, comma is the ',' after it
+		value = container
+		if not stack:
+			return value, end
+		container, key = stack.pop()
+		if type(container) is dict:
+			container[key] = value
+		else:
+			container.append(value)
+		expect_next = comma is None
+
+
+def raw_decode(text, pos=0):
+	# Parse one literal starting at pos, returns (value, end) like json.JSONDecoder.raw_decode
+	try:
+		return scan(text, pos)
+	except Fallback:
+		return Parser(text).value(pos)
+
+
+def loads(text):
+	value, pos = raw_decode(text)
+	pos = WHITESPACE.match(text, pos).end()
+	if pos < len(text):
+		raise JSLiteralError('Extra data', text, pos)
+
+	return value
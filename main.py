@@ -5,6 +5,12 @@ if __name__ == '__main__':
 	# scraper.fetch_search_result_html('https://thelashop.com/collections/all')
 	# product_urls = scraper.get_product_urls()
 	# scraper.fetch_product_html(product_urls)
+	# or both crawl steps pipelined, product pages are fetched while listing pages are still loading
+	# scraper.crawl('https://thelashop.com/collections/all')
+	# or, for daily syncs, only the products the sitemap lists as changed since the last successful sync
+	# scraper.sync_from_sitemap('https://thelashop.com/sitemap.xml')
 	# raw_product_datas = scraper.get_data()
 	# product_datas = scraper.transform_product_datas(raw_product_datas)
 	# scraper.create_csv(product_datas, 'data/thelashop_products.csv')
+	# or the same csv streamed out of DuckDB, for catalogs too large for pandas
+	# scraper.export_csv('data/thelashop_products.csv')
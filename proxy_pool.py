@@ -0,0 +1,157 @@
+from dataclasses import dataclass, field
+from httpx import AsyncClient, TransportError
+from contextlib import asynccontextmanager
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# The endpoint fetch_all always used, kept as the pool when nothing else is configured
+DEFAULT_PROXIES = ('http://p.webshare.io:9999',)
+# Responses that say more about the proxy (blocked, banned, throttled) than about the page
+PROXY_FAILURE_STATUSES = (403, 407, 429, 502, 503, 504)
+
+
+def load_proxies(proxies=None, proxy_file=None):
+	# Proxy urls from, in order: the given list, proxy_file (one per line, # comments), the PROXIES
+	# environment variable (comma separated), proxies.txt in the working directory, DEFAULT_PROXIES.
+	# 'direct' stands for a connection without proxy
+	if proxies:
+		return list(proxies)
+	if (not proxy_file) and os.getenv('PROXIES'):
+		return [proxy.strip() for proxy in os.getenv('PROXIES').split(',') if proxy.strip()]
+	proxy_file = proxy_file or ('proxies.txt' if os.path.exists('proxies.txt') else None)
+	if proxy_file:
+		with open(proxy_file, 'r') as file:
+			return [line.strip() for line in file if line.strip() and not line.lstrip().startswith('#')]
+
+	return list(DEFAULT_PROXIES)
+
+
+@dataclass
+class ProxyState:
+	url: str
+	requests: int = 0
+	failures: int = 0
+	consecutive_failures: int = 0
+	cooldowns: int = 0
+	latency: float | None = None
+	cooldown_until: float = 0.0
+	in_flight: int = 0
+
+	@property
+	def error_rate(self):
+		return self.failures / self.requests if self.requests else 0.0
+
+	def score(self, latency_default):
+		# Lower is better: expected latency inflated by the error rate and the requests already queued on it
+		latency = self.latency if self.latency is not None else latency_default
+
+		return latency * (1 + 4 * self.error_rate) * (1 + self.in_flight)
+
+
+@dataclass
+class ProxyPool:
+	proxies: list
+	failure_threshold: int = 3
+	cooldown: float = 30
+	max_cooldown: float = 600
+	latency_alpha: float = 0.2
+	states: dict = field(init=False)
+	clients: dict = field(default_factory=dict, init=False)
+
+	def __post_init__(self):
+		if not self.proxies:
+			raise ValueError('ProxyPool needs at least one proxy')
+		self.states = {proxy: ProxyState(proxy) for proxy in self.proxies}
+
+	def healthy(self):
+		now = time.monotonic()
+
+		return [state for state in self.states.values() if state.cooldown_until <= now]
+
+	def choose(self):
+		# Power of two choices over the proxies that are not cooling down. When all of them are, the one
+		# whose cool-down ends first is used rather than stalling the crawl
+		candidates = self.healthy()
+		if not candidates:
+			return min(self.states.values(), key=lambda state: state.cooldown_until)
+		known = [state.latency for state in candidates if state.latency is not None]
+		latency_default = min(known) if known else 1.0
+		if len(candidates) == 1:
+			return candidates[0]
+
+		return min(random.sample(candidates, 2), key=lambda state: state.score(latency_default))
+
+	def record(self, state, latency, ok):
+		state.requests += 1
+		state.latency = latency if state.latency is None else (1 - self.latency_alpha) * state.latency + self.latency_alpha * latency
+		if ok:
+			state.consecutive_failures = 0
+			return
+		state.failures += 1
+		state.consecutive_failures += 1
+		if state.consecutive_failures >= self.failure_threshold:
+			# Cool-down doubles with every further failure after the threshold
+			delay = min(self.max_cooldown, self.cooldown * 2 ** (state.consecutive_failures - self.failure_threshold))
+			state.cooldown_until = time.monotonic() + delay
+			state.cooldowns += 1
+			logger.warning(f'Proxy {state.url} cooling down for {delay:.0f}s after {state.consecutive_failures} failures in a row')
+
+	async def get(self, url, **kwargs):
+		state = self.choose()
+		state.in_flight += 1
+		start = time.monotonic()
+		try:
+			response = await self.clients[state.url].get(url, **kwargs)
+		except TransportError:
+			self.record(state, time.monotonic() - start, False)
+			raise
+		finally:
+			state.in_flight -= 1
+		self.record(state, time.monotonic() - start, response.status_code not in PROXY_FAILURE_STATUSES)
+
+		return response
+
+	@asynccontextmanager
+	async def stream(self, method, url, **kwargs):
+		# Scored once the body is consumed, a transport error while reading it counts against the proxy
+		state = self.choose()
+		state.in_flight += 1
+		start = time.monotonic()
+		ok = None
+		try:
+			async with self.clients[state.url].stream(method, url, **kwargs) as response:
+				ok = response.status_code not in PROXY_FAILURE_STATUSES
+				yield response
+		except TransportError:
+			ok = False
+			raise
+		finally:
+			state.in_flight -= 1
+			if ok is not None:
+				self.record(state, time.monotonic() - start, ok)
+
+	@asynccontextmanager
+	async def open(self, **client_kwargs):
+		# One AsyncClient (and connection pool) per proxy, the pool itself stands in for the client
+		try:
+			for proxy in self.proxies:
+				self.clients[proxy] = AsyncClient(proxy=None if proxy == 'direct' else proxy, **client_kwargs)
+			yield self
+		finally:
+			for client in self.clients.values():
+				await client.aclose()
+			self.clients = dict()
+			self.report()
+
+	def report(self):
+		for state in sorted(self.states.values(), key=lambda state: -state.requests):
+			latency = f'{state.latency * 1000:.0f}ms' if state.latency is not None else '-'
+			status = 'cooling down' if state.cooldown_until > time.monotonic() else 'healthy'
+			logger.info(
+				f'Proxy {state.url}: {state.requests} requests, {state.failures} failures ({state.error_rate:.1%}), '
+				f'latency {latency}, {state.cooldowns} cool-downs, {status}'
+			)
@@ -0,0 +1,95 @@
+from dataclasses import dataclass, field
+import json
+
+import numpy as np
+import pandas as pd
+
+# Products are built into the columns of shopify_schema.json. A ProductRecord keeps its values in a list
+# next to the column positions every record of the schema shares, instead of a 57 key dict per product,
+# and ProductColumns collects records straight into one list per column for the DataFrame.
+
+
+@dataclass
+class ProductSchema:
+	# Column -> default value, in csv column order
+	defaults: dict
+	index: dict = field(init=False, repr=False)
+
+	def __post_init__(self):
+		self.index = {column: i for i, column in enumerate(self.defaults)}
+
+	@classmethod
+	def load(cls, path='shopify_schema.json'):
+		with open(path, 'r') as file:
+			return cls(json.load(file))
+
+	def new_record(self):
+		return ProductRecord(self.index, list(self.defaults.values()))
+
+
+class ProductRecord:
+	# Reads and writes like the dict it replaces, but only has the columns of its schema
+	__slots__ = ('index', 'values')
+
+	def __init__(self, index, values):
+		self.index = index
+		self.values = values
+
+	def __getitem__(self, column):
+		return self.values[self.index[column]]
+
+	def __setitem__(self, column, value):
+		self.values[self.index[column]] = value
+
+	def __len__(self):
+		return len(self.values)
+
+	def __repr__(self):
+		return f'ProductRecord({self.to_dict()!r})'
+
+	def keys(self):
+		return self.index.keys()
+
+	def items(self):
+		return zip(self.index, self.values)
+
+	def to_dict(self):
+		return dict(self.items())
+
+
+class ProductColumns:
+	# Builds what DataFrame.from_records builds from a list of records (ProductRecord or dict): columns in
+	# the order their keys are first seen, NaN where a record lacks one, dtypes inferred per column. The
+	# records themselves are not kept
+	def __init__(self):
+		self.columns = dict()
+		self.length = 0
+
+	def append(self, record):
+		columns = self.columns
+		for column, value in record.items():
+			values = columns.get(column)
+			if values is None:
+				values = columns[column] = [np.nan] * self.length
+			values.append(value)
+		self.length += 1
+		if len(columns) > len(record):
+			for values in columns.values():
+				if len(values) < self.length:
+					values.append(np.nan)
+
+	def extend(self, records):
+		for record in records:
+			self.append(record)
+
+	def to_frame(self):
+		arrays = dict()
+		for column in list(self.columns):
+			# Each column list is released once it is copied into its array
+			values = self.columns.pop(column)
+			array = np.empty(len(values), dtype=object)
+			array[:] = values
+			arrays[column] = array
+		self.length = 0
+
+		return pd.DataFrame(arrays, copy=False).infer_objects(copy=False)
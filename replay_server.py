@@ -0,0 +1,172 @@
+from dataclasses import dataclass, field
+from collections import Counter
+from email.utils import formatdate
+from urllib.parse import parse_qs, urlsplit
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+
+logger = logging.getLogger(__name__)
+
+# Local stand-in for thelashop.com: serves a corpus of product pages under /products/<handle>, paginated
+# listing pages under /collections/all linking to them and a sitemap, with configurable latency,
+# 429s, 5xx errors and slow bodies so the crawler can be load-tested offline.
+
+
+@dataclass
+class ReplayConfig:
+	latency: float = 0.05
+	# Latency is drawn from a lognormal around latency with this sigma, 0 keeps it fixed
+	jitter: float = 0.5
+	rate_429: float = 0.0
+	retry_after: float = 1.0
+	rate_5xx: float = 0.0
+	# Share of responses whose body trickles in over slow_body_seconds
+	slow_body_rate: float = 0.0
+	slow_body_seconds: float = 2.0
+	per_page: int = 24
+	seed: int | None = None
+
+
+def synthetic_pages(count, size=150_000):
+	# Product pages of a realistic size for runs without a recorded corpus, only the bytes matter to the crawler
+	pages = list()
+	for i in range(count):
+		head = f'<html><head><title>Product {i}</title></head><body><div class="pg__main"><h1>Product {i}</h1>'
+		filler = '<p>' + 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * (size // 58) + '</p>'
+		pages.append((f'https://thelashop.com/products/synthetic-product-{i}', (head + filler + '</div></body></html>').encode()))
+
+	return pages
+
+
+@dataclass
+class ReplayServer:
+	pages: list
+	config: ReplayConfig = field(default_factory=ReplayConfig)
+	stats: Counter = field(default_factory=Counter, init=False)
+
+	def __post_init__(self):
+		# handle -> body, urls from the corpus keep their handle and are served from this host
+		self.products = {urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1]: html for url, html in self.pages}
+		self.handles = list(self.products)
+		self.total_pages = max(1, math.ceil(len(self.handles) / self.config.per_page))
+		self.random = random.Random(self.config.seed)
+
+	def listing_page(self, page):
+		handles = self.handles[(page - 1) * self.config.per_page:page * self.config.per_page]
+		links = ''.join(f'<div class="item"><a class="item__name" href="/products/{handle}">{handle}</a></div>' for handle in handles)
+		pagination = f'<div class="pagination"><span><a href="?page=1">1</a></span><span><a href="?page={self.total_pages}">{self.total_pages}</a></span><span><a>Next</a></span></div>'
+
+		return f'<html><body><div class="collection">{links}</div>{pagination}</body></html>'.encode()
+
+	def sitemap(self, path):
+		lastmod = '2024-01-01T00:00:00+00:00'
+		if path == '/sitemap.xml':
+			items = f'<sitemap><loc>{self.base_url}/sitemap_products_1.xml</loc><lastmod>{lastmod}</lastmod></sitemap>'
+			return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{items}</sitemapindex>'.encode()
+		items = ''.join(f'<url><loc>{self.base_url}/products/{handle}</loc><lastmod>{lastmod}</lastmod></url>' for handle in self.handles)
+
+		return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{items}</urlset>'.encode()
+
+	def route(self, target):
+		# (status, content type, body) for a request target, absolute-form targets from proxies included
+		parts = urlsplit(target)
+		path = parts.path
+		if path == '/__stats':
+			return 200, 'application/json', json.dumps(self.stats).encode()
+		if path.startswith('/products/'):
+			body = self.products.get(path.rstrip('/').rsplit('/', 1)[-1])
+			return (200, 'text/html; charset=utf-8', body) if body is not None else (404, 'text/plain', b'not found')
+		if path.startswith('/collections/'):
+			page = int(parse_qs(parts.query).get('page', ['1'])[0])
+			if page > self.total_pages:
+				return 404, 'text/plain', b'not found'
+			return 200, 'text/html; charset=utf-8', self.listing_page(page)
+		if path in ('/sitemap.xml', '/sitemap_products_1.xml'):
+			return 200, 'application/xml', self.sitemap(path)
+
+		return 404, 'text/plain', b'not found'
+
+	async def respond(self, writer, target, headers):
+		self.stats['requests'] += 1
+		if self.config.latency:
+			delay = self.config.latency
+			if self.config.jitter:
+				delay *= self.random.lognormvariate(0, self.config.jitter)
+			await asyncio.sleep(delay)
+		roll = self.random.random()
+		if urlsplit(target).path == '/__stats':
+			roll = 1.0
+		if roll < self.config.rate_429:
+			self.stats['429'] += 1
+			return await self.write(writer, 429, 'text/plain', b'too many requests', {'retry-after': f'{self.config.retry_after:g}'})
+		if roll < self.config.rate_429 + self.config.rate_5xx:
+			status = self.random.choice((500, 502, 503))
+			self.stats[str(status)] += 1
+			return await self.write(writer, status, 'text/plain', b'server error')
+
+		status, content_type, body = self.route(target)
+		self.stats[str(status)] += 1
+		extra = dict()
+		if status == 200:
+			etag = '"%s"' % hashlib.md5(body).hexdigest()
+			extra = {'etag': etag, 'last-modified': formatdate(0, usegmt=True)}
+			if headers.get('if-none-match') == etag:
+				self.stats['304'] += 1
+				return await self.write(writer, 304, content_type, b'', extra)
+		slow = (status == 200) and (self.random.random() < self.config.slow_body_rate)
+		if slow:
+			self.stats['slow_body'] += 1
+		await self.write(writer, status, content_type, body, extra, slow=slow)
+
+	async def write(self, writer, status, content_type, body, extra=None, slow=False):
+		head = [f'HTTP/1.1 {status} {"OK" if status < 400 else "Error"}', f'content-type: {content_type}', f'content-length: {len(body)}']
+		head.extend(f'{name}: {value}' for name, value in (extra or dict()).items())
+		writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+		if not slow:
+			writer.write(body)
+			await writer.drain()
+			return
+		chunks = 20
+		size = math.ceil(len(body) / chunks) or 1
+		for start in range(0, len(body), size):
+			writer.write(body[start:start + size])
+			await writer.drain()
+			await asyncio.sleep(self.config.slow_body_seconds / chunks)
+
+	async def handle(self, reader, writer):
+		# Minimal HTTP/1.1 with keep-alive, enough for httpx
+		try:
+			while request_line := await reader.readline():
+				parts = request_line.decode('latin-1').split()
+				if len(parts) < 2:
+					break
+				headers = dict()
+				while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+					name, _, value = line.decode('latin-1').partition(':')
+					headers[name.strip().lower()] = value.strip()
+				await self.respond(writer, parts[1], headers)
+				if headers.get('connection', '').lower() == 'close':
+					break
+		except (ConnectionError, asyncio.IncompleteReadError):
+			pass
+		finally:
+			writer.close()
+
+	async def serve(self, host='127.0.0.1', port=8765, ready=None):
+		self.base_url = f'http://{host}:{port}'
+		server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+		logger.info(f'Replaying {len(self.handles)} products on {self.total_pages} listing pages at {self.base_url}')
+		if ready is not None:
+			ready.set()
+		async with server:
+			await server.serve_forever()
+
+
+def run(pages, config, host='127.0.0.1', port=8765, ready=None):
+	# Process entry point, the server gets its own interpreter so it does not share the GIL with the crawler
+	logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+	asyncio.run(ReplayServer(pages, config).serve(host, port, ready))
@@ -1,57 +1,121 @@
-from httpx import AsyncClient, Client
+from httpx import Client, HTTPError, HTTPStatusError
 from selectolax.parser import HTMLParser
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import os
 import asyncio
 import duckdb
 import json
+import hashlib
 import logging
 import re
-from html import escape
 import math
 import pandas as pd
 import csv
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
 import numpy as np
+import jsliteral
+import cleaning
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from xml.etree import ElementTree
+import zlib
+from fetch_policy import ConcurrencyController, FetchPolicy
+from proxy_pool import ProxyPool, load_proxies
+from compression import PageCodec, is_compressed, require_zstandard, train_dictionary
+from records import ProductColumns, ProductSchema
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Columns transform_product_datas explodes into variant rows and image rows
+VARIANT_EXPLODE_COLUMNS = [
+	'Option1 Value', 'Option2 Value', 'Variant SKU', 'Variant Grams', 'Variant Inventory Qty',
+	'Variant Price', 'Variant Requires Shipping', 'Variant Taxable', 'Variant Image',
+	'Cost per item', 'Variant Compare At Price'
+]
+IMAGE_EXPLODE_COLUMNS = ['Image Src', 'Image Alt Text']
+
+PRODUCT_PAGE_SELECTOR = ', '.join([
+	'script',
+	'li[itemprop="itemListElement"]',
+	'span.pg__option-sub__label',
+	'div.pg__main > a',
+	'div.pg__tabs > div > div > div'
+])
+SEO_HTML_PATTERN = re.compile(r'var\s+seo_html\s*=\s*(?=\{)')
+DATALAYER_PUSH_PATTERN = re.compile(r'window\.dataLayer\.push\(\s*(?=\{)')
+INIT_DATA_PATTERN = re.compile(r'initData:\s*(?=\{)')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+SPEC_PATTERN = re.compile(r'(\w+[ \w]+?):\s*([\w./]+?[^,]*)')
+
+
+def utc_now():
+	# crawl_state and crawl_runs share this clock, a url is done in a run when it was done after the run started
+	return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class FetchResult:
+	url: str
+	html: bytes | str | None = None
+	http_status: int | None = None
+	etag: str | None = None
+	last_modified: str | None = None
+
+
+@dataclass
+class ProductPage:
+	variant_script: str | None = None
+	seo_script: str | None = None
+	body_html: str | None = None
+	breadcrumbs: list = field(default_factory=list)
+	option_labels: list = field(default_factory=list)
+	image_paths: list = field(default_factory=list)
+
 
 @dataclass
 class FTScraper:
 	base_url: str = 'https://thelashop.com'
 	user_agent: str = 'Mozilla/5.0 (X11; Linux x86_64)'
+	min_concurrency: int = 2
+	max_concurrency: int = 50
+	initial_concurrency: int = 10
+	requests_per_second: float = 10.0
+	max_attempts: int = 4
+	# Proxy urls, or a file with one per line, see proxy_pool.load_proxies for the fallbacks
+	proxies: list | None = None
+	proxy_file: str | None = None
+	# 'zstd' stores page bodies compressed, reads are transparent either way
+	compression: str | None = None
+	compression_level: int = 3
+	dictionary_samples: int = 500
+
+	def concurrency_controller(self):
+		return ConcurrencyController(
+			min_limit=self.min_concurrency,
+			max_limit=self.max_concurrency,
+			initial_limit=self.initial_concurrency
+		)
+
+	def fetch_policy(self):
+		return FetchPolicy(requests_per_second=self.requests_per_second, max_attempts=self.max_attempts)
+
+	def proxy_pool(self):
+		return ProxyPool(load_proxies(self.proxies, self.proxy_file))
 
 	def get_price(self, wholesaleprice):
 		float_wholesaleprice = float(wholesaleprice)
 		if (wholesaleprice is None) or (float_wholesaleprice == 0) or (wholesaleprice == '0.00'):
-			result = "0.00"
+			result = 0.0
 		else:
 			result = float_wholesaleprice - round(float_wholesaleprice * 5 / 100, 2)
 
 		return f"{result:.2f}"
 
 	def clean_html(self, html_content):
-		# 1. Remove non-standard attributes that Shopify may not recognize
-		cleaned_html = re.sub(r'\sdata-[\w-]+="[^"]*"', '', html_content)
-
-		# 2. Encode special characters like apostrophes, quotes, etc.
-		cleaned_html = escape(cleaned_html)
-
-		# 3. Decode standard HTML entities back to their original form (e.g., <, >)
-		cleaned_html = cleaned_html.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
-
-		# 4. Remove excessive whitespace between tags
-		cleaned_html = re.sub(r'>\s+<', '><', cleaned_html)
-
-		# 5. Ensure spaces between inline elements where necessary
-		cleaned_html = re.sub(r'(<span[^>]*>)\s*(<)', r'\1 <', cleaned_html)
-
-		# 6. Remove excess spaces and newlines in text nodes
-		cleaned_html = re.sub(r'\s*\n\s*', '', cleaned_html)
-
-		return cleaned_html
+		return cleaning.clean_html(html_content)
 
 	# def auto_correct_json(self, json_string):
 	# 	print(json_string)
@@ -101,36 +165,207 @@ class FTScraper:
 			response = client.get(url)
 			response.raise_for_status()
 
-		tree = HTMLParser(response.text)
+		tree = HTMLParser(response.content)
 		product_count = int(tree.css_first('div.pagination >span:nth-last-child(2) > a').text(strip=True))
 
 		return product_count
 
-	async def fetch(self, aclient, url, limit):
+	async def fetch_response(self, aclient, url, limit, policy, headers=None):
+		async def send():
+			async with limit.slot() as slot:
+				response = await aclient.get(url, headers=headers, follow_redirects=True)
+				slot.status_code = response.status_code
+				# httpx treats a 304 as an unfollowed redirect, it is the expected answer to a revalidation
+				if response.status_code != 304:
+					response.raise_for_status()
+
+			return response
+
 		logger.info(f'Fetching {url}...')
-		async with limit:
-			response = await aclient.get(url, follow_redirects=True)
-			if limit.locked():
-				await asyncio.sleep(1)
-				response.raise_for_status()
+		response = await policy.call(url, send)
 		logger.info(f'Fetching {url}...Completed!')
 
-		return url, response.text
+		return response
+
+	async def fetch(self, aclient, url, limit, policy):
+		response = await self.fetch_response(aclient, url, limit, policy)
+
+		return url, response.content
+
+	async def fetch_conditional(self, aclient, url, limit, policy, etag=None, last_modified=None):
+		# Revalidate a stored page: a 304 means the stored body is still current and is reused as-is.
+		# The body is kept as the raw response bytes, it is stored and parsed without decoding
+		headers = dict()
+		if etag:
+			headers['if-none-match'] = etag
+		if last_modified:
+			headers['if-modified-since'] = last_modified
+		response = await self.fetch_response(aclient, url, limit, policy, headers=headers)
+		if response.status_code == 304:
+			return FetchResult(url, http_status=304, etag=etag, last_modified=last_modified)
+
+		return FetchResult(
+			url,
+			html=response.content,
+			http_status=response.status_code,
+			etag=response.headers.get('etag'),
+			last_modified=response.headers.get('last-modified')
+		)
 
 	async def fetch_all(self, urls):
+		urls = list(urls)
 		tasks = []
 		headers = {
 			'user-agent': self.user_agent
 		}
-		limit = asyncio.Semaphore(10)
-		async with AsyncClient(headers=headers, timeout=120, proxy='http://p.webshare.io:9999') as aclient:
+		limit = self.concurrency_controller()
+		policy = self.fetch_policy()
+		async with self.proxy_pool().open(headers=headers, timeout=120) as aclient:
 			for url in urls:
-				task = asyncio.create_task(self.fetch(aclient, url=url, limit=limit))
+				task = asyncio.create_task(self.fetch(aclient, url=url, limit=limit, policy=policy))
 				tasks.append(task)
-			htmls = await asyncio.gather(*tasks)
+			results = await asyncio.gather(*tasks, return_exceptions=True)
+
+		htmls = list()
+		failed_urls = list()
+		for url, result in zip(urls, results):
+			if isinstance(result, HTTPError):
+				failed_urls.append(url)
+			elif isinstance(result, BaseException):
+				raise result
+			else:
+				htmls.append(result)
+		if failed_urls:
+			logger.warning(f'{len(failed_urls)} urls failed after {policy.retries} retries: {failed_urls}')
 
 		return htmls
 
+	def create_tables(self, conn, table_name):
+		conn.execute(f"CREATE TABLE IF NOT EXISTS {table_name} (url TEXT, html BLOB)")
+		conn.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS etag TEXT")
+		conn.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS last_modified TEXT")
+		conn.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS content_hash TEXT")
+		conn.execute("""
+			CREATE TABLE IF NOT EXISTS crawl_state (
+				table_name TEXT,
+				url TEXT,
+				status TEXT,
+				http_status INTEGER,
+				attempts INTEGER,
+				updated_at TIMESTAMP,
+				PRIMARY KEY (table_name, url)
+			)
+		""")
+		conn.execute("""
+			CREATE TABLE IF NOT EXISTS page_dictionaries (
+				dict_id UBIGINT PRIMARY KEY,
+				table_name TEXT,
+				dictionary BLOB,
+				created_at TIMESTAMP
+			)
+		""")
+
+	def page_codec(self, conn, table_name):
+		# Codec holding every stored dictionary for reads, new frames use the latest one trained for table_name
+		codec = PageCodec(level=self.compression_level)
+		exists = conn.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'page_dictionaries'").fetchone()[0]
+		if exists:
+			rows = conn.execute("SELECT dict_id, table_name, dictionary FROM page_dictionaries ORDER BY created_at").fetchall()
+			for dict_id, dictionary_table, dictionary in rows:
+				codec.dictionaries[dict_id] = dictionary
+				if dictionary_table == table_name:
+					codec.dict_id = dict_id
+
+		return codec
+
+	def train_page_dictionary(self, conn, table_name, codec, pages=()):
+		# Train on up to dictionary_samples pages, the ones about to be written first and then the stored
+		# pages of table_name. Returns False while there are too few of them
+		samples = list(pages[:self.dictionary_samples])
+		if len(samples) < self.dictionary_samples:
+			rows = conn.execute(f"SELECT html FROM {table_name} WHERE html IS NOT NULL LIMIT ?", [self.dictionary_samples - len(samples)]).fetchall()
+			samples.extend(codec.decompress(row[0]) for row in rows)
+		if len(samples) < self.dictionary_samples:
+			return False
+		try:
+			dict_id, dictionary = train_dictionary(samples)
+		except Exception as e:
+			logger.warning(f'Could not train a zstd dictionary for {table_name}: {e}')
+			return False
+		conn.execute("INSERT INTO page_dictionaries VALUES (?, ?, ?, now()) ON CONFLICT DO NOTHING", [dict_id, table_name, dictionary])
+		codec.add_dictionary(dict_id, dictionary)
+		logger.info(f'Trained zstd dictionary {dict_id} for {table_name} on {len(samples)} pages')
+
+		return True
+
+	def pending_urls(self, conn, table_name, urls, started_at):
+		# Register every url in crawl_state and return the ones the run started at started_at still
+		# has to fetch, together with the cache validators of the copy already stored in table_name.
+		# Urls done by an earlier run come back too, to be revalidated
+		url_df = pd.DataFrame({'url': pd.Series(list(dict.fromkeys(urls)), dtype=object)})
+		conn.register('url_df', url_df)
+		try:
+			conn.execute("""
+				INSERT INTO crawl_state
+				SELECT ?, url, 'pending', NULL, 0, ? FROM url_df
+				ON CONFLICT DO NOTHING
+			""", [table_name, utc_now()])
+			rows = conn.execute(f"""
+				SELECT url_df.url, stored.etag, stored.last_modified FROM url_df
+				JOIN crawl_state ON crawl_state.url = url_df.url AND crawl_state.table_name = ?
+				LEFT JOIN (
+					SELECT url, any_value(etag) AS etag, any_value(last_modified) AS last_modified
+					FROM {table_name} GROUP BY url
+				) AS stored ON stored.url = url_df.url
+				WHERE (crawl_state.status != 'done') OR (crawl_state.updated_at < ?)
+			""", [table_name, started_at]).fetchall()
+		finally:
+			conn.unregister('url_df')
+
+		logger.info(f'{len(rows)} of {len(url_df)} urls left to fetch for {table_name}')
+
+		return rows
+
+	def write_pages(self, conn, table_name, results):
+		# results: FetchResult list, html is None when the fetch failed or the page was not modified.
+		# Fetched pages arrive as bytes and go into the BLOB column untouched, str is only encoded
+		# for callers that still build pages from text
+		# The content hash is always taken on the uncompressed body
+		pages = list()
+		for result in results:
+			if result.html is not None:
+				html = result.html if isinstance(result.html, bytes) else result.html.encode('utf-8')
+				pages.append((result.url, html, result.etag, result.last_modified, hashlib.md5(html).hexdigest()))
+		if pages and (self.compression == 'zstd'):
+			# Pages stored before the table has enough samples for a dictionary are compressed without one
+			codec = self.page_codec(conn, table_name)
+			if codec.dict_id is None:
+				self.train_page_dictionary(conn, table_name, codec, [page[1] for page in pages])
+			pages = [(url, codec.compress(html), *rest) for url, html, *rest in pages]
+		updated_at = utc_now()
+		states = [
+			(table_name, result.url, 'done' if (result.html is not None) or (result.http_status == 304) else 'failed', result.http_status, updated_at)
+			for result in results
+		]
+
+		conn.begin()
+		try:
+			if pages:
+				conn.execute(f"DELETE FROM {table_name} WHERE url IN (SELECT unnest(?::VARCHAR[]))", [[page[0] for page in pages]])
+				conn.executemany(f"INSERT INTO {table_name} (url, html, etag, last_modified, content_hash) VALUES (?, ?, ?, ?, ?)", pages)
+			conn.executemany("""
+				INSERT INTO crawl_state VALUES (?, ?, ?, ?, 1, ?)
+				ON CONFLICT (table_name, url) DO UPDATE SET
+					status = excluded.status,
+					http_status = excluded.http_status,
+					attempts = crawl_state.attempts + 1,
+					updated_at = excluded.updated_at
+			""", states)
+			conn.commit()
+		except Exception:
+			conn.rollback()
+			raise
+
 	def insert_to_db(self, htmls, database_name, table_name):
 		logger.info('Inserting data to database...')
 		# if os.path.exists(database_name):
@@ -140,34 +375,401 @@ class FTScraper:
 		curr = conn.cursor()
 
 		try:
-			curr.execute(f"CREATE TABLE IF NOT EXISTS {table_name} (url TEXT, html BLOB)")
-
-			htmls = [(url, bytes(html, 'utf-8') if not isinstance(html, bytes) else html) for url, html in htmls]
-			curr.executemany(f"INSERT INTO {table_name} (url, html) VALUES (?, ?)", htmls)
-			conn.commit()
+			self.create_tables(curr, table_name)
+			self.write_pages(curr, table_name, [FetchResult(url, html=html, http_status=200) for url, html in htmls])
 
 		finally:
 			curr.close()
 			conn.close()
 			logger.info('Data inserted!')
 
+	async def fetch_page(self, aclient, url, limit, policy, etag=None, last_modified=None):
+		# fetch_conditional for the crawl workers: a failed fetch comes back as a FetchResult without html
+		try:
+			return await self.fetch_conditional(aclient, url=url, limit=limit, policy=policy, etag=etag, last_modified=last_modified)
+		except HTTPStatusError as e:
+			logger.warning(f'Fetching {url}...Failed! ({e.response.status_code})')
+			return FetchResult(url, http_status=e.response.status_code)
+		except HTTPError as e:
+			logger.warning(f'Fetching {url}...Failed! ({e!r})')
+			return FetchResult(url)
+
+	async def write_queue(self, conn, page_queue, producers, limit, batch_size=50):
+		# Single writer for the crawl workers: page_queue carries (table_name, FetchResult), every
+		# producer puts one None when it is done. Pages are committed per table in batches.
+		# Returns {table_name: {'stored': int, 'not_modified': int, 'failed_urls': list}}
+		batches = defaultdict(list)
+		stats = defaultdict(lambda: {'stored': 0, 'not_modified': 0, 'failed_urls': list()})
+
+		def flush(table_name):
+			self.write_pages(conn, table_name, batches[table_name])
+			stats[table_name]['stored'] += sum(page.html is not None for page in batches[table_name])
+			batches[table_name] = list()
+
+		running = producers
+		try:
+			while running:
+				item = await page_queue.get()
+				if item is None:
+					running -= 1
+					continue
+				table_name, page = item
+				if page.http_status == 304:
+					stats[table_name]['not_modified'] += 1
+				elif page.html is None:
+					stats[table_name]['failed_urls'].append(page.url)
+				batches[table_name].append(page)
+				if len(batches[table_name]) >= batch_size:
+					await asyncio.to_thread(flush, table_name)
+					logger.info(f"{stats[table_name]['stored']} pages stored in {table_name} (concurrency window {limit.window})")
+		finally:
+			# Keep whatever was fetched even if the crawl is cancelled halfway
+			for table_name, batch in batches.items():
+				if batch:
+					flush(table_name)
+			for table_name, stat in stats.items():
+				logger.info(f"{stat['stored']} pages stored in {table_name}, {stat['not_modified']} not modified since the last crawl")
+
+		return stats
+
+	def report_failures(self, stats, policy):
+		failed_urls = [url for stat in stats.values() for url in stat['failed_urls']]
+		if failed_urls:
+			logger.warning(f'{len(failed_urls)} urls failed after {policy.retries} retries, rerun to retry them: {failed_urls}')
+
+		return failed_urls
+
+	async def fetch_all_to_db(self, urls, database_name, table_name, batch_size=50, resume=True, conditional=True):
+		# Stream pages into the database while the crawl runs: a pool of max_concurrency workers,
+		# gated by the concurrency controller, pulls urls from a bounded queue and pushes pages to
+		# a single writer that commits them in batches.
+		# With resume an unfinished run for table_name is picked up and skips the urls it already
+		# did, otherwise (or when the last run finished) a new run fetches every url again. Pages
+		# already stored are revalidated with If-None-Match/If-Modified-Since when conditional.
+		headers = {
+			'user-agent': self.user_agent
+		}
+		limit = self.concurrency_controller()
+		policy = self.fetch_policy()
+		workers = self.max_concurrency
+		url_queue = asyncio.Queue(maxsize=workers * 2)
+		page_queue = asyncio.Queue(maxsize=batch_size * 2)
+
+		conn = duckdb.connect(database_name)
+		self.create_tables(conn, table_name)
+		started_at = self.begin_run(conn, table_name, resume)
+		discovered = len(urls)
+		urls = self.pending_urls(conn, table_name, urls, started_at)
+
+		async def feed():
+			for url, etag, last_modified in urls:
+				if not conditional:
+					etag, last_modified = None, None
+				await url_queue.put((url, etag, last_modified))
+			for _ in range(workers):
+				await url_queue.put(None)
+
+		async def work(aclient):
+			while (item := await url_queue.get()) is not None:
+				url, etag, last_modified = item
+				await page_queue.put((table_name, await self.fetch_page(aclient, url, limit, policy, etag, last_modified)))
+			await page_queue.put(None)
+
+		try:
+			async with self.proxy_pool().open(headers=headers, timeout=120) as aclient:
+				async with asyncio.TaskGroup() as tg:
+					tg.create_task(feed())
+					writer = tg.create_task(self.write_queue(conn, page_queue, workers, limit, batch_size))
+					for _ in range(workers):
+						tg.create_task(work(aclient))
+			failed_urls = self.report_failures(writer.result(), policy)
+			self.finish_run(conn, table_name, started_at, discovered, len(urls), len(failed_urls), self.run_status(failed_urls))
+		finally:
+			conn.close()
+
+		return failed_urls
+
+	def crawl_states(self, conn, table_name, started_at=None):
+		# url -> (status, etag, last_modified) of every url crawl_state knows for table_name. Urls
+		# done before started_at count as pending when it is given
+		rows = conn.execute(f"""
+			SELECT
+				crawl_state.url,
+				CASE WHEN crawl_state.updated_at < ? THEN 'pending' ELSE crawl_state.status END,
+				stored.etag,
+				stored.last_modified
+			FROM crawl_state
+			LEFT JOIN (
+				SELECT url, any_value(etag) AS etag, any_value(last_modified) AS last_modified
+				FROM {table_name} GROUP BY url
+			) AS stored ON stored.url = crawl_state.url
+			WHERE crawl_state.table_name = ?
+		""", [started_at, table_name]).fetchall()
+
+		return {url: (status, etag, last_modified) for url, status, etag, last_modified in rows}
+
+	async def crawl_to_db(self, search_url, database_name, batch_size=50, resume=True, conditional=True):
+		# Pipelined crawl: listing pages and product pages are fetched at the same time. Product urls
+		# found on a listing page go straight into the product queue (each url once), so product
+		# fetching starts with the first listing page instead of after the last one. Listing pages
+		# that are not fetched again (done on resume, or a 304) are read back from search_src.
+		# resume works like in fetch_all_to_db, on one run covering both tables.
+		headers = {
+			'user-agent': self.user_agent
+		}
+		limit = self.concurrency_controller()
+		policy = self.fetch_policy()
+		workers = self.max_concurrency
+		total_pages = await asyncio.to_thread(self.get_product_count, search_url)
+		listing_urls = [f'{search_url}?page={page}' for page in range(1, total_pages + 1)]
+		listing_workers = min(workers, len(listing_urls))
+		listing_queue = asyncio.Queue()
+		product_queue = asyncio.Queue(maxsize=workers * 2)
+		page_queue = asyncio.Queue(maxsize=batch_size * 2)
+
+		conn = duckdb.connect(database_name)
+		self.create_tables(conn, 'search_src')
+		self.create_tables(conn, 'product_src')
+		started_at = self.begin_run(conn, 'crawl', resume)
+		listing_pending = self.pending_urls(conn, 'search_src', listing_urls, started_at)
+		pending = {row[0] for row in listing_pending}
+		codec = self.page_codec(conn, 'search_src')
+		stored_listing = {
+			url: codec.decompress(html)
+			for url, html in conn.execute("SELECT url, html FROM search_src WHERE url IN (SELECT unnest(?::VARCHAR[]))", [listing_urls]).fetchall()
+		}
+		product_states = self.crawl_states(conn, 'product_src', started_at)
+		seen = set()
+
+		async def discover(html):
+			for url in self.listing_product_urls(html):
+				if url in seen:
+					continue
+				seen.add(url)
+				status, etag, last_modified = product_states.get(url, (None, None, None))
+				if status == 'done':
+					continue
+				if not conditional:
+					etag, last_modified = None, None
+				await product_queue.put((url, etag, last_modified))
+
+		async def feed_listing():
+			for url, etag, last_modified in listing_pending:
+				if not conditional:
+					etag, last_modified = None, None
+				listing_queue.put_nowait((url, etag, last_modified))
+			for _ in range(listing_workers):
+				listing_queue.put_nowait(None)
+			for url, html in stored_listing.items():
+				if url not in pending:
+					await discover(html)
+
+		async def work_listing(aclient):
+			while (item := await listing_queue.get()) is not None:
+				url, etag, last_modified = item
+				page = await self.fetch_page(aclient, url, limit, policy, etag, last_modified)
+				await page_queue.put(('search_src', page))
+				if page.html is not None:
+					await discover(page.html)
+				elif page.http_status == 304:
+					await discover(stored_listing[url])
+
+		async def work_product(aclient):
+			while (item := await product_queue.get()) is not None:
+				url, etag, last_modified = item
+				await page_queue.put(('product_src', await self.fetch_page(aclient, url, limit, policy, etag, last_modified)))
+			await page_queue.put(None)
+
+		async def close_products(listing_tasks):
+			# Product workers stop once no listing page can add more urls
+			await asyncio.gather(*listing_tasks)
+			for _ in range(workers):
+				await product_queue.put(None)
+			await page_queue.put(None)
+
+		try:
+			async with self.proxy_pool().open(headers=headers, timeout=120) as aclient:
+				async with asyncio.TaskGroup() as tg:
+					writer = tg.create_task(self.write_queue(conn, page_queue, workers + 1, limit, batch_size))
+					listing_tasks = [tg.create_task(feed_listing())]
+					listing_tasks.extend(tg.create_task(work_listing(aclient)) for _ in range(listing_workers))
+					tg.create_task(close_products(listing_tasks))
+					for _ in range(workers):
+						tg.create_task(work_product(aclient))
+			logger.info(f'{len(seen)} product urls found on {len(listing_urls)} listing pages')
+			stats = writer.result()
+			failed_urls = self.report_failures(stats, policy)
+			fetched = sum(stat['stored'] + stat['not_modified'] + len(stat['failed_urls']) for stat in stats.values())
+			self.finish_run(conn, 'crawl', started_at, len(seen), fetched, len(failed_urls), self.run_status(failed_urls))
+		finally:
+			conn.close()
+
+		return failed_urls
+
+	def create_crawl_runs(self, conn):
+		# Times are naive UTC, the last successful sitemap run is the reference for <lastmod> filtering.
+		# Fetches and crawls record their runs here too, mode is the table name or 'crawl'
+		conn.execute("""
+			CREATE TABLE IF NOT EXISTS crawl_runs (
+				mode TEXT,
+				started_at TIMESTAMP,
+				finished_at TIMESTAMP,
+				status TEXT,
+				discovered INTEGER,
+				fetched INTEGER,
+				failed INTEGER
+			)
+		""")
+
+	def run_status(self, failed_urls):
+		# A run that left urls failed is partial, the next one resumes it to retry them
+		return 'partial' if failed_urls else 'success'
+
+	def begin_run(self, conn, mode, resume=True):
+		# Returns the started_at of the run to work in: the unfinished or partial one of mode when
+		# resuming, otherwise a new one. A run left unfinished by a new one is marked abandoned
+		self.create_crawl_runs(conn)
+		if resume:
+			started_at = conn.execute("SELECT max(started_at) FROM crawl_runs WHERE mode = ? AND status IN ('running', 'partial')", [mode]).fetchone()[0]
+			if started_at is not None:
+				logger.info(f'Resuming the {mode} run started at {started_at}')
+				return started_at
+		conn.execute("UPDATE crawl_runs SET status = 'abandoned' WHERE mode = ? AND status IN ('running', 'partial')", [mode])
+		started_at = utc_now()
+		conn.execute("INSERT INTO crawl_runs VALUES (?, ?, NULL, 'running', NULL, NULL, NULL)", [mode, started_at])
+
+		return started_at
+
+	def finish_run(self, conn, mode, started_at, discovered, fetched, failed, status='success'):
+		conn.execute("""
+			UPDATE crawl_runs SET finished_at = ?, status = ?, discovered = ?, fetched = ?, failed = ?
+			WHERE mode = ? AND started_at = ?
+		""", [utc_now(), status, discovered, fetched, failed, mode, started_at])
+
+	def last_successful_crawl(self, conn):
+		return conn.execute("SELECT max(started_at) FROM crawl_runs WHERE mode = 'sitemap' AND status = 'success'").fetchone()[0]
+
+	def parse_lastmod(self, value):
+		# W3C datetime (a date or a full timestamp with offset) as naive UTC, None when missing or malformed
+		if not value:
+			return None
+		try:
+			lastmod = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+		except ValueError:
+			return None
+		if lastmod.tzinfo is not None:
+			lastmod = lastmod.astimezone(timezone.utc).replace(tzinfo=None)
+
+		return lastmod
+
+	def sitemap_entries(self, parser):
+		# Drain the parser: one (loc, lastmod) per <url> or <sitemap>, each element is cleared once read
+		for _, elem in parser.read_events():
+			tag = elem.tag.rsplit('}', 1)[-1]
+			if tag in ('url', 'sitemap'):
+				yield tag, (elem.findtext('{*}loc') or '').strip(), self.parse_lastmod(elem.findtext('{*}lastmod'))
+				elem.clear()
+
+	async def fetch_sitemap(self, aclient, url, limit, policy):
+		# Stream a sitemap (index or urlset, optionally .gz) through an incremental XML parser instead of
+		# loading the document, returns [(tag, loc, lastmod)]
+		async def send():
+			parser = ElementTree.XMLPullParser(events=('end',))
+			inflate = zlib.decompressobj(wbits=31) if urlsplit(url).path.endswith('.gz') else None
+			entries = list()
+			async with limit.slot() as slot:
+				async with aclient.stream('GET', url, follow_redirects=True) as response:
+					slot.status_code = response.status_code
+					response.raise_for_status()
+					async for chunk in response.aiter_bytes():
+						parser.feed(inflate.decompress(chunk) if inflate else chunk)
+						entries.extend(self.sitemap_entries(parser))
+			parser.close()
+			entries.extend(self.sitemap_entries(parser))
+
+			return entries
+
+		logger.info(f'Fetching {url}...')
+		entries = await policy.call(url, send)
+		logger.info(f'Fetching {url}...Completed! ({len(entries)} entries)')
+
+		return entries
+
+	async def sitemap_product_urls(self, aclient, sitemap_url, limit, policy, since=None):
+		# Product (url, lastmod) pairs from the sitemap index and its product sitemaps. Child sitemaps
+		# whose own <lastmod> is older than since have not changed and are not fetched
+		entries = await self.fetch_sitemap(aclient, sitemap_url, limit, policy)
+		children = [
+			loc for tag, loc, lastmod in entries
+			if (tag == 'sitemap') and ('sitemap_products' in loc)
+			and ((since is None) or (lastmod is None) or (lastmod > since))
+		]
+		for child_entries in await asyncio.gather(*(self.fetch_sitemap(aclient, loc, limit, policy) for loc in children)):
+			entries.extend(child_entries)
+		total = sum((tag == 'sitemap') and ('sitemap_products' in loc) for tag, loc, _ in entries)
+		logger.info(f'{len(children)} of {total} product sitemaps changed since {since or "the first crawl"}')
+
+		return {loc: lastmod for tag, loc, lastmod in entries if (tag == 'url') and ('/products/' in loc)}
+
+	async def sitemap_crawl_to_db(self, sitemap_url, database_name, since=None, conditional=True):
+		# Discover products from the sitemap and fetch the ones changed since the last successful crawl:
+		# <lastmod> after it, no <lastmod>, or not fetched successfully yet. Without a previous successful
+		# run every product is revalidated
+		headers = {
+			'user-agent': self.user_agent
+		}
+		limit = self.concurrency_controller()
+		policy = self.fetch_policy()
+		conn = duckdb.connect(database_name)
+		try:
+			self.create_tables(conn, 'product_src')
+			self.create_crawl_runs(conn)
+			if since is None:
+				since = self.last_successful_crawl(conn)
+			started_at = self.begin_run(conn, 'sitemap', resume=False)
+			states = self.crawl_states(conn, 'product_src')
+		finally:
+			conn.close()
+
+		status = 'failed'
+		products = dict()
+		urls = list()
+		failed_urls = list()
+		try:
+			async with self.proxy_pool().open(headers=headers, timeout=120) as aclient:
+				products = await self.sitemap_product_urls(aclient, sitemap_url, limit, policy, since=since)
+			urls = [
+				url for url, lastmod in products.items()
+				if (since is None) or (lastmod is None) or (lastmod > since) or (states.get(url, (None,))[0] != 'done')
+			]
+			# Pages that failed or never finished are retried even when their sitemap was skipped
+			urls.extend(url for url, (state, _, _) in states.items() if (state != 'done') and (url not in products))
+			logger.info(f'{len(urls)} products changed since {since or "the first crawl"} out of {len(products)} listed')
+			if urls:
+				# The selection already leaves out unchanged pages, so done ones in it are fetched again
+				failed_urls = await self.fetch_all_to_db(urls, database_name, 'product_src', resume=False, conditional=conditional)
+			status = 'success'
+		finally:
+			conn = duckdb.connect(database_name)
+			try:
+				self.finish_run(conn, 'sitemap', started_at, len(products), len(urls), len(failed_urls), status)
+			finally:
+				conn.close()
+
+		return failed_urls
+
 	def extract_product_data(self, script_content):
-		pattern = r'var\s+seo_html\s*=\s*(\{.*?\})(?=\s*;|\s*\n\s*fetch)'
-		match = re.search(pattern, script_content, re.DOTALL)
+		match = SEO_HTML_PATTERN.search(script_content)
 
 		if not match:
 			return "No product data found in the script."
 
-		# Extract the JSON string
-		json_str = match.group(1)
-
-		# try:
-		cleaned_json_1 = re.sub(r'([{,])\s*(\w+):', r'\1"\2":', json_str)
-		product_data = self.clean_json_string(cleaned_json_1)
+		# The parser finds the end of the object literal itself
+		product_data = self.clean_json_string(script_content, match.end())
 
 		extracted_data = {
 			"Product Name": product_data.get("name", ""),
-			"Description": re.sub(r'\s+', ' ', product_data.get("description", "")),
+			"Description": WHITESPACE_PATTERN.sub(' ', product_data.get("description", "")),
 			"SKU": product_data.get("sku", ""),
 			"MPN": product_data.get("mpn", ""),
 			"Color": product_data.get("color", ""),
@@ -184,8 +786,7 @@ class FTScraper:
 		description = product_data.get("description", "")
 
 		# Look for product specs (format: Key: Value)
-		spec_pattern = r'(\w+[ \w]+?):\s*([\w./]+?[^,]*)'
-		specs = re.findall(spec_pattern, description)
+		specs = SPEC_PATTERN.findall(description)
 		for key, value in specs:
 			if "Material" in key or "Color" in key or "Dimension" in key or "Weight" in key:
 				specifications[key.strip()] = value.strip()
@@ -202,37 +803,26 @@ class FTScraper:
 		# 	print(f"Error: {e}")
 		# 	print(cleaned_json)
 
-	def clean_json_string(self, json_str):
-
-		def replace_inside_quotes(match):
-			return match.group(0).replace("'", "~!~")
-
-		clean_str = re.sub(r'"description"\s*:\s*".*?",\s*"sku"', '"sku"', json_str, flags=re.DOTALL)
-		clean_str = re.sub(r'"(?:\\.|[^"\\])*"', replace_inside_quotes, clean_str)
-		clean_str = re.sub(r"'([^']*?)'", r'"\1"', clean_str)
-		clean_str = clean_str.replace('`', '"')
-		clean_str = re.sub(r',(\s*[\]}])', r'\1', clean_str)
-		clean_str = clean_str.replace("~!~", "'")
-
+	def clean_json_string(self, json_str, pos=0):
+		# Parse the JS object literal starting at pos, see jsliteral for what is tolerated
 		try:
-			parsed_json = json.loads(clean_str)
-		except Exception:
-			print(clean_str)
+			parsed_json, _ = jsliteral.raw_decode(json_str, pos)
+		except jsliteral.JSLiteralError as e:
+			logger.error(f'Failed to parse JS object literal: {e}')
+			raise
 
 		return parsed_json
 
 	def extract_product_data_variant(self, script_content):
-		pattern = r'window\.dataLayer\.push\(\s*({.*?})\s*\);'
-		matches = re.findall(pattern, script_content, re.DOTALL)
+		matches = [match.end() for match in DATALAYER_PUSH_PATTERN.finditer(script_content)]
 
-		if not matches[1]:
+		if len(matches) < 2:
 			return "No product data found in the script."
 
 		product_data = []
 
 		try:
-			raw_json = matches[1]
-			data = self.clean_json_string(raw_json)
+			data = self.clean_json_string(script_content, matches[1])
 
 			# Check if this is the view_item event with product data
 			if data.get("event_name") == "view_item" and "items" in data.get("event_parameters", {}):
@@ -261,17 +851,15 @@ class FTScraper:
 		return product_data
 
 	def extract_product_data_detail(self, script_content):
-		pattern = r'initData:\s*({.*?}),\s*function'
-		matches = re.findall(pattern, script_content, re.DOTALL)
+		match = INIT_DATA_PATTERN.search(script_content)
 
-		if not matches[0]:
+		if not match:
 			return "No product data found in the script."
 
 		product_data = []
 
 		try:
-			raw_json = matches[0][0:-2]
-			data = self.clean_json_string(raw_json)
+			data = self.clean_json_string(script_content, match.end())
 			# print('=========================================')
 			# print(data)
 
@@ -302,130 +890,334 @@ class FTScraper:
 
 		return product_data
 
-	def get_data(self):
-		logger.info('Getting data from database...')
-		conn = duckdb.connect("thelashop.db")
+	def extract_page(self, tree):
+		# Collect every fragment the record needs in one selector pass over the document,
+		# script text is materialized once per script and checked for both markers
+		page = ProductPage()
+		for node in tree.css(PRODUCT_PAGE_SELECTOR):
+			tag = node.tag
+			if tag == 'script':
+				if (page.variant_script is not None) and (page.seo_script is not None):
+					continue
+				text = node.text()
+				if (page.variant_script is None) and ('inventory_quantity' in text):
+					page.variant_script = text
+				if (page.seo_script is None) and ('var seo_html' in text):
+					page.seo_script = text
+			elif tag == 'li':
+				page.breadcrumbs.append(node.text(strip=True))
+			elif tag == 'span':
+				page.option_labels.append(node.text(strip=True))
+			elif tag == 'a':
+				page.image_paths.append(node.attrs['href'])
+			elif page.body_html is None:
+				page.body_html = node.html
+
+		return page
+
+	def parse_product_html(self, url, html, product_schema):
+		print('===============================================================')
+		print(f"Parsing {url} ...")
+		page = self.extract_page(HTMLParser(html))
+
+		return self.build_product_html(url, page, product_schema)
+
+	def build_product_html(self, url, page, product_schema):
+		current_product = product_schema.new_record()
+
+		if page.variant_script:
+			product_var = json.loads(page.variant_script)
+		if page.seo_script:
+			product_data = self.extract_product_data(page.seo_script)
+
+		current_product['Handle'] = url.split('/')[-1]
+		current_product['Title'] = product_data['Product Name']
+		current_product['Body (HTML)'] = self.clean_html(page.body_html)
+		current_product['Vendor'] = product_data['Brand']
+		breadcrumb_list = page.breadcrumbs
+		current_product['Product Category'] = ' > '.join(breadcrumb_list[1:-1])
+		current_product['Type'] = breadcrumb_list[-1]
+		current_product['Tags'] = ', '.join(breadcrumb_list[1:-1])
+		for i, label in enumerate(page.option_labels):
+			if i == 0:
+				current_product['Option1 Name'] = label.split(':')[0]
+			elif i == 1:
+				current_product['Option2 Name'] = label.split(':')[0]
+			else:
+				current_product['Option3 Name'] = label.split(':')[0]
+		image_paths = page.image_paths
+
+		option1_values = list()
+		option2_values = list()
+		option3_values = list()
+		variant_skus = list()
+		variant_weight = list()
+		variant_qty = list()
+		variant_cost = list()
+		variant_compare_at_price = list()
+		variant_image = list()
+		variant_requires_shipping = list()
+		variant_taxable = list()
+
+		variant_list = list(product_var.values())
+		for variant in variant_list:
+			if current_product['Option1 Name'] != '':
+				if variant['options'] != 'None':
+					option1_values.append(variant['options'][0])
+			else:
+				option1_values = ''
+			if current_product['Option2 Name'] != '':
+				if variant['options'] != 'None':
+					option2_values.append(variant['options'][1])
+			else:
+				option2_values = ''
+
+			if current_product['Option3 Name'] != '':
+				if variant['options'] != 'None':
+					option3_values.append(variant['options'][2])
+			else:
+				option3_values = ''
+
+			variant_skus.append(variant['sku'])
+			variant_weight.append('')
+			variant_qty.append(10 if variant['inventory_quantity'] > 0 else 0)
+			variant_cost.append(round(variant['price'] / 100, 2))
+			try:
+				variant_image.append(f"https:{variant['featured_media']['src']}")
+			except Exception:
+				variant_image.append('')
+			variant_requires_shipping.append(True)
+			variant_taxable.append(True)
+			variant_compare_at_price.append(variant['compare_at_price'])
+
+		current_product['Option1 Value'] = option1_values
+		current_product['Option2 Value'] = option2_values
+		current_product['Option3 Value'] = option3_values
+		current_product['Variant SKU'] = variant_skus
+		current_product['Variant Grams'] = variant_weight
+		current_product['Variant Inventory Qty'] = variant_qty
+		current_product['Google Shopping / Custom Label 0'] = 'TLS'
+		current_product['Variant Image'] = variant_image
+		current_product['Cost per item'] = variant_cost
+		current_product['Variant Price'] = [self.get_price(x) for x in variant_cost]
+		current_product['Variant Compare At Price'] = [round(x / 100, 2) if x is not None else '' for x in variant_compare_at_price]
+		current_product['Variant Requires Shipping'] = variant_requires_shipping
+		current_product['Variant Taxable'] = variant_taxable
+		try:
+			current_product['Image Src'] = [f'https:{path}' for path in image_paths]
+			current_product['Image Alt Text'] = [url.split('/')[-1].split('?')[0] for url in image_paths]
+		except KeyError as e:
+			print(e)
+			pass
+
+		return current_product
+
+	def product_json_url(self, url):
+		return f"{url.split('?')[0].rstrip('/')}.js"
+
+	def parse_product_json(self, url, payload, product_schema):
+		# Map a /products/<handle>.js payload straight into the shopify_schema.json record.
+		# Prices are in cents like the variant script on the product page, breadcrumbs are not
+		# part of the payload so category and type both come from the product type.
+		print('===============================================================')
+		print(f"Parsing {url} ...")
+		product = json.loads(payload)
+		current_product = product_schema.new_record()
+
+		current_product['Handle'] = url.split('/')[-1]
+		current_product['Title'] = product['title']
+		current_product['Body (HTML)'] = self.clean_html(product.get('description') or '')
+		current_product['Vendor'] = product.get('vendor', '')
+		current_product['Product Category'] = product.get('type', '')
+		current_product['Type'] = product.get('type', '')
+		current_product['Tags'] = ', '.join(product.get('tags', []))
+
+		variants = product['variants']
+		option_names = [opt['name'] if isinstance(opt, dict) else opt for opt in product.get('options', [])]
+		if (option_names == ['Title']) and (len(variants) == 1) and (variants[0].get('title') == 'Default Title'):
+			# Shopify's placeholder option for products without variants
+			option_names = []
+		for i, name in enumerate(option_names[:3]):
+			current_product[f'Option{i + 1} Name'] = name
+		for i in range(1, 4):
+			if current_product[f'Option{i} Name'] != '':
+				current_product[f'Option{i} Value'] = [variant.get(f'option{i}') for variant in variants]
+			else:
+				current_product[f'Option{i} Value'] = ''
+
+		variant_cost = [round(variant['price'] / 100, 2) for variant in variants]
+		variant_image = list()
+		for variant in variants:
+			src = (variant.get('featured_image') or {}).get('src')
+			variant_image.append(f"https:{src}" if src and src.startswith('//') else (src or ''))
+
+		current_product['Variant SKU'] = [variant.get('sku', '') for variant in variants]
+		current_product['Variant Grams'] = ['' for _ in variants]
+		current_product['Variant Inventory Qty'] = [10 if variant.get('available') else 0 for variant in variants]
+		current_product['Google Shopping / Custom Label 0'] = 'TLS'
+		current_product['Variant Image'] = variant_image
+		current_product['Cost per item'] = variant_cost
+		current_product['Variant Price'] = [self.get_price(x) for x in variant_cost]
+		current_product['Variant Compare At Price'] = [round(variant['compare_at_price'] / 100, 2) if variant.get('compare_at_price') is not None else '' for variant in variants]
+		current_product['Variant Requires Shipping'] = [variant.get('requires_shipping', True) for variant in variants]
+		current_product['Variant Taxable'] = [variant.get('taxable', True) for variant in variants]
+
+		image_paths = [image if isinstance(image, str) else image['src'] for image in product.get('images', [])]
+		current_product['Image Src'] = [f'https:{path}' if path.startswith('//') else path for path in image_paths]
+		current_product['Image Alt Text'] = [path.split('/')[-1].split('?')[0] for path in image_paths]
+
+		return current_product
+
+	def source_query(self, table_name, changed_only=False):
+		query = f"SELECT url, html, content_hash, rowid AS row_order FROM {table_name}"
+		if changed_only:
+			# Skip pages the last crawl revalidated with a 304
+			query += f" WHERE url NOT IN (SELECT url FROM crawl_state WHERE table_name = '{table_name}' AND http_status = 304)"
+
+		return query
+
+	def iter_batches(self, curr, batch_size):
+		# Pull query results in fixed-size batches instead of materializing them with fetchall
+		while rows := curr.fetchmany(batch_size):
+			yield rows
+
+	def parse_rows(self, rows, product_schema, codec=None):
+		# rows: (url, format, html, content_hash, record), a cached record is reused as-is.
+		# Compressed bodies are decompressed here so process pool workers share that work
+		codec = codec or PageCodec()
+		product_datas = list()
+		for url, format, html, _, record in rows:
+			html = codec.decompress(html)
+			if record is not None:
+				product_datas.append(json.loads(record))
+			elif format == 'json':
+				product_datas.append(self.parse_product_json(url, html, product_schema))
+			else:
+				try:
+					product_datas.append(self.parse_product_html(url, html, product_schema))
+				except jsliteral.JSLiteralError as e:
+					# A page whose script cannot be read is left out instead of stopping the run, None keeps
+					# product_datas in line with rows
+					logger.error(f'Skipping {url}: {e}')
+					product_datas.append(None)
+
+		return product_datas
+
+	def create_parsed_table(self, conn):
+		conn.execute("CREATE TABLE IF NOT EXISTS product_parsed (url TEXT PRIMARY KEY, content_hash TEXT, record TEXT)")
+
+	def store_parsed(self, conn, rows, records):
+		# Cache the records that were just parsed, keyed on the hash of their source
+		# in one statement per batch, row by row upserts slow down as the table grows. The last row of a url wins
+		parsed = {row[0]: (row[3], json.dumps(record.to_dict())) for row, record in zip(rows, records) if (row[4] is None) and (record is not None)}
+		if parsed:
+			conn.execute("""
+				INSERT INTO product_parsed
+				SELECT unnest(?::VARCHAR[]), unnest(?::VARCHAR[]), unnest(?::VARCHAR[])
+				ON CONFLICT (url) DO UPDATE SET content_hash = excluded.content_hash, record = excluded.record
+			""", [list(parsed), [value[0] for value in parsed.values()], [value[1] for value in parsed.values()]])
+
+	def product_query(self, conn, source='html', changed_only=False):
+		# Rows (url, format, html, content_hash, part, row_order) of the stored products, ordered by part, row_order.
+		# Brings tables from older crawls up to the current layout
+		self.create_tables(conn, 'product_src')
+		if source == 'json':
+			self.create_tables(conn, 'product_json_src')
+			# Products without a stored .js payload fall back to their product page
+			return f"""
+				SELECT regexp_replace(url, '\\.js$', '') AS url, 'json' AS format, html, content_hash, 0 AS part, row_order
+				FROM ({self.source_query('product_json_src', changed_only)})
+				UNION ALL
+				SELECT url, 'html' AS format, html, content_hash, 1 AS part, row_order
+				FROM ({self.source_query('product_src', changed_only)})
+				WHERE url NOT IN (SELECT regexp_replace(url, '\\.js$', '') FROM product_json_src)
+			"""
+
+		return f"SELECT url, 'html' AS format, html, content_hash, 0 AS part, row_order FROM ({self.source_query('product_src', changed_only)})"
+
+	@contextmanager
+	def deferred_checkpoints(self, conn):
+		# A commit that grows the WAL past checkpoint_threshold checkpoints right away, and that checkpoint waits
+		# forever on a read still streaming from another cursor of the database. Writes made next to such a read
+		# leave the checkpoint to the close of the connection
+		threshold = conn.execute("SELECT current_setting('checkpoint_threshold')").fetchone()[0]
+		conn.execute("SET checkpoint_threshold = '1TB'")
+		try:
+			yield
+		finally:
+			conn.execute(f"SET checkpoint_threshold = '{threshold}'")
+
+	def parse_products(self, conn, query, workers=1, chunk_size=200, incremental=False, stale_only=False):
+		# Yields the records of query in batches, in table order. With incremental, pages whose hash matches
+		# the cached record are not read nor parsed again and new records are cached in product_parsed,
+		# stale_only skips the cached ones altogether
 		curr = conn.cursor()
-		curr.execute("SELECT url, html FROM product_src")
+		codec = self.page_codec(conn, 'product_src')
+		if incremental:
+			# Rows stored before content_hash existed are hashed on the fly
+			self.create_parsed_table(conn)
+			curr.execute(f"""
+				SELECT
+					src.url,
+					src.format,
+					CASE WHEN parsed.content_hash = src.content_hash THEN NULL ELSE src.html END AS html,
+					src.content_hash,
+					CASE WHEN parsed.content_hash = src.content_hash THEN parsed.record END AS record
+				FROM (SELECT * REPLACE (coalesce(content_hash, md5(html)) AS content_hash) FROM ({query})) AS src
+				LEFT JOIN product_parsed AS parsed ON parsed.url = src.url
+				{'WHERE parsed.content_hash IS DISTINCT FROM src.content_hash' if stale_only else ''}
+				ORDER BY src.part, src.row_order
+			""")
+		else:
+			curr.execute(f"SELECT url, format, html, content_hash, NULL AS record FROM ({query}) ORDER BY part, row_order")
 		# curr.execute("SELECT url, html FROM product_src WHERE url='https://thelashop.com/products/25-ft-aluminum-telescoping-flagpole-kit-with-us-flag'")
-		datas = curr.fetchall()
-		product_datas = list()
 
-		with open('shopify_schema.json', 'r') as file:
-			product_schema = json.load(file)
-
-		for data in datas:
-			print('===============================================================')
-			print(f"Parsing {data[0]} ...")
-			current_product = product_schema.copy()
-			tree = HTMLParser(data[1])
-
-			script_tags = tree.css('script')
-			script_content = None
-
-			for script in script_tags:
-				if 'inventory_quantity' in script.text():
-					script_content = script.text()
-					break
-			if script_content:
-				product_var = json.loads(script_content)
-
-			for script in script_tags:
-				if 'var seo_html' in script.text():
-					script_content = script.text()
-					break
-			if script_content:
-				product_data = self.extract_product_data(script_content)
-
-			current_product['Handle'] = data[0].split('/')[-1]
-			current_product['Title'] = product_data['Product Name']
-			current_product['Body (HTML)'] = self.clean_html(tree.css_first('div.pg__tabs > div > div > div').html)
-			current_product['Vendor'] = product_data['Brand']
-			breadcrumbs = tree.css('li[itemprop="itemListElement"]')
-			breadcrumb_list = [breadcrumb.text(strip=True) for breadcrumb in breadcrumbs]
-			current_product['Product Category'] = ' > '.join(breadcrumb_list[1:-1])
-			current_product['Type'] = breadcrumb_list[-1]
-			current_product['Tags'] = ', '.join(breadcrumb_list[1:-1])
-			option_labels = tree.css('span.pg__option-sub__label')
-			if not option_labels:
-				pass
-			if option_labels:
-				for i, opt in enumerate(option_labels):
-					if i == 0:
-						current_product['Option1 Name'] = opt.text(strip=True).split(':')[0]
-					elif i == 1:
-						current_product['Option2 Name'] = opt.text(strip=True).split(':')[0]
-					else:
-						current_product['Option3 Name'] = opt.text(strip=True).split(':')[0]
-			image_elements = tree.css('div.pg__main > a')
-			image_paths = [elem.attrs['href'] for elem in image_elements]
-
-			option1_values = list()
-			option2_values = list()
-			option3_values = list()
-			variant_skus = list()
-			variant_weight = list()
-			variant_qty = list()
-			variant_cost = list()
-			variant_compare_at_price = list()
-			variant_image = list()
-			variant_requires_shipping = list()
-			variant_taxable = list()
-
-			variant_list = list(product_var.values())
-			for variant in variant_list:
-				if current_product['Option1 Name'] != '':
-					if variant['options'] != 'None':
-						option1_values.append(variant['options'][0])
-				else:
-					option1_values = ''
-				if current_product['Option2 Name'] != '':
-					if variant['options'] != 'None':
-						option2_values.append(variant['options'][1])
-				else:
-					option2_values = ''
+		product_schema = ProductSchema.load()
+
+		cache_curr = conn.cursor()
+
+		def collect(rows, records):
+			if incremental:
+				self.store_parsed(cache_curr, rows, records)
+
+			return [record for record in records if record is not None]
 
-				if current_product['Option3 Name'] != '':
-					if variant['options'] != 'None':
-						option3_values.append(variant['options'][2])
+		try:
+			# The cache is written while curr is still streaming
+			with self.deferred_checkpoints(conn):
+				if workers > 1:
+					# Parse chunks in a process pool with a bounded number of chunks in flight,
+					# results are collected in submission order to keep the records in table order
+					with ProcessPoolExecutor(max_workers=workers) as executor:
+						pending = deque()
+						for rows in self.iter_batches(curr, chunk_size):
+							pending.append((rows, executor.submit(self.parse_rows, rows, product_schema, codec)))
+							if len(pending) >= workers * 2:
+								rows, future = pending.popleft()
+								yield collect(rows, future.result())
+						while pending:
+							rows, future = pending.popleft()
+							yield collect(rows, future.result())
 				else:
-					option3_values = ''
+					for rows in self.iter_batches(curr, chunk_size):
+						yield collect(rows, self.parse_rows(rows, product_schema, codec))
+		finally:
+			cache_curr.close()
+			curr.close()
 
-				variant_skus.append(variant['sku'])
-				variant_weight.append('')
-				variant_qty.append(10 if variant['inventory_quantity'] > 0 else 0)
-				variant_cost.append(round(variant['price'] / 100, 2))
-				try:
-					variant_image.append(f"https:{variant['featured_media']['src']}")
-				except Exception:
-					variant_image.append('')
-				variant_requires_shipping.append(True)
-				variant_taxable.append(True)
-				variant_compare_at_price.append(variant['compare_at_price'])
-
-			current_product['Option1 Value'] = option1_values
-			current_product['Option2 Value'] = option2_values
-			current_product['Option3 Value'] = option3_values
-			current_product['Variant SKU'] = variant_skus
-			current_product['Variant Grams'] = variant_weight
-			current_product['Variant Inventory Qty'] = variant_qty
-			current_product['Google Shopping / Custom Label 0'] = 'TLS'
-			current_product['Variant Image'] = variant_image
-			current_product['Cost per item'] = variant_cost
-			current_product['Variant Price'] = [self.get_price(x) for x in variant_cost]
-			current_product['Variant Compare At Price'] = [round(x / 100, 2) if x is not None else '' for x in variant_compare_at_price]
-			current_product['Variant Requires Shipping'] = variant_requires_shipping
-			current_product['Variant Taxable'] = variant_taxable
-			try:
-				current_product['Image Src'] = [f'https:{path}' for path in image_paths]
-				current_product['Image Alt Text'] = [url.split('/')[-1].split('?')[0] for url in image_paths]
-			except KeyError as e:
-				print(e)
-				pass
+	def get_data(self, changed_only=False, source='html', workers=1, chunk_size=200, incremental=False):
+		logger.info('Getting data from database...')
+		conn = duckdb.connect("thelashop.db")
+		product_datas = ProductColumns()
 
-			product_datas.append(current_product)
+		try:
+			query = self.product_query(conn, source, changed_only)
+			for records in self.parse_products(conn, query, workers, chunk_size, incremental):
+				product_datas.extend(records)
+		finally:
+			conn.close()
 
-		df = pd.DataFrame.from_records(product_datas)
+		df = product_datas.to_frame()
 
 		logger.info('Data Extracted!')
 
@@ -477,34 +1269,305 @@ class FTScraper:
 
 		return df
 
-	def fetch_search_result_html(self, url):
+	def shopify_unused_columns(self):
+		with open('variant_unused_columns.csv', 'r') as file:
+			variant_unused_columns = {row[0] for row in csv.reader(file)}
+		with open('images_unused_columns.csv', 'r') as file:
+			images_unused_columns = {row[0] for row in csv.reader(file)}
+
+		return variant_unused_columns, images_unused_columns
+
+	def shopify_row_keys_query(self, query):
+		# transform_product_datas in SQL over the records cached in product_parsed, first on narrow keys: products are
+		# unnested into variant rows, then the first row of each handle into image rows, and the rows whose unused
+		# columns are blanked are flagged by the same duplicated('Handle') / duplicated('Variant SKU') rules.
+		# export_pos numbers the products in csv order
+		variant_unused_columns, _ = self.shopify_unused_columns()
+		key_columns = list(dict.fromkeys(['Handle', *VARIANT_EXPLODE_COLUMNS, *IMAGE_EXPLODE_COLUMNS]))
+		index = {column: i + 1 for i, column in enumerate(key_columns)}
+		paths = ', '.join("'$.\"{}\"'".format(column.replace("'", "''")) for column in key_columns)
+
+		def length(value):
+			# explode's element count: lists by their length (an empty list still gives one NaN row), scalars 1
+			return f"CASE WHEN json_type({value}) = 'ARRAY' THEN greatest(json_array_length({value})::BIGINT, 1) ELSE 1 END"
+
+		def image_length(column, i):
+			# Image columns blanked on the variant rows do not explode
+			if column in variant_unused_columns:
+				return f'CASE WHEN first_of_handle THEN image_lengths[{i}] ELSE 1 END'
+
+			return f'image_lengths[{i}]'
+
+		return f"""
+			WITH products AS (
+				-- the keys are extracted below the window, which would otherwise hold on to the whole records
+				SELECT row_number() OVER (ORDER BY part, row_order) AS product_pos, url, v
+				FROM (
+					SELECT src.part, src.row_order, src.url, json_extract(parsed.record, [{paths}]) AS v
+					FROM ({query}) AS src
+					JOIN product_parsed AS parsed ON parsed.url = src.url
+				)
+			),
+			variant_keys AS (
+				SELECT
+					product_pos,
+					url,
+					-- single option products (a missing or empty Option2 Value, not a null one) come first like concat([df1opt, df2opt])
+					CASE WHEN (v[{index['Option2 Value']}] IS NULL) OR (v[{index['Option2 Value']}] = '""') THEN 0 ELSE 1 END AS option_group,
+					duplicate_key(v[{index['Handle']}]) AS handle_key,
+					v[{index['Variant SKU']}] AS skus,
+					[{', '.join(length(f'v[{index[column]}]') for column in IMAGE_EXPLODE_COLUMNS)}] AS image_lengths,
+					unnest(range(greatest({', '.join(length(f'v[{index[column]}]') for column in VARIANT_EXPLODE_COLUMNS)}))) AS variant_index
+				FROM products
+			),
+			row_keys AS (
+				SELECT
+					product_pos,
+					url,
+					option_group,
+					variant_index,
+					first_of_handle,
+					duplicate_key(CASE WHEN json_type(skus) = 'ARRAY' THEN skus -> ('$[' || variant_index || ']') ELSE skus END) AS sku_key,
+					unnest(range(greatest({', '.join(image_length(column, i + 1) for i, column in enumerate(IMAGE_EXPLODE_COLUMNS))}))) AS image_index
+				FROM (
+					SELECT
+						*,
+						row_number() OVER (PARTITION BY handle_key ORDER BY option_group, product_pos, variant_index) = 1 AS first_of_handle
+					FROM variant_keys
+				)
+			)
+			SELECT
+				dense_rank() OVER (ORDER BY option_group, product_pos) AS export_pos,
+				url,
+				variant_index,
+				image_index,
+				first_of_handle,
+				row_number() OVER (PARTITION BY sku_key ORDER BY option_group, product_pos, variant_index, image_index) = 1 AS first_of_sku
+			FROM row_keys
+			ORDER BY export_pos, variant_index, image_index
+		"""
+
+	def shopify_rows_query(self, columns):
+		# The wide cells of the export_rows between two export_pos, formatted like pandas writes them by the
+		# shopify_cell macro of export_csv. Records are only extracted for the products of the range
+		variant_unused_columns, images_unused_columns = self.shopify_unused_columns()
+		index = {column: i + 1 for i, column in enumerate(columns)}
+		paths = ', '.join("'$.\"{}\"'".format(column.replace("'", "''")) for column in columns)
+
+		def element(value, position):
+			return f"CASE WHEN json_type({value}) = 'ARRAY' THEN {value} -> ('$[' || {position} || ']') ELSE {value} END"
+
+		def image_source(column):
+			if column in variant_unused_columns:
+				return f"CASE WHEN first_of_handle THEN v[{index[column]}] ELSE '\"\"'::JSON END"
+
+			return f'v[{index[column]}]'
+
+		def cell(column):
+			if column in VARIANT_EXPLODE_COLUMNS:
+				value = element(f'v[{index[column]}]', 'variant_index')
+			elif column in IMAGE_EXPLODE_COLUMNS:
+				value = element(image_source(column), 'image_index')
+			else:
+				value = f'v[{index[column]}]'
+			blanked = list()
+			if column in variant_unused_columns:
+				blanked.append('NOT first_of_handle')
+			if column in images_unused_columns:
+				blanked.append('NOT first_of_sku')
+			if not blanked:
+				return f'shopify_cell({value})'
+
+			return f"CASE WHEN {' OR '.join(blanked)} THEN '' ELSE shopify_cell({value}) END"
+
+		return f"""
+			SELECT {', '.join(cell(column) for column in columns)}
+			FROM export_rows
+			JOIN (
+				SELECT url, json_extract(record, [{paths}]) AS v
+				FROM product_parsed
+				WHERE url IN (SELECT url FROM export_rows WHERE export_pos BETWEEN $first AND $last)
+			) USING (url)
+			WHERE export_pos BETWEEN $first AND $last
+			ORDER BY export_pos, variant_index, image_index
+		"""
+
+	def record_columns(self, conn, query):
+		# Column order of DataFrame.from_records over the cached records: keys in the order they are first seen.
+		# Records mostly share their keys, so each distinct key list is only walked once from its first record
+		key_lists = conn.execute(f"""
+			SELECT json_keys(parsed.record) AS record_keys, min([src.part, src.row_order]) AS first_seen
+			FROM ({query}) AS src
+			JOIN product_parsed AS parsed ON parsed.url = src.url
+			GROUP BY record_keys
+			ORDER BY first_seen
+		""").fetchall()
+
+		return list(dict.fromkeys(key for record_keys, _ in key_lists for key in record_keys))
+
+	def export_csv(self, csv_path, source='html', changed_only=False, workers=1, chunk_size=200, batch_size=10000, product_batch_size=10000, memory_limit=None):
+		# get_data, transform_product_datas and create_csv in one pass that does not hold the catalog in
+		# pandas: pages that changed are parsed into product_parsed and DuckDB expands the cached records,
+		# spilling to disk past memory_limit (e.g. '1GB'), the rows are streamed into the csv product_batch_size
+		# products at a time
+		logger.info("Write data into csv...")
+		conn = duckdb.connect("thelashop.db")
+		try:
+			if memory_limit:
+				conn.execute(f"SET memory_limit = '{memory_limit}'")
+			query = self.product_query(conn, source, changed_only)
+			for _ in self.parse_products(conn, query, workers, chunk_size, incremental=True, stale_only=True):
+				pass
+			columns = self.record_columns(conn, query)
+			conn.create_function('python_repr', lambda value: str(json.loads(value)), ['VARCHAR'], 'VARCHAR')
+			conn.execute("""
+				CREATE OR REPLACE TEMP MACRO shopify_cell(value) AS CASE json_type(value)
+					WHEN 'VARCHAR' THEN value ->> '$'
+					WHEN 'BOOLEAN' THEN CASE WHEN value::VARCHAR = 'true' THEN 'True' ELSE 'False' END
+					WHEN 'DOUBLE' THEN value::DOUBLE::VARCHAR
+					WHEN 'BIGINT' THEN value::VARCHAR
+					WHEN 'UBIGINT' THEN value::VARCHAR
+					WHEN 'NULL' THEN NULL
+					ELSE python_repr(value::VARCHAR)
+				END
+			""")
+			# duplicated() keys: a missing value (NaN) and a null (None) differ, equal numbers and booleans match
+			conn.execute("""
+				CREATE OR REPLACE TEMP MACRO duplicate_key(value) AS CASE
+					WHEN json_type(value) IN ('BOOLEAN', 'BIGINT', 'UBIGINT', 'DOUBLE') THEN 'number:' || value::DOUBLE::VARCHAR
+					ELSE value::VARCHAR
+				END
+			""")
+			conn.execute(f"CREATE OR REPLACE TEMP TABLE export_rows AS {self.shopify_row_keys_query(query)}")
+			product_count = conn.execute("SELECT coalesce(max(export_pos), 0) FROM export_rows").fetchone()[0]
+			rows_query = self.shopify_rows_query(columns)
+			# Same dialect as DataFrame.to_csv
+			with open(csv_path, 'w', newline='', encoding='utf-8') as file:
+				writer = csv.writer(file, lineterminator=os.linesep)
+				writer.writerow(columns)
+				for first in range(1, product_count + 1, product_batch_size):
+					curr = conn.execute(rows_query, {'first': first, 'last': first + product_batch_size - 1})
+					for rows in self.iter_batches(curr, batch_size):
+						writer.writerows(rows)
+		finally:
+			conn.close()
+		logger.info("Done")
+
+	def fetch_search_result_html(self, url, stream=True, resume=True, conditional=True):
 		total_pages = self.get_product_count(url)
 		# total_pages = 1
-		urls = [f'{url}?page={page}' for page in range(1, total_pages + 1)]
-		search_results_html = asyncio.run(self.fetch_all(urls))
-		self.insert_to_db(search_results_html, database_name='thelashop.db', table_name='search_src')
+		urls = (f'{url}?page={page}' for page in range(1, total_pages + 1))
+		if stream:
+			asyncio.run(self.fetch_all_to_db(urls, database_name='thelashop.db', table_name='search_src', resume=resume, conditional=conditional))
+		else:
+			search_results_html = asyncio.run(self.fetch_all(urls))
+			self.insert_to_db(search_results_html, database_name='thelashop.db', table_name='search_src')
+
+	def listing_product_urls(self, html):
+		tree = HTMLParser(html)
+
+		return [f"{self.base_url}{elem.attributes.get('href')}" for elem in tree.css('a.item__name')]
+
+	def crawl(self, search_url, resume=True, conditional=True):
+		# fetch_search_result_html, get_product_urls and fetch_product_html in one pipelined pass
+		return asyncio.run(self.crawl_to_db(search_url, database_name='thelashop.db', resume=resume, conditional=conditional))
+
+	def sync_from_sitemap(self, sitemap_url=None, since=None, conditional=True):
+		# Incremental alternative to crawl(): only products the sitemap reports as changed are fetched
+		sitemap_url = sitemap_url or f'{self.base_url}/sitemap.xml'
+
+		return asyncio.run(self.sitemap_crawl_to_db(sitemap_url, database_name='thelashop.db', since=since, conditional=conditional))
 
 	def get_product_urls(self):
 		logger.info('Getting data from database...')
 		conn = duckdb.connect("thelashop.db")
 		curr = conn.cursor()
+		codec = self.page_codec(conn, 'search_src')
 		curr.execute("SELECT url, html FROM  search_src")
-		datas = curr.fetchall()
 		results = list()
 
-		for data in datas:
-			tree = HTMLParser(data[1])
-			product_elems = tree.css('a.item__name')
-			product_urls = list()
-			for elem in product_elems:
-				product_urls.append(f"{self.base_url}{elem.attributes.get('href')}")
-			results.extend(product_urls)
+		try:
+			for datas in self.iter_batches(curr, 200):
+				for data in datas:
+					results.extend(self.listing_product_urls(codec.decompress(data[1])))
+		finally:
+			curr.close()
+			conn.close()
 
 		return results
 
-	def fetch_product_html(self, urls):
-		product_htmls = asyncio.run(self.fetch_all(urls))
-		self.insert_to_db(product_htmls, database_name='thelashop.db', table_name='product_src')
+	def fetch_product_json(self, urls, resume=True, conditional=True):
+		# Fetch the /products/<handle>.js payloads, returns the product urls that still need their page
+		json_urls = [self.product_json_url(url) for url in urls]
+		failed_urls = asyncio.run(self.fetch_all_to_db(json_urls, database_name='thelashop.db', table_name='product_json_src', resume=resume, conditional=conditional))
+
+		return [url.removesuffix('.js') for url in failed_urls]
+
+	def fetch_product_html(self, urls, stream=True, resume=True, conditional=True, source='html'):
+		if source == 'json':
+			urls = self.fetch_product_json(urls, resume=resume, conditional=conditional)
+			if not urls:
+				return
+			logger.info(f'Falling back to product pages for {len(urls)} products')
+		if stream:
+			asyncio.run(self.fetch_all_to_db(urls, database_name='thelashop.db', table_name='product_src', resume=resume, conditional=conditional))
+		else:
+			product_htmls = asyncio.run(self.fetch_all(urls))
+			self.insert_to_db(product_htmls, database_name='thelashop.db', table_name='product_src')
+
+	def migrate_compression(self, table_name='product_src', database_name='thelashop.db', batch_size=500, retrain=False):
+		# Convert the stored bodies of table_name to the current compression setting: compress plain rows
+		# (and frames of an older dictionary) with zstd, or decompress everything when compression is None.
+		# DuckDB reuses the freed blocks but does not shrink the file, copy the database to reclaim the space
+		if self.compression == 'zstd':
+			require_zstandard()
+		conn = duckdb.connect(database_name)
+		curr = conn.cursor()
+		try:
+			self.create_tables(conn, table_name)
+			codec = self.page_codec(conn, table_name)
+			if (self.compression == 'zstd') and (retrain or (codec.dict_id is None)):
+				if not self.train_page_dictionary(conn, table_name, codec):
+					logger.warning(f'Fewer than {self.dictionary_samples} pages in {table_name}, compressing without a dictionary')
+			before = conn.execute(f"SELECT sum(octet_length(html)) FROM {table_name}").fetchone()[0] or 0
+
+			curr.execute(f"SELECT rowid, html, content_hash FROM {table_name} ORDER BY rowid")
+			converted = 0
+			for rows in self.iter_batches(curr, batch_size):
+				batch = list()
+				for row_id, html, content_hash in rows:
+					if html is None:
+						continue
+					if self.compression == 'zstd':
+						if is_compressed(html) and (codec.frame_dict_id(html) == codec.dict_id):
+							continue
+						plain = codec.decompress(html)
+						stored = codec.compress(plain)
+					elif is_compressed(html):
+						plain = stored = codec.decompress(html)
+					else:
+						continue
+					batch.append((row_id, stored, content_hash or hashlib.md5(plain).hexdigest()))
+				if not batch:
+					continue
+				conn.register('migrated', pd.DataFrame(batch, columns=['row_id', 'html', 'content_hash']))
+				try:
+					conn.execute(f"""
+						UPDATE {table_name} SET html = migrated.html, content_hash = migrated.content_hash
+						FROM migrated WHERE {table_name}.rowid = migrated.row_id
+					""")
+				finally:
+					conn.unregister('migrated')
+				converted += len(batch)
+			conn.execute("CHECKPOINT")
+
+			after = conn.execute(f"SELECT sum(octet_length(html)) FROM {table_name}").fetchone()[0] or 0
+			logger.info(f'{converted} pages of {table_name} migrated to {self.compression or "plain"} storage: {before / 1024 / 1024:.1f}MB -> {after / 1024 / 1024:.1f}MB')
+		finally:
+			curr.close()
+			conn.close()
+
+		return converted
 
 	def create_csv(self, df, csv_path):
 		logger.info("Write data into csv...")
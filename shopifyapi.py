@@ -11,6 +11,24 @@ from converter import csv_to_jsonl, get_handles
 
 load_dotenv()
 
+# Shopify takes a bulk mutation variables file of up to 100MB, parts are cut just under it
+BULK_JSONL_MAX_BYTES = 100 * 1000 * 1000
+# csv_to_jsonl mode -> the ShopifyApp method running the bulk mutation for its lines
+BULK_MUTATIONS = {
+    'pc': 'create_products',
+    'pu': 'update_products',
+    'vc': 'create_variants',
+    'vup': 'update_variants',
+    'ap': 'update_products',
+    'pp': 'publish_unpublish'
+}
+# currentBulkOperation statuses after which the operation will not complete
+BULK_FAILED_STATUSES = ('FAILED', 'CANCELED', 'CANCELING', 'EXPIRED')
+
+
+class BulkOperationError(Exception):
+    pass
+
 
 @dataclass
 class ShopifyApp:
@@ -147,6 +165,8 @@ class ShopifyApp:
         print(response.json())
         print('')
 
+        return response.json()
+
 
     def create_variants(self, client, staged_target):
         print('Creating products...')
@@ -200,6 +220,8 @@ class ShopifyApp:
         print(response.json())
         print('')
 
+        return response.json()
+
 
     def update_variants(self, client, staged_target):
         print('Creating products...')
@@ -253,6 +275,8 @@ class ShopifyApp:
         print(response.json())
         print('')
 
+        return response.json()
+
     def update_inventories(self, client, quantities):
         mutation = '''
         mutation inventorySetQuantities($input: InventorySetQuantitiesInput!) {
@@ -627,6 +651,8 @@ class ShopifyApp:
         print(response.json())
         print('')
 
+        return response.json()
+
 
     # Bulk operation support
     def csv_to_jsonl(self, csv_filename, jsonl_filename):
@@ -698,10 +724,10 @@ class ShopifyApp:
         files = dict()
         for parameter in parameters:
             files[f"{parameter['name']}"] = (None, parameter['value'])
-        files['file'] = open(jsonl_path, 'rb')
-
-        # with httpx.Client(timeout=None, follow_redirects=True) as sess:
-        response = httpx.post(url, files=files)
+        with open(jsonl_path, 'rb') as file:
+            files['file'] = file
+            # with httpx.Client(timeout=None, follow_redirects=True) as sess:
+            response = httpx.post(url, files=files)
 
         print(response)
         print(response.content)
@@ -769,6 +795,34 @@ class ShopifyApp:
         self.upload_jsonl(staged_target=staged_target, jsonl_path=jsonl_filename)
         self.create_products(client, staged_target=staged_target)
 
+    def run_bulk_parts(self, client, jsonl_paths, mode):
+        # Stage, upload and run one bulk mutation per jsonl part, back to back: a shop runs one bulk
+        # mutation at a time, so each part waits for the one before it to complete. A part that does not
+        # start or does not complete raises BulkOperationError naming it, the parts after it are not run
+        run_mutation = getattr(self, BULK_MUTATIONS[mode])
+        for part, jsonl_path in enumerate(jsonl_paths, start=1):
+            print(f'Running bulk mutation {part}/{len(jsonl_paths)} for {jsonl_path}...')
+            staged_target = self.generate_staged_target(client)
+            self.upload_jsonl(staged_target=staged_target, jsonl_path=jsonl_path)
+            response = run_mutation(client, staged_target=staged_target)
+            result = (response.get('data') or {}).get('bulkOperationRunMutation')
+            if (result is None) or result['userErrors'] or (result['bulkOperation'] is None):
+                errors = result['userErrors'] if result else response.get('errors')
+                raise BulkOperationError(f'Bulk mutation for part {part}/{len(jsonl_paths)} {jsonl_path} did not start: {errors}')
+            created = False
+            while not created:
+                try:
+                    created = self.import_status(client)
+                except BulkOperationError as e:
+                    raise BulkOperationError(f'Part {part}/{len(jsonl_paths)} {jsonl_path}: {e}') from e
+
+    def import_bulk_parts(self, client, csv_filename, jsonl_filename, mode, max_bytes=BULK_JSONL_MAX_BYTES):
+        # The whole file in as few bulk mutations as the size limit allows, instead of one per 250 rows
+        jsonl_paths = csv_to_jsonl(csv_filename, jsonl_filename, mode=mode, progress=10000, max_bytes=max_bytes)
+        self.run_bulk_parts(client, jsonl_paths, mode)
+
+        return jsonl_paths
+
     # def create_collection(self, client):
     #     print('Creating collection...')
     #     mutation = '''
@@ -1184,9 +1238,12 @@ class ShopifyApp:
     def import_status(self, client):
         # Check Bulk Import status
         print('Checking')
-        global s
-        response = s.pool_operation_status(client)
-        if response['data']['currentBulkOperation']['status'] == 'COMPLETED':
+        # Raises BulkOperationError when the operation failed, was canceled or expired
+        response = self.pool_operation_status(client)
+        operation = response['data']['currentBulkOperation']
+        if operation['status'] in BULK_FAILED_STATUSES:
+            raise BulkOperationError(f"Bulk operation {operation['id']} {operation['status']} (errorCode {operation['errorCode']})")
+        if operation['status'] == 'COMPLETED':
             created = True
         else:
             sleep(10)
@@ -1245,6 +1302,8 @@ class ShopifyApp:
         print(response.json())
         print('')
 
+        return response.json()
+
 
     def remove_scheduled_publish_date_updated(self, client, product_id, publication_id=None):
         print(f'Removing scheduled publish date for product {product_id}...')
@@ -1427,6 +1486,7 @@ if __name__ == '__main__':
     # s.upload_jsonl(staged_target=staged_target, jsonl_path="D:/Naru/shopifyAPI/bulk_op_vars.jsonl")
     # s.create_products(client, staged_target=staged_target)
     # s.import_bulk_data(client=client, csv_filename='result.csv', jsonl_filename='bulk_op_vars.jsonl')
+    # s.import_bulk_parts(client, csv_filename='data/update_products_with_id_with_images.parquet', jsonl_filename='bulk_op_vars.jsonl', mode='pu')
     # s.webhook_subscription(client)
     # s.create_collection(client)
     # s.query_products(client)
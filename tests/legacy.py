@@ -0,0 +1,348 @@
+import json
+import os
+import re
+from ast import literal_eval
+from html import escape
+
+import pandas as pd
+
+import converter
+
+# Frozen copies of code the pipeline used before it was rewritten. The unit tests check the new code
+# against them and benchmark.py measures both, so they stay as they were
+
+
+def two_pass_lookup(tree):
+	# The extraction get_data did before extract_page: separate selector queries and
+	# two scans over the scripts, kept here as the reference for the parse breakdown
+	scripts = tree.css('script')
+	for script in scripts:
+		if 'inventory_quantity' in script.text():
+			script.text()
+			break
+	for script in scripts:
+		if 'var seo_html' in script.text():
+			script.text()
+			break
+	tree.css_first('div.pg__tabs > div > div > div').html
+	[node.text(strip=True) for node in tree.css('li[itemprop="itemListElement"]')]
+	[node.text(strip=True) for node in tree.css('span.pg__option-sub__label')]
+	[node.attrs['href'] for node in tree.css('div.pg__main > a')]
+
+
+def regex_seo_html(script_content):
+	# The regex chain extract_product_data used before jsliteral, kept as the reference
+	match = re.search(r'var\s+seo_html\s*=\s*(\{.*?\})(?=\s*;|\s*\n\s*fetch)', script_content, re.DOTALL)
+	json_str = re.sub(r'([{,])\s*(\w+):', r'\1"\2":', match.group(1))
+	clean_str = re.sub(r'"description"\s*:\s*".*?",\s*"sku"', '"sku"', json_str, flags=re.DOTALL)
+	clean_str = re.sub(r'"(?:\\.|[^"\\])*"', lambda x: x.group(0).replace("'", "~!~"), clean_str)
+	clean_str = re.sub(r"'([^']*?)'", r'"\1"', clean_str)
+	clean_str = clean_str.replace('`', '"')
+	clean_str = re.sub(r',(\s*[\]}])', r'\1', clean_str)
+	clean_str = clean_str.replace("~!~", "'")
+
+	return json.loads(clean_str)
+
+
+def legacy_clean_html(html_content):
+	# clean_html, to_handle, clean_text_2 and clean_handle as they were before cleaning.py:
+	# pattern strings passed to re on every call, applied row by row
+	cleaned_html = re.sub(r'\sdata-[\w-]+="[^"]*"', '', html_content)
+	cleaned_html = escape(cleaned_html)
+	cleaned_html = cleaned_html.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+	cleaned_html = re.sub(r'>\s+<', '><', cleaned_html)
+	cleaned_html = re.sub(r'(<span[^>]*>)\s*(<)', r'\1 <', cleaned_html)
+
+	return re.sub(r'\s*\n\s*', '', cleaned_html)
+
+
+def legacy_to_handle(title, alt_title):
+	if (pd.isna(title)) | (title == 0):
+		if pd.isna(alt_title):
+			return None
+		title = alt_title
+	pattern = re.compile(r'\b[a-zA-Z0-9]+\b')
+
+	return '-'.join(pattern.findall(title.lower().strip()))
+
+
+def legacy_clean_text_2(text):
+	if pd.isna(text):
+		return text
+	text = str(text)
+	for pattern in (r'\byescomusa\b', r'\bthelashop\b', r'\w*yescom\w*', r'\w*lashop\w*'):
+		text = re.sub(pattern, 'Trendtimes', text, flags=re.IGNORECASE)
+	text = text.strip()
+
+	return text if text else pd.NA
+
+
+def legacy_clean_handle(text):
+	if pd.isna(text):
+		return text
+	for pattern in ('yescomusa', 'yescom', 'thelashop'):
+		text = re.sub(pattern, 'trendtimes', text, flags=re.IGNORECASE)
+
+	return text
+
+
+def legacy_csv_to_jsonl(csv_filename, jsonl_filename, mode='pc'):
+	# csv_to_jsonl as it was before the Parquet intermediates and the row builders, the reference their output is checked against
+	print("Converting csv to jsonl file...")
+	df = pd.read_csv(csv_filename)
+	df.fillna('', inplace=True)
+	datas = None
+	opts = ['Option1 Name', 'Option2 Name', 'Option3 Name']
+	if mode == 'vc':
+		datas = []
+		for index in df.index:
+			data_dict = {"productId": str, "strategy": "REMOVE_STANDALONE_VARIANT", "variants": list()}
+			data_dict['productId'] = df.iloc[index]['id']
+
+			variants = list()
+			metafields = list()
+			variant = dict()
+			variant['barcode'] = str(df.iloc[index]['Variant Barcode'])
+			if df.iloc[index]['Variant Compare At Price'] == '':
+				pass
+			else:
+				variant['compareAtPrice'] = round(float(df.iloc[index]['Variant Compare At Price']), 2)
+
+			variant_inv_item = dict()
+			variant_inv_item['cost'] = str(df.iloc[index]['Cost per item'])
+
+			variant_measure = {'weight': {'unit': 'GRAMS', 'value': 0.0}}
+			try:
+				variant_measure['weight']['unit'] = converter.weight_unit_mapper[df.iloc[index]['Variant Weight Unit']]
+				variant_measure['weight']['value'] = float(df.iloc[index]['Variant Grams'])
+			except:
+				pass
+
+			variant_inv_item['measurement'] = variant_measure
+			variant_inv_item['requiresShipping'] = converter.str_to_bool('true')
+			variant_inv_item['sku'] = df.iloc[index]['Variant SKU']
+			variant_inv_item['tracked'] = converter.tracker_mapper[df.iloc[index]['Variant Inventory Tracker']]
+			variant['inventoryItem'] = variant_inv_item
+			variant['inventoryPolicy'] = df.iloc[index]['Variant Inventory Policy'].upper()
+
+			variants_inv_qty = list()
+			if df.iloc[index]['Variant Inventory Qty'] == '':
+				variant_inv_qty = {'availableQuantity': 0, 'locationId': os.getenv('SHOPIFY_LOCATION_ID')}
+			else:
+				variant_inv_qty = {'availableQuantity': 0, 'locationId': os.getenv('SHOPIFY_LOCATION_ID')}
+				try:
+					variant_inv_qty['availableQuantity'] = int(df.iloc[index]['Variant Inventory Qty'])
+				except ValueError:
+					variant_inv_qty['availableQuantity'] = int(df.iloc[index]['Variant Inventory Qty'].replace(',', ''))
+				variant_inv_qty['locationId'] = os.getenv('SHOPIFY_LOCATION_ID')
+
+			variants_inv_qty.append(variant_inv_qty)
+			variant['inventoryQuantities'] = variants_inv_qty
+
+			product_options = [converter.fill_opt_var(df.iloc[index][opt], df.iloc[index][opt.replace('Name', 'Value')]) for opt in opts]
+
+			if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
+				product_options = [x for x in product_options if x is not None]
+				variant['optionValues'] = product_options
+
+			try:
+				variant['price'] = round(float(df.iloc[index]['Variant Price']), 2)
+			except:
+				variant['price'] = 0.00
+
+			variant['taxable'] = converter.str_to_bool('true')
+			variants.append(variant)
+
+			data_dict['variants'] = variants
+			datas.append(data_dict.copy())
+
+	elif mode == 'pc':
+		datas = []
+		for index in df.index:
+			data_dict = {"input": dict(), "media": list()}
+			data_dict['input']['customProductType'] = df.iloc[index]['Type']
+			data_dict['input']['descriptionHtml'] = df.iloc[index]['Body (HTML)']
+			data_dict['input']['giftCard'] = converter.str_to_bool('False') #df.iloc[index]['Gift Card']
+			data_dict['input']['handle'] = df.iloc[index]['Unique Handle']
+			data_dict['input']['metafields'] = {#'id': '',
+												'key': 'enable_best_price',
+												'namespace': 'custom',
+												'type': 'boolean',
+												'value': converter.str_to_bool(df.iloc[index]['enable_best_price (product.metafields.custom.enable_best_price)'])
+												}
+			product_options = [converter.fill_opt(df.iloc[index][opt], df.iloc[index][opt.replace('Name', 'Value')]) for opt in opts]
+
+			if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
+				product_options = [x for x in product_options if x is not None]
+				data_dict['input']['productOptions'] = product_options
+
+			data_dict['input']['redirectNewHandle'] = converter.str_to_bool('True')
+			data_dict['input']['requiresSellingPlan'] = converter.str_to_bool('False')
+			data_dict['input']['seo'] = {'description': df.iloc[index]['SEO Description'],
+										 'title': df.iloc[index]['SEO Title']
+										 }
+			data_dict['input']['status'] = df.iloc[index]['Status'].upper()
+			data_dict['input']['tags'] = df.iloc[index]['Tags']
+			data_dict['input']['title'] = df.iloc[index]['Title']
+			data_dict['input']['vendor'] = df.iloc[index]['Vendor']
+
+			media_list = []
+			media = dict()
+			if (pd.isna(df.iloc[index]['Link'])) | (df.iloc[index]['Link'] == ''):
+				media_list.append(media)
+			else:
+				try:
+					links = literal_eval(df.iloc[index]['Link'])
+					alt_texts = literal_eval(df.iloc[index]['Image Alt Text'])
+					print(links)
+					for i in range(0, len(links)):
+						try:
+							media['alt'] = alt_texts[i]
+						except:
+							media['alt'] = ''
+						media['mediaContentType'] = 'IMAGE'
+						media['originalSource'] = links[i]
+						media_list.append(media)
+					data_dict['media'] = media_list
+				except Exception:
+					pass
+
+			datas.append(data_dict.copy())
+
+	elif mode == 'pu':
+		datas = []
+		for index in df.index:
+			data_dict = {"input": dict(), "media": list()}
+			data_dict['input']['customProductType'] = df.iloc[index]['Type']
+			data_dict['input']['descriptionHtml'] = df.iloc[index]['Body (HTML)']
+			data_dict['input']['giftCard'] = converter.str_to_bool('False') #df.iloc[index]['Gift Card']
+			data_dict['input']['id'] = df.iloc[index]['id']
+
+			data_dict['input']['redirectNewHandle'] = converter.str_to_bool('True')
+			data_dict['input']['requiresSellingPlan'] = converter.str_to_bool('False')
+			data_dict['input']['seo'] = {'description': df.iloc[index]['SEO Description'],
+										 'title': df.iloc[index]['SEO Title']
+										 }
+			data_dict['input']['status'] = df.iloc[index]['Status'].upper()
+			data_dict['input']['tags'] = df.iloc[index]['Tags']
+			data_dict['input']['title'] = df.iloc[index]['Title']
+			data_dict['input']['vendor'] = df.iloc[index]['Vendor']
+
+			media_list = []
+			media = dict()
+			if (pd.isna(df.iloc[index]['Link'])) | (df.iloc[index]['Link'] == ''):
+				media_list.append(media)
+			else:
+
+				links = literal_eval(df.iloc[index]['Link'])
+				alt_texts = literal_eval(df.iloc[index]['Image Alt Text'])
+				print(links)
+				for i in range(0, len(links)):
+					try:
+						media['alt'] = alt_texts[i]
+					except:
+						media['alt'] = ''
+					media['mediaContentType'] = 'IMAGE'
+					media['originalSource'] = links[i]
+					media_list.append(media)
+				data_dict['media'] = media_list
+
+			datas.append(data_dict.copy())
+
+	elif mode == 'vup':
+		datas = []
+		for index in df.index:
+			data_dict = {"allowPartialUpdates": False, "productId": '', "variants": list()}
+			data_dict['productId'] = df.iloc[index]['id']
+
+			variants = list()
+			variant = dict()
+			variant['id'] = df.iloc[index]['variant_id']
+			variant['barcode'] = str(df.iloc[index]['Variant Barcode'])
+			if df.iloc[index]['Variant Compare At Price'] == '':
+				pass
+			else:
+				variant['compareAtPrice'] = round(float(df.iloc[index]['Variant Compare At Price']), 2)
+
+			variant_measure = {'weight': {'unit': 'GRAMS', 'value': 0.0}}
+			try:
+				variant_measure['weight']['unit'] = converter.weight_unit_mapper[df.iloc[index]['Variant Weight Unit']]
+				variant_measure['weight']['value'] = float(df.iloc[index]['Variant Grams'])
+			except:
+				pass
+
+			variant['inventoryPolicy'] = df.iloc[index]['Variant Inventory Policy'].upper()
+
+			var_inv_item = dict()
+			var_inv_item['cost'] = str(df.iloc[index]['Cost per item'])
+			var_inv_item['tracked'] = True
+			var_inv_item['measurement'] = variant_measure
+			var_inv_item['requiresShipping'] = converter.str_to_bool('true')
+			var_inv_item['sku'] = df.iloc[index]['Variant SKU']
+			var_inv_item['tracked'] = converter.tracker_mapper[df.iloc[index]['Variant Inventory Tracker']]
+			variant['inventoryItem'] = var_inv_item
+
+			product_options = [converter.fill_opt_var(df.iloc[index][opt], df.iloc[index][opt.replace('Name', 'Value')]) for opt in opts]
+			if (product_options[0] is not None) | (product_options[1] is not None) | (product_options[2] is not None):
+				product_options = [x for x in product_options if x is not None]
+				variant['optionValues'] = product_options
+
+			try:
+				variant['price'] = round(float(df.iloc[index]['Variant Price']), 2)
+			except:
+				variant['price'] = 0.00
+
+			variant['taxable'] = converter.str_to_bool('true')
+			variants.append(variant)
+			data_dict['variants'] = variants
+			datas.append(data_dict.copy())
+
+	elif mode == 'ap':
+		datas = []
+		for index in df.index:
+			print(df.iloc[index])
+			data_dict = {"input": dict(), "media": list()}
+			data_dict['input']['id'] = df.iloc[index]['id']
+			data_dict['input']['status'] = 'ACTIVE'
+			datas.append(data_dict.copy())
+
+	elif mode == 'pp':
+		datas = []
+		for index in df.index:
+			data_dict = {"id": '', "input": list()}
+			data_dict['id'] = df.iloc[index]['id']
+			publication_ids = ['gid://shopify/Publication/131749707833', 'gid://shopify/Publication/131749773369', 'gid://shopify/Publication/131749838905', 'gid://shopify/Publication/132635131961']
+			publication_inputs = list()
+			publication_input = dict()
+			for publication_id in publication_ids:
+				publication_input['publicationId'] = publication_id
+				publication_inputs.append(publication_input.copy())
+			data_dict['input'] = publication_inputs
+
+			datas.append(data_dict.copy())
+
+	else:
+		print('Mode value is not available')
+
+	print(datas)
+
+	if datas:
+		with open(jsonl_filename, 'w') as jsonlfile:
+			for item in datas:
+				json.dump(item, jsonlfile, default=str)
+				jsonlfile.write('\n')
+
+
+def legacy_jsonl_lines(path):
+	# The legacy output with the one change csv_to_jsonl makes on purpose: a metafield value read as text
+	# ('True' from an object column) went out as a json boolean, MetafieldInput.value is always a string now
+	with open(path) as file:
+		lines = file.read().splitlines()
+	for i, line in enumerate(lines):
+		if '"metafields": {' in line:
+			data = json.loads(line)
+			if isinstance(data['input']['metafields']['value'], bool):
+				data['input']['metafields']['value'] = str(data['input']['metafields']['value'])
+				lines[i] = json.dumps(data, default=str)
+
+	return lines
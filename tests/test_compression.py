@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import duckdb
+
+import compression
+from compression import PageCodec, is_compressed, train_dictionary
+from scraper import FTScraper, FetchResult
+
+logging.getLogger('scraper').setLevel(logging.ERROR)
+
+
+def page(i):
+	rows = ''.join(f'<li class="spec"><span>Option {j}</span><span>{i * j}</span></li>' for j in range(20))
+	return f'<html><head><title>Product {i}</title></head><body><div class="product" data-id="{i}"><ul>{rows}</ul></div></body></html>'.encode()
+
+
+@unittest.skipIf(compression.zstandard is None, 'zstandard is not installed')
+class PageCodecTest(unittest.TestCase):
+
+	def setUp(self):
+		self.pages = [page(i) for i in range(200)]
+
+	def test_round_trip(self):
+		dict_id, dictionary = train_dictionary(self.pages, dict_size=4096)
+		for codec in (PageCodec(), PageCodec(dictionaries={dict_id: dictionary}, dict_id=dict_id)):
+			blobs = [codec.compress(html) for html in self.pages]
+			self.assertTrue(all(is_compressed(blob) for blob in blobs))
+			self.assertEqual(codec.frame_dict_id(blobs[0]), codec.dict_id or 0)
+			self.assertEqual([codec.decompress(blob) for blob in blobs], self.pages)
+			# Pickled codecs drop their zstandard contexts and rebuild them
+			self.assertEqual(pickle.loads(pickle.dumps(codec)).decompress(blobs[0]), self.pages[0])
+
+	def test_plain_rows_pass_through(self):
+		codec = PageCodec()
+		self.assertEqual(codec.decompress(self.pages[0]), self.pages[0])
+		self.assertIsNone(codec.decompress(None))
+		self.assertFalse(is_compressed(self.pages[0]))
+
+	def test_unknown_dictionary(self):
+		dict_id, dictionary = train_dictionary(self.pages, dict_size=4096)
+		blob = PageCodec(dictionaries={dict_id: dictionary}, dict_id=dict_id).compress(self.pages[0])
+		with self.assertRaises(KeyError):
+			PageCodec().decompress(blob)
+
+
+@unittest.skipIf(compression.zstandard is None, 'zstandard is not installed')
+class MigrateCompressionTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.database_name = os.path.join(self.directory, 'thelashop.db')
+		self.pages = {f'https://thelashop.com/products/p{i}': page(i) for i in range(200)}
+		conn = duckdb.connect(self.database_name)
+		try:
+			scraper = FTScraper()
+			scraper.create_tables(conn, 'product_src')
+			scraper.write_pages(conn, 'product_src', [FetchResult(url, html=html, http_status=200) for url, html in self.pages.items()])
+		finally:
+			conn.close()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def scraper(self, **kwargs):
+		return FTScraper(dictionary_samples=100, **kwargs)
+
+	def query(self, sql):
+		conn = duckdb.connect(self.database_name)
+		try:
+			return conn.execute(sql).fetchall()
+		finally:
+			conn.close()
+
+	def stored(self):
+		return dict(self.query("SELECT url, html FROM product_src"))
+
+	def dict_ids(self):
+		codec = PageCodec()
+		return {codec.frame_dict_id(html) for html in self.stored().values()}
+
+	def assert_pages(self, compressed):
+		conn = duckdb.connect(self.database_name)
+		try:
+			codec = self.scraper().page_codec(conn, 'product_src')
+		finally:
+			conn.close()
+		stored = self.stored()
+		self.assertEqual({is_compressed(html) for html in stored.values()}, {compressed})
+		self.assertEqual({url: codec.decompress(html) for url, html in stored.items()}, self.pages)
+		hashes = dict(self.query("SELECT url, content_hash FROM product_src"))
+		self.assertEqual(hashes, {url: hashlib.md5(html).hexdigest() for url, html in self.pages.items()})
+
+	def test_plain_zstd_plain(self):
+		self.assert_pages(compressed=False)
+		self.scraper(compression='zstd').migrate_compression(database_name=self.database_name)
+		self.assert_pages(compressed=True)
+		dict_ids = self.query("SELECT dict_id FROM page_dictionaries WHERE table_name = 'product_src'")
+		self.assertEqual(len(dict_ids), 1)
+		self.assertEqual(self.dict_ids(), {dict_ids[0][0]})
+
+		self.scraper().migrate_compression(database_name=self.database_name)
+		self.assert_pages(compressed=False)
+
+	def write_frames(self, urls, register):
+		# Compresses urls with a dictionary of another table, stored in page_dictionaries when register is set
+		dict_id, dictionary = train_dictionary([page(i) for i in range(1000, 1200)], dict_size=4096)
+		codec = PageCodec(dictionaries={dict_id: dictionary}, dict_id=dict_id)
+		conn = duckdb.connect(self.database_name)
+		try:
+			if register:
+				conn.execute("INSERT INTO page_dictionaries VALUES (?, 'search_src', ?, now())", [dict_id, dictionary])
+			for url in urls:
+				conn.execute("UPDATE product_src SET html = ? WHERE url = ?", [codec.compress(self.pages[url]), url])
+		finally:
+			conn.close()
+
+		return dict_id
+
+	def test_other_dictionary_frames_are_recompressed(self):
+		other = self.write_frames(list(self.pages)[:10], register=True)
+		self.scraper(compression='zstd').migrate_compression(database_name=self.database_name)
+		self.assert_pages(compressed=True)
+		(dict_id,) = self.query("SELECT dict_id FROM page_dictionaries WHERE table_name = 'product_src'")[0]
+		self.assertNotEqual(dict_id, other)
+		self.assertEqual(self.dict_ids(), {dict_id})
+
+	def test_unknown_dictionary_frames(self):
+		self.write_frames(list(self.pages)[:10], register=False)
+		with self.assertRaises(KeyError):
+			self.scraper(compression='zstd').migrate_compression(database_name=self.database_name)
+		with self.assertRaises(KeyError):
+			self.scraper().migrate_compression(database_name=self.database_name)
@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import duckdb
+from httpx import MockTransport, Response
+
+from proxy_pool import ProxyPool
+from scraper import FTScraper, FetchResult
+
+logging.getLogger('scraper').setLevel(logging.WARNING)
+logging.getLogger('proxy_pool').setLevel(logging.WARNING)
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+URL = 'https://thelashop.com/products/p1'
+ETAG = '"v1"'
+LAST_MODIFIED = 'Wed, 01 Oct 2025 10:00:00 GMT'
+
+
+class FetchConditionalTest(unittest.TestCase):
+
+	def setUp(self):
+		self.requests = list()
+
+	def handler(self, request):
+		self.requests.append(request)
+		if (request.headers.get('if-none-match') == ETAG) or (request.headers.get('if-modified-since') == LAST_MODIFIED):
+			return Response(304)
+
+		return Response(200, content=b'<html>p1</html>', headers={'etag': ETAG, 'last-modified': LAST_MODIFIED})
+
+	def fetch(self, **kwargs):
+		async def run():
+			scraper = FTScraper(proxies=['direct'])
+			async with ProxyPool(['direct']).open(transport=MockTransport(self.handler)) as aclient:
+				return await scraper.fetch_conditional(aclient, URL, scraper.concurrency_controller(), scraper.fetch_policy(), **kwargs)
+
+		return asyncio.run(run())
+
+	def test_first_fetch_keeps_the_validators(self):
+		result = self.fetch()
+		self.assertEqual(result, FetchResult(URL, html=b'<html>p1</html>', http_status=200, etag=ETAG, last_modified=LAST_MODIFIED))
+		self.assertNotIn('if-none-match', self.requests[0].headers)
+		self.assertNotIn('if-modified-since', self.requests[0].headers)
+
+	def test_not_modified(self):
+		for kwargs in ({'etag': ETAG}, {'last_modified': LAST_MODIFIED}, {'etag': ETAG, 'last_modified': LAST_MODIFIED}):
+			result = self.fetch(**kwargs)
+			self.assertEqual(result, FetchResult(URL, http_status=304, **kwargs))
+
+	def test_changed_page(self):
+		result = self.fetch(etag='"v0"')
+		self.assertEqual(self.requests[0].headers['if-none-match'], '"v0"')
+		self.assertEqual((result.http_status, result.etag), (200, ETAG))
+
+
+class WritePagesTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.conn = duckdb.connect(os.path.join(self.directory, 'thelashop.db'))
+		self.scraper = FTScraper()
+		self.scraper.create_tables(self.conn, 'product_src')
+		self.write(FetchResult(URL, html=b'<html>p1</html>', http_status=200, etag=ETAG, last_modified=LAST_MODIFIED))
+
+	def tearDown(self):
+		self.conn.close()
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def write(self, *results):
+		self.scraper.write_pages(self.conn, 'product_src', list(results))
+
+	def stored(self):
+		return self.conn.execute("SELECT url, html, etag, last_modified, content_hash FROM product_src").fetchall()
+
+	def state(self):
+		return self.conn.execute("SELECT status, http_status, attempts FROM crawl_state WHERE url = ?", [URL]).fetchone()
+
+	def test_not_modified_keeps_the_stored_page(self):
+		stored = self.stored()
+		self.assertEqual(stored, [(URL, b'<html>p1</html>', ETAG, LAST_MODIFIED, hashlib.md5(b'<html>p1</html>').hexdigest())])
+		self.write(FetchResult(URL, http_status=304, etag=ETAG, last_modified=LAST_MODIFIED))
+		self.assertEqual(self.stored(), stored)
+		self.assertEqual(self.state(), ('done', 304, 2))
+
+	def test_failure_keeps_the_stored_page(self):
+		stored = self.stored()
+		self.write(FetchResult(URL, http_status=500))
+		self.assertEqual(self.stored(), stored)
+		self.assertEqual(self.state(), ('failed', 500, 2))
+
+	def test_changed_page_replaces_the_stored_page(self):
+		self.write(FetchResult(URL, html='<html>p1 v2</html>', http_status=200, etag='"v2"'))
+		self.assertEqual(self.stored(), [(URL, b'<html>p1 v2</html>', '"v2"', None, hashlib.md5(b'<html>p1 v2</html>').hexdigest())])
+		self.assertEqual(self.state(), ('done', 200, 2))
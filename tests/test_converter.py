@@ -0,0 +1,149 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+import converter
+import frames
+from tests.legacy import legacy_csv_to_jsonl, legacy_jsonl_lines
+
+MODES = ['pc', 'pu', 'vc', 'vup', 'ap', 'pp']
+
+
+def bulk_frame(count=12):
+	# The columns csv_to_jsonl reads, with the numpy typed ones (bool, int, float) read_csv gives a real export
+	rows = list()
+	for i in range(count):
+		links = [f'https://cdn.shopify.com/p{i}.jpg', f'https://cdn.shopify.com/p{i}b.jpg'][:i % 3]
+		rows.append({
+			'Handle': f'product-{i}',
+			'Unique Handle': f'product-{i}',
+			'Title': f'Product {i}',
+			'Body (HTML)': f'<p>Pole is {i}", weight 3 lb</p>',
+			'Vendor': 'Trendtimes',
+			'Type': 'Flags',
+			'Tags': 'Flags, Poles',
+			'Status': 'active',
+			'SEO Title': f'Product {i}',
+			'SEO Description': '',
+			'enable_best_price (product.metafields.custom.enable_best_price)': i % 2 == 0,
+			'Option1 Name': 'Size' if i % 4 else '',
+			'Option1 Value': 10 + i,
+			'Option2 Name': '',
+			'Option2 Value': '',
+			'Option3 Name': '',
+			'Option3 Value': '',
+			'Variant SKU': 1000 + i,
+			'Variant Barcode': '',
+			'Variant Grams': 250.0 * i,
+			'Variant Weight Unit': ['lb', 'kg', 'stone'][i % 3],
+			'Variant Inventory Tracker': 'shopify',
+			'Variant Inventory Qty': 5 * i,
+			'Variant Inventory Policy': 'deny',
+			'Variant Price': 19.99 + i,
+			'Variant Compare At Price': 29.5 if i % 2 else None,
+			'Cost per item': 9.5 + i,
+			'id': f'gid://shopify/Product/{i}',
+			'variant_id': f'gid://shopify/ProductVariant/{i}',
+			'Link': links if links else '',
+			'Image Alt Text': [link.split('/')[-1] for link in links] if links else ''
+		})
+
+	return pd.DataFrame(rows)
+
+
+class CsvToJsonlTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.frame = bulk_frame()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def path(self, name):
+		return os.path.join(self.directory, name)
+
+	def read(self, name):
+		with open(self.path(name)) as file:
+			return file.read()
+
+	def convert(self, function, source, mode, **kwargs):
+		target = self.path(f'{function.__name__}_{os.path.basename(source)}_{mode}.jsonl')
+		with contextlib.redirect_stdout(io.StringIO()):
+			function(source, target, mode=mode, **kwargs)
+
+		return self.read(target)
+
+	def test_parquet_matches_legacy_csv(self):
+		# The same frame through the csv the old converter read and the Parquet the builders read
+		frames.save_frame(self.frame, self.path('bulk.csv'))
+		frames.save_frame(self.frame, self.path('bulk.parquet'))
+		for mode in MODES:
+			with self.subTest(mode=mode):
+				self.assertEqual(
+					self.convert(converter.csv_to_jsonl, self.path('bulk.parquet'), mode),
+					self.convert(legacy_csv_to_jsonl, self.path('bulk.csv'), mode)
+				)
+
+	def test_csv_matches_legacy_csv(self):
+		# A csv intermediate holds the lists as their repr, the images must still come through
+		frames.save_frame(self.frame, self.path('bulk.csv'))
+		for mode in MODES:
+			with self.subTest(mode=mode):
+				self.assertEqual(
+					self.convert(converter.csv_to_jsonl, self.path('bulk.csv'), mode),
+					self.convert(legacy_csv_to_jsonl, self.path('bulk.csv'), mode)
+				)
+		self.assertIn('"originalSource": "https://cdn.shopify.com/p1.jpg"', self.convert(converter.csv_to_jsonl, self.path('bulk.csv'), 'pu'))
+
+	def test_csv_chunks_match_legacy_csv(self):
+		# Blanks only in the last chunk make those columns float64 (and object) in a whole file read,
+		# the earlier chunks must not come out as int64 (and bool)
+		self.frame = bulk_frame(30)
+		for column in ['Variant SKU', 'Variant Barcode', 'Option1 Value', 'enable_best_price (product.metafields.custom.enable_best_price)']:
+			self.frame[column] = self.frame[column].astype(object)
+			self.frame.loc[25:, column] = None
+		self.frame['Variant Barcode'] = [1000 + i if i < 25 else None for i in range(30)]
+		frames.save_frame(self.frame, self.path('bulk.csv'))
+		for mode in MODES:
+			with self.subTest(mode=mode):
+				self.convert(legacy_csv_to_jsonl, self.path('bulk.csv'), mode)
+				self.assertEqual(
+					self.convert(converter.csv_to_jsonl, self.path('bulk.csv'), mode, chunk_size=10).splitlines(),
+					legacy_jsonl_lines(self.path(f'legacy_csv_to_jsonl_bulk.csv_{mode}.jsonl'))
+				)
+		self.assertIn('"barcode": "1000.0"', self.convert(converter.csv_to_jsonl, self.path('bulk.csv'), 'vup', chunk_size=10))
+
+	def test_metafield_value_is_a_string(self):
+		frames.save_frame(self.frame, self.path('bulk.parquet'))
+		lines = self.convert(converter.csv_to_jsonl, self.path('bulk.parquet'), 'pc').splitlines()
+		self.assertIn('"value": "True"', lines[0])
+		self.assertIn('"value": "False"', lines[1])
+		# Read as text from a column with blanks, which the old converter wrote as a json true
+		self.frame['enable_best_price (product.metafields.custom.enable_best_price)'] = ['True', ''] * 6
+		frames.save_frame(self.frame, self.path('text.csv'))
+		lines = self.convert(converter.csv_to_jsonl, self.path('text.csv'), 'pc').splitlines()
+		self.assertIn('"value": "True"', lines[0])
+		self.assertIn('"value": ""', lines[1])
+
+	def test_parts_split_under_max_bytes(self):
+		frames.save_frame(self.frame, self.path('bulk.parquet'))
+		whole = self.convert(converter.csv_to_jsonl, self.path('bulk.parquet'), 'pu')
+		max_bytes = 3 * max(len(line) + len(os.linesep) for line in whole.splitlines())
+		with contextlib.redirect_stdout(io.StringIO()):
+			paths = converter.csv_to_jsonl(self.path('bulk.parquet'), self.path('parts.jsonl'), mode='pu', max_bytes=max_bytes)
+		self.assertGreater(len(paths), 1)
+		self.assertTrue(all(os.path.getsize(path) <= max_bytes for path in paths))
+		self.assertEqual(''.join(self.read(os.path.basename(path)) for path in paths), whole)
+		# No part can take a line longer than max_bytes
+		with contextlib.redirect_stdout(io.StringIO()), self.assertRaises(ValueError):
+			converter.csv_to_jsonl(self.path('bulk.parquet'), self.path('tiny.jsonl'), mode='pu', max_bytes=10)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import duckdb
+
+from scraper import FTScraper, FetchResult
+
+logging.getLogger('scraper').setLevel(logging.WARNING)
+logging.getLogger('proxy_pool').setLevel(logging.WARNING)
+
+
+class RecordingScraper(FTScraper):
+	# Serves pages from memory and records every request as (url, etag). Urls in failing come back as
+	# a 500, a request carrying the etag of the stored copy as a 304
+
+	def setup(self, failing=(), interrupt_after=None):
+		self.failing = set(failing)
+		self.interrupt_after = interrupt_after
+		self.requests = list()
+
+		return self
+
+	def get_product_count(self, url):
+		return 2
+
+	def page(self, url):
+		if '?page=' in url:
+			page = url.rsplit('=', 1)[1]
+			return ''.join(f'<a class="item__name" href="/products/p{page}-{i}">' for i in range(3)).encode()
+
+		return f'<html>{url}</html>'.encode()
+
+	async def fetch_page(self, aclient, url, limit, policy, etag=None, last_modified=None):
+		if (self.interrupt_after is not None) and (len(self.requests) >= self.interrupt_after):
+			raise RuntimeError('interrupted')
+		self.requests.append((url, etag))
+		await asyncio.sleep(0)
+		if url in self.failing:
+			return FetchResult(url, http_status=500)
+		if etag == f'"{url}"':
+			return FetchResult(url, http_status=304)
+
+		return FetchResult(url, html=self.page(url), http_status=200, etag=f'"{url}"')
+
+
+class CrawlRunTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.database_name = os.path.join(self.directory, 'thelashop.db')
+		self.urls = [f'https://thelashop.com/products/p{i}' for i in range(6)]
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def scraper(self, **kwargs):
+		return RecordingScraper(proxies=['direct'], max_concurrency=3, initial_concurrency=3).setup(**kwargs)
+
+	def fetch(self, scraper, **kwargs):
+		return asyncio.run(scraper.fetch_all_to_db(self.urls, self.database_name, 'product_src', **kwargs))
+
+	def query(self, sql):
+		conn = duckdb.connect(self.database_name)
+		try:
+			return conn.execute(sql).fetchall()
+		finally:
+			conn.close()
+
+	def test_rerun_retries_only_failed_urls(self):
+		scraper = self.scraper(failing=self.urls[:2])
+		self.assertEqual(sorted(self.fetch(scraper)), self.urls[:2])
+		self.assertEqual(self.query("SELECT status, fetched, failed FROM crawl_runs"), [('partial', 6, 2)])
+
+		scraper = self.scraper()
+		self.assertEqual(self.fetch(scraper), [])
+		self.assertEqual(sorted(scraper.requests), [(url, None) for url in self.urls[:2]])
+		self.assertEqual(self.query("SELECT status, fetched, failed FROM crawl_runs"), [('success', 2, 0)])
+
+	def test_new_run_revalidates_done_urls(self):
+		self.fetch(self.scraper())
+		scraper = self.scraper()
+		self.fetch(scraper)
+		# Every page is asked for again with the validator of its stored copy, a 304 keeps the copy
+		self.assertEqual(sorted(scraper.requests), [(url, f'"{url}"') for url in self.urls])
+		self.assertEqual(self.query("SELECT count(*) FROM product_src WHERE html IS NOT NULL"), [(6,)])
+		self.assertEqual(self.query("SELECT DISTINCT status, http_status FROM crawl_state"), [('done', 304)])
+		self.assertEqual(self.query("SELECT status FROM crawl_runs"), [('success',), ('success',)])
+
+	def test_resume_false_starts_a_new_run(self):
+		self.fetch(self.scraper(failing=self.urls[:2]))
+		scraper = self.scraper()
+		self.fetch(scraper, resume=False)
+		self.assertEqual(sorted(url for url, _ in scraper.requests), self.urls)
+		self.assertEqual(self.query("SELECT status FROM crawl_runs ORDER BY started_at"), [('abandoned',), ('success',)])
+
+	def test_interrupted_run_is_resumed(self):
+		with self.assertRaises(Exception):
+			self.fetch(self.scraper(interrupt_after=3))
+		done = {url for url, in self.query("SELECT url FROM crawl_state WHERE status = 'done'")}
+		self.assertTrue(done)
+		self.assertEqual(self.query("SELECT status FROM crawl_runs"), [('running',)])
+
+		scraper = self.scraper()
+		self.fetch(scraper)
+		self.assertEqual(sorted(url for url, _ in scraper.requests), sorted(set(self.urls) - done))
+		self.assertEqual(self.query("SELECT status FROM crawl_runs"), [('success',)])
+
+	def test_crawl_rerun_retries_only_failed_products(self):
+		search_url = 'https://thelashop.com/collections/all'
+		failing = ['https://thelashop.com/products/p1-0', 'https://thelashop.com/products/p2-2']
+		scraper = self.scraper(failing=failing)
+		self.assertEqual(sorted(asyncio.run(scraper.crawl_to_db(search_url, self.database_name))), failing)
+		self.assertEqual(len(scraper.requests), 8)
+
+		scraper = self.scraper()
+		self.assertEqual(asyncio.run(scraper.crawl_to_db(search_url, self.database_name)), [])
+		# Listing pages done in the run are read back from search_src instead of being fetched
+		self.assertEqual(sorted(scraper.requests), [(url, None) for url in failing])
+		self.assertEqual(self.query("SELECT mode, status, discovered FROM crawl_runs"), [('crawl', 'success', 6)])
+
+		scraper = self.scraper()
+		asyncio.run(scraper.crawl_to_db(search_url, self.database_name))
+		self.assertEqual(len(scraper.requests), 8)
+		self.assertTrue(all(etag is not None for _, etag in scraper.requests))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+
+import duckdb
+
+from fetch_policy import ConcurrencyController
+from scraper import FTScraper, FetchResult, utc_now
+
+logging.getLogger('scraper').setLevel(logging.WARNING)
+
+
+class CrawlStateTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.conn = duckdb.connect(os.path.join(self.directory, 'thelashop.db'))
+		self.scraper = FTScraper()
+		self.scraper.create_tables(self.conn, 'product_src')
+		self.urls = [f'https://thelashop.com/products/p{i}' for i in range(4)]
+
+	def tearDown(self):
+		self.conn.close()
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def states(self):
+		return {url: (status, http_status, attempts) for url, status, http_status, attempts in self.conn.execute("SELECT url, status, http_status, attempts FROM crawl_state WHERE table_name = 'product_src'").fetchall()}
+
+	def test_pending_urls(self):
+		started_at = utc_now()
+		rows = self.scraper.pending_urls(self.conn, 'product_src', self.urls + self.urls[:1], started_at)
+		self.assertEqual(sorted(rows), [(url, None, None) for url in self.urls])
+		self.assertEqual(self.states(), {url: ('pending', None, 0) for url in self.urls})
+
+		self.scraper.write_pages(self.conn, 'product_src', [
+			FetchResult(self.urls[0], html=b'<html>0</html>', http_status=200, etag='"0"'),
+			FetchResult(self.urls[1], http_status=503),
+		])
+		self.assertEqual(self.states()[self.urls[0]], ('done', 200, 1))
+		self.assertEqual(self.states()[self.urls[1]], ('failed', 503, 1))
+		# The same run only has the failed and unfetched urls left
+		rows = self.scraper.pending_urls(self.conn, 'product_src', self.urls, started_at)
+		self.assertEqual(sorted(url for url, _, _ in rows), self.urls[1:])
+		# A later run revalidates the stored page with its validators, and keeps the states
+		rows = self.scraper.pending_urls(self.conn, 'product_src', self.urls, utc_now() + timedelta(seconds=1))
+		self.assertIn((self.urls[0], '"0"', None), rows)
+		self.assertEqual(len(rows), 4)
+		self.assertEqual(self.states()[self.urls[1]], ('failed', 503, 1))
+
+	def test_crawl_states(self):
+		started_at = utc_now()
+		self.scraper.pending_urls(self.conn, 'product_src', self.urls, started_at)
+		self.scraper.write_pages(self.conn, 'product_src', [FetchResult(self.urls[0], html=b'<html>0</html>', http_status=200, etag='"0"')])
+		states = self.scraper.crawl_states(self.conn, 'product_src')
+		self.assertEqual(states[self.urls[0]], ('done', '"0"', None))
+		self.assertEqual(states[self.urls[1]], ('pending', None, None))
+		states = self.scraper.crawl_states(self.conn, 'product_src', started_at=utc_now() + timedelta(seconds=1))
+		self.assertEqual(states[self.urls[0]], ('pending', '"0"', None))
+
+	def test_write_queue(self):
+		async def run():
+			page_queue = asyncio.Queue()
+			for i, url in enumerate(self.urls):
+				if i == 1:
+					page = FetchResult(url, http_status=304)
+				elif i == 2:
+					page = FetchResult(url, http_status=500)
+				else:
+					page = FetchResult(url, html=f'<html>{i}</html>'.encode(), http_status=200)
+				page_queue.put_nowait(('product_src', page))
+			page_queue.put_nowait(('search_src', FetchResult('https://thelashop.com/search?page=1', html=b'<html></html>', http_status=200)))
+			page_queue.put_nowait(None)
+			page_queue.put_nowait(None)
+
+			return await self.scraper.write_queue(self.conn, page_queue, 2, ConcurrencyController(), batch_size=2)
+
+		self.scraper.create_tables(self.conn, 'search_src')
+		stats = asyncio.run(run())
+		self.assertEqual(stats['product_src'], {'stored': 2, 'not_modified': 1, 'failed_urls': [self.urls[2]]})
+		self.assertEqual(stats['search_src'], {'stored': 1, 'not_modified': 0, 'failed_urls': []})
+		self.assertEqual(self.conn.execute("SELECT count(*) FROM product_src").fetchone()[0], 2)
+		self.assertEqual(self.conn.execute("SELECT count(*) FROM search_src").fetchone()[0], 1)
+		self.assertEqual({url: state[0] for url, state in self.states().items()}, {
+			self.urls[0]: 'done', self.urls[1]: 'done', self.urls[2]: 'failed', self.urls[3]: 'done',
+		})
+
+	def test_write_queue_keeps_pages_when_cancelled(self):
+		async def run():
+			page_queue = asyncio.Queue()
+			page_queue.put_nowait(('product_src', FetchResult(self.urls[0], html=b'<html>0</html>', http_status=200)))
+			writer = asyncio.create_task(self.scraper.write_queue(self.conn, page_queue, 1, ConcurrencyController(), batch_size=50))
+			await asyncio.sleep(0.01)
+			writer.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await writer
+
+		asyncio.run(run())
+		self.assertEqual(self.conn.execute("SELECT url FROM product_src").fetchall(), [(self.urls[0],)])
+		self.assertEqual(self.states(), {self.urls[0]: ('done', 200, 1)})
+
+	def test_attempts_count_every_write(self):
+		for http_status in (500, 503, 200):
+			html = b'<html></html>' if http_status == 200 else None
+			self.scraper.write_pages(self.conn, 'product_src', [FetchResult(self.urls[0], html=html, http_status=http_status)])
+		self.assertEqual(self.states(), {self.urls[0]: ('done', 200, 3)})
+		self.assertEqual(self.conn.execute("SELECT count(*) FROM product_src").fetchone()[0], 1)
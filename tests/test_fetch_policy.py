@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from httpx import ConnectError, HTTPStatusError, ReadTimeout, Request, Response
+
+from fetch_policy import ConcurrencyController, FetchPolicy, RetryBudget, TokenBucket
+
+logging.getLogger('fetch_policy').setLevel(logging.ERROR)
+
+
+class ConcurrencyControllerTest(unittest.IsolatedAsyncioTestCase):
+
+	def controller(self, **kwargs):
+		kwargs = {'min_limit': 2, 'max_limit': 8, 'initial_limit': 4, 'sample_size': 4, **kwargs}
+
+		return ConcurrencyController(**kwargs)
+
+	async def release(self, controller, latencies, **kwargs):
+		for latency in latencies:
+			await controller.acquire()
+			await controller.release(latency, **kwargs)
+
+	def test_initial_limit_is_clamped(self):
+		self.assertEqual(self.controller(initial_limit=20).window, 8)
+		self.assertEqual(self.controller(initial_limit=0).window, 2)
+
+	def test_p95_latency(self):
+		controller = self.controller()
+		self.assertEqual(controller.p95_latency(), 0.0)
+		controller._samples.extend((float(latency), False) for latency in range(1, 21))
+		self.assertEqual(controller.p95_latency(), 19.0)
+
+	async def test_healthy_windows_increase_up_to_max_limit(self):
+		controller = self.controller()
+		await self.release(controller, [0.1] * 3)
+		self.assertEqual(controller.window, 4)
+		await self.release(controller, [0.1])
+		self.assertEqual(controller.window, 5)
+		await self.release(controller, [0.1] * 40)
+		self.assertEqual(controller.window, 8)
+		self.assertEqual(controller.in_flight, 0)
+
+	async def test_slow_window_decreases(self):
+		controller = self.controller(latency_target=1.0)
+		await self.release(controller, [0.1, 0.1, 0.1, 2.0])
+		self.assertEqual(controller.window, 2)
+
+	async def test_errors_hold_the_window(self):
+		controller = self.controller()
+		await self.release(controller, [0.1] * 4, failed=True)
+		self.assertEqual(controller.window, 4)
+
+	async def test_congestion_decreases_once_per_round_trip(self):
+		controller = self.controller(initial_limit=8)
+		await self.release(controller, [0.1], congested=True)
+		self.assertEqual(controller.window, 4)
+		# A 429 for a request sent before the last decrease belongs to the same congestion event
+		await self.release(controller, [1000.0], congested=True)
+		self.assertEqual(controller.window, 4)
+		await self.release(controller, [0.0], congested=True)
+		self.assertEqual(controller.window, 2)
+		await self.release(controller, [0.0], congested=True)
+		self.assertEqual(controller.window, 2)
+
+	async def test_congestion_drops_samples(self):
+		controller = self.controller()
+		await self.release(controller, [0.1] * 3)
+		await self.release(controller, [0.0], congested=True)
+		self.assertEqual(len(controller._samples), 0)
+
+	async def test_slot_classifies_the_response(self):
+		cases = [(429, None, 4), (503, None, 4), (None, ReadTimeout('timeout'), 4), (404, None, 8), (200, None, 8)]
+		for status_code, error, window in cases:
+			controller = self.controller(initial_limit=8)
+			try:
+				async with controller.slot() as slot:
+					slot.status_code = status_code
+					if error is not None:
+						raise error
+			except ReadTimeout:
+				pass
+			self.assertEqual(controller.window, window, status_code)
+			self.assertEqual(controller.in_flight, 0)
+
+	async def test_acquire_waits_for_a_free_slot(self):
+		controller = self.controller(initial_limit=2)
+		in_flight = list()
+
+		async def worker():
+			await controller.acquire()
+			in_flight.append(controller.in_flight)
+			await asyncio.sleep(0.01)
+			await controller.release(0.01)
+
+		await asyncio.gather(*(worker() for _ in range(5)))
+		self.assertEqual(max(in_flight), 2)
+		self.assertEqual(len(in_flight), 5)
+
+
+
+class Clock:
+	# Stands in for time.monotonic and asyncio.sleep, a sleep advances the clock at once
+
+	def __init__(self):
+		self.now = 1000.0
+		self.sleeps = list()
+
+	def monotonic(self):
+		return self.now
+
+	async def sleep(self, seconds):
+		self.sleeps.append(seconds)
+		self.now += seconds
+
+
+def status_error(status_code, headers=None):
+	request = Request('GET', 'https://thelashop.com/products/p1')
+
+	return HTTPStatusError(str(status_code), request=request, response=Response(status_code, headers=headers, request=request))
+
+
+class FetchPolicyTest(unittest.IsolatedAsyncioTestCase):
+
+	def setUp(self):
+		self.clock = Clock()
+		for target, value in (('fetch_policy.time', SimpleNamespace(monotonic=self.clock.monotonic)), ('fetch_policy.asyncio.sleep', self.clock.sleep)):
+			patch = mock.patch(target, value)
+			patch.start()
+			self.addCleanup(patch.stop)
+
+	async def test_token_bucket_refills_at_rate(self):
+		bucket = TokenBucket(rate=2.0, capacity=3)
+		for _ in range(3):
+			await bucket.take()
+		self.assertEqual(self.clock.sleeps, [])
+		await bucket.take()
+		self.assertEqual(self.clock.sleeps, [0.5])
+		# Idle time refills the bucket up to capacity only
+		self.clock.now += 10
+		for _ in range(4):
+			await bucket.take()
+		self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+	def test_retry_budget(self):
+		budget = RetryBudget(ratio=0.2, min_retries=2)
+		self.assertTrue(budget.can_retry())
+		budget.retries = 2
+		self.assertFalse(budget.can_retry())
+		budget.requests = 4
+		self.assertTrue(budget.can_retry())
+		budget.retries = 3
+		self.assertFalse(budget.can_retry())
+
+	def test_backoff_is_capped(self):
+		policy = FetchPolicy(backoff_base=1.0, backoff_cap=5.0)
+		with mock.patch('fetch_policy.random.uniform', lambda low, high: high):
+			self.assertEqual([policy.backoff(attempt) for attempt in range(1, 6)], [1.0, 2.0, 4.0, 5.0, 5.0])
+
+	def test_is_retryable(self):
+		policy = FetchPolicy()
+		self.assertTrue(policy.is_retryable(status_error(429)))
+		self.assertTrue(policy.is_retryable(status_error(503)))
+		self.assertFalse(policy.is_retryable(status_error(404)))
+		self.assertTrue(policy.is_retryable(ConnectError('refused')))
+		self.assertTrue(policy.is_retryable(ReadTimeout('timeout')))
+
+	def test_retry_after(self):
+		policy = FetchPolicy(backoff_cap=30.0)
+		self.assertEqual(policy.retry_after(status_error(429, {'retry-after': '7'})), 7.0)
+		self.assertEqual(policy.retry_after(status_error(429, {'retry-after': '600'})), 30.0)
+		self.assertIsNone(policy.retry_after(status_error(429, {'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'})))
+		self.assertIsNone(policy.retry_after(status_error(503)))
+		self.assertIsNone(policy.retry_after(ConnectError('refused')))
+
+	def sender(self, *errors):
+		errors = list(errors)
+		calls = list()
+
+		async def send():
+			calls.append(self.clock.now)
+			if errors:
+				raise errors.pop(0)
+			return 'ok'
+
+		return send, calls
+
+	async def test_call_retries_until_success(self):
+		policy = FetchPolicy(burst=100, backoff_base=0.0)
+		send, calls = self.sender(status_error(429, {'retry-after': '3'}), ConnectError('refused'))
+		self.assertEqual(await policy.call('https://thelashop.com/products/p1', send), 'ok')
+		self.assertEqual(len(calls), 3)
+		self.assertEqual(self.clock.sleeps, [3.0, 0.0])
+		self.assertEqual(policy.retries, 2)
+
+	async def test_call_gives_up(self):
+		policy = FetchPolicy(burst=100, max_attempts=3, backoff_base=0.0)
+		send, calls = self.sender(*[status_error(503)] * 5)
+		with self.assertRaises(HTTPStatusError):
+			await policy.call('https://thelashop.com/products/p1', send)
+		self.assertEqual(len(calls), 3)
+
+		send, calls = self.sender(status_error(404))
+		with self.assertRaises(HTTPStatusError):
+			await policy.call('https://thelashop.com/products/p2', send)
+		self.assertEqual(len(calls), 1)
+
+	async def test_call_respects_the_retry_budget(self):
+		policy = FetchPolicy(burst=100, max_attempts=10, backoff_base=0.0)
+		budget = policy.budget('thelashop.com')
+		budget.min_retries = 1
+		send, calls = self.sender(*[status_error(503)] * 5)
+		with self.assertRaises(HTTPStatusError):
+			await policy.call('https://thelashop.com/products/p1', send)
+		# One first attempt allows min_retries + 0.2 retries
+		self.assertEqual(len(calls), 3)
+		self.assertEqual(budget.requests, 1)
+		self.assertEqual(budget.retries, 2)
+
+	async def test_hosts_are_limited_separately(self):
+		policy = FetchPolicy(requests_per_second=1.0, burst=1)
+		send, _ = self.sender()
+		await policy.call('https://thelashop.com/products/p1', send)
+		await policy.call('https://cdn.shopify.com/p1.jpg', send)
+		self.assertEqual(self.clock.sleeps, [])
+		await policy.call('https://thelashop.com/products/p2', send)
+		self.assertEqual(self.clock.sleeps, [1.0])
+		self.assertIs(policy.bucket('thelashop.com'), policy.bucket('thelashop.com'))
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from frames import iter_frames, load_frame, save_frame
+
+
+class FramesTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def path(self, name):
+		return os.path.join(self.directory, name)
+
+	def test_parquet_round_trip(self):
+		df = pd.DataFrame({
+			'Handle': ['a', 'b', 'c'],
+			'handle': ['x', None, 'z'],
+			"Title's": ['', 't', 'u'],
+			'Price': [1.5, np.nan, 2.0],
+			'Qty': [1, 2, 3],
+			'Grams': pd.Series([10, '', 30], dtype=object),
+			'Published': pd.Series([True, '', False], dtype=object),
+			'Images': [['i1', 'i2'], [], None],
+			'Ids': [[1, 2], None, [3]],
+			'Mixed': pd.Series([1, 'x', 2.5], dtype=object),
+		})
+		path = self.path('products.parquet')
+		save_frame(df, path)
+		loaded = load_frame(path)
+		# Names that only differ in case or need quoting are kept, missing values and mixed columns
+		# come back the way a csv round trip would have them
+		expected = pd.DataFrame({
+			'Handle': ['a', 'b', 'c'],
+			'handle': ['x', None, 'z'],
+			"Title's": ['', 't', 'u'],
+			'Price': [1.5, np.nan, 2.0],
+			'Qty': [1, 2, 3],
+			'Grams': [10.0, np.nan, 30.0],
+			'Published': pd.Series([True, np.nan, False], dtype=object),
+			'Images': [['i1', 'i2'], [], None],
+			'Ids': [[1, 2], None, [3]],
+			'Mixed': ['1', 'x', '2.5'],
+		})
+		pd.testing.assert_frame_equal(loaded, expected)
+		self.assertEqual(load_frame(path, columns=['Qty', 'handle', 'Handle']).columns.tolist(), ['Handle', 'handle', 'Qty'])
+
+	def test_files_without_names(self):
+		# Parquet files save_frame did not write keep the DuckDB column names
+		path = self.path('external.parquet')
+		conn = duckdb.connect()
+		try:
+			conn.execute(f"COPY (SELECT 1 AS handle, 'a' AS title) TO '{path}' (FORMAT parquet)")
+		finally:
+			conn.close()
+		pd.testing.assert_frame_equal(load_frame(path), pd.DataFrame({'handle': pd.Series([1], dtype='int32'), 'title': ['a']}))
+
+	def test_csv_paths_stay_csv(self):
+		df = pd.DataFrame({'Handle': ['a', 'b'], 'Price': [1.5, 2.0]})
+		path = self.path('products.csv')
+		save_frame(df, path)
+		with open(path) as file:
+			self.assertEqual(file.readline().strip(), 'Handle,Price')
+		pd.testing.assert_frame_equal(load_frame(path), df)
+
+	def test_iter_parquet_matches_load(self):
+		n = 5000
+		df = pd.DataFrame({
+			'Handle': [f'p{i}' for i in range(n)],
+			# NULLs only in the last chunk
+			'Qty': pd.Series([i if i < n - 10 else '' for i in range(n)], dtype=object),
+			'Published': pd.Series([i % 2 == 0 if i < n - 10 else '' for i in range(n)], dtype=object),
+			'Images': [[f'i{i}'] if i % 3 else None for i in range(n)],
+		})
+		path = self.path('products.parquet')
+		save_frame(df, path)
+		chunks = list(iter_frames(path, chunk_size=2048))
+		self.assertEqual([len(chunk) for chunk in chunks], [2048, 2048, 904])
+		pd.testing.assert_frame_equal(pd.concat(chunks), load_frame(path))
+		pd.testing.assert_frame_equal(pd.concat(iter_frames(path, columns=['Images', 'Handle'], chunk_size=2048)), load_frame(path, columns=['Handle', 'Images']))
+
+	def test_iter_csv_matches_read_csv(self):
+		n = 250
+		df = pd.DataFrame({
+			'Handle': [f'p{i}' for i in range(n)],
+			'Qty': [i if i < n - 10 else None for i in range(n)],
+			'Price': [i if i < 100 else i + 0.5 for i in range(n)],
+			'Published': [i % 2 == 0 if i < n - 10 else None for i in range(n)],
+			'Barcode': [str(i) if i < 200 else f'x{i}' for i in range(n)],
+			'Flag': [True if i < 100 else i for i in range(n)],
+		})
+		path = self.path('products.csv')
+		df.to_csv(path, index=False)
+		chunks = list(iter_frames(path, chunk_size=50))
+		self.assertEqual(len(chunks), 5)
+		pd.testing.assert_frame_equal(pd.concat(chunks), pd.read_csv(path))
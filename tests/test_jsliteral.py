@@ -0,0 +1,78 @@
+import unittest
+
+import jsliteral
+from scraper import FTScraper
+
+
+class InchMarkTest(unittest.TestCase):
+	# A quote followed by a delimiter inside product copy (5", ...) used to end the string there
+
+	def test_inch_mark_in_description(self):
+		value = jsliteral.loads('{name: "Pole", description: "Pole is 5", Weight: 3 lb ...", sku: "A1", offers: {price: "1.00"}}')
+		self.assertEqual(value['description'], 'Pole is 5", Weight: 3 lb ...')
+		self.assertEqual(value['sku'], 'A1')
+		self.assertEqual(value['offers'], {'price': '1.00'})
+
+	def test_inch_mark_in_array(self):
+		self.assertEqual(jsliteral.loads('["5", 6" tall", "x"]'), ['5", 6" tall', 'x'])
+
+	def test_malformed_literal_still_fails(self):
+		with self.assertRaises(jsliteral.JSLiteralError):
+			jsliteral.loads('{a: "5", b: 2 c}')
+
+	def test_extract_product_data(self):
+		script = 'var seo_html = {"name": "Flag Pole", "description": "Pole is 5", Weight: 3 lb", "sku": "FP-5", "brand": {"name": "Trendtimes"}, "offers": {"price": "19.99"}};'
+		data = FTScraper().extract_product_data(script)
+		self.assertEqual(data['Description'], 'Pole is 5", Weight: 3 lb')
+		self.assertEqual(data['SKU'], 'FP-5')
+		self.assertEqual(data['Price'], '19.99')
+
+	def test_unreadable_page_is_skipped(self):
+		class Scraper(FTScraper):
+			def parse_product_html(self, url, html, product_schema):
+				if url.endswith('bad'):
+					raise jsliteral.JSLiteralError('Expecting value', html, 0)
+				return {'Handle': url}
+
+		rows = [('https://thelashop.com/products/good', 'html', 'x', None, None), ('https://thelashop.com/products/bad', 'html', 'x', None, None)]
+		self.assertEqual(Scraper().parse_rows(rows, None), [{'Handle': 'https://thelashop.com/products/good'}, None])
+
+
+
+class ScanTest(unittest.TestCase):
+	# scan() is the fast path of raw_decode, Parser the reference it falls back to
+
+	LITERALS = [
+		"{\n  name: 'Product 0',\n  \"description\": \"A \"great\" thing\nline two\",\n  brand: {name: `Brand 0`},\n  offers: {price: '19.99',},\n}",
+		'{a: [1, -2.5, 0x1F, .5, 1e3, true, null, undefined, [], {}], "b": {"c": "d"}}',
+		'{"s": "tab\\t \\u00e9 \\x41 \\/ \\\\", \'q\': \'it\\\'s\', 1: "one"}',
+		'["x", [\'y\', [`z`,],], {}]',
+		'"top"'
+	]
+	FALLBACKS = [
+		'{name: "Pole is 5", Weight: 3 lb", sku: "A1"}',
+		'{a: 1 /* comment */, b: 2}',
+		'{emoji: "\\ud83d\\ude00"}'
+	]
+
+	def test_matches_parser(self):
+		for text in self.LITERALS + self.FALLBACKS:
+			with self.subTest(text=text):
+				self.assertEqual(repr(jsliteral.raw_decode(text)), repr(jsliteral.Parser(text).value(0)))
+
+	def test_common_literals_take_the_fast_path(self):
+		for text in self.LITERALS:
+			with self.subTest(text=text):
+				self.assertEqual(jsliteral.scan(text, 0), jsliteral.Parser(text).value(0))
+		for text in self.FALLBACKS:
+			with self.subTest(text=text), self.assertRaises(jsliteral.Fallback):
+				jsliteral.scan(text, 0)
+
+	def test_errors_come_from_parser(self):
+		for text in ['{a: 1,, b: 2}', '[1 }', '{a 1}', '"open']:
+			with self.subTest(text=text), self.assertRaises(jsliteral.JSLiteralError):
+				jsliteral.loads(text)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,101 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import duckdb
+
+import jsliteral
+from scraper import FTScraper, FetchResult
+
+logging.getLogger('scraper').setLevel(logging.CRITICAL)
+
+
+class CountingScraper(FTScraper):
+	# Parses a page into a record of its url and body, and counts the pages it had to parse. Bodies
+	# containing 'broken' fail like a page whose script cannot be read
+
+	def setup(self):
+		self.parsed = list()
+
+		return self
+
+	def parse_product_html(self, url, html, product_schema):
+		self.parsed.append(url)
+		if b'broken' in html:
+			raise jsliteral.JSLiteralError('broken script', html.decode(), 0)
+		record = product_schema.new_record()
+		record['Handle'] = url.rsplit('/', 1)[-1]
+		record['Body (HTML)'] = html.decode()
+
+		return record
+
+
+class ParseCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.conn = duckdb.connect(os.path.join(self.directory, 'thelashop.db'))
+		self.scraper = CountingScraper().setup()
+		self.scraper.create_tables(self.conn, 'product_src')
+		self.urls = [f'https://thelashop.com/products/p{i}' for i in range(5)]
+		self.write({url: f'<html>{url} v1</html>' for url in self.urls})
+
+	def tearDown(self):
+		self.conn.close()
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def write(self, pages):
+		self.scraper.write_pages(self.conn, 'product_src', [FetchResult(url, html=html.encode(), http_status=200) for url, html in pages.items()])
+
+	def parse(self, **kwargs):
+		self.scraper.parsed = list()
+		query = self.scraper.product_query(self.conn)
+		records = [record for records in self.scraper.parse_products(self.conn, query, chunk_size=2, incremental=True, **kwargs) for record in records]
+
+		return {record['Handle']: record['Body (HTML)'] for record in records}
+
+	def cached(self):
+		return dict(self.conn.execute("SELECT url, content_hash FROM product_parsed").fetchall())
+
+	def test_unchanged_pages_are_not_parsed_again(self):
+		first = self.parse()
+		self.assertEqual(sorted(self.scraper.parsed), self.urls)
+		self.assertEqual(self.cached(), dict(self.conn.execute("SELECT url, content_hash FROM product_src").fetchall()))
+
+		self.assertEqual(self.parse(), first)
+		self.assertEqual(self.scraper.parsed, [])
+
+	def test_changed_pages_are_parsed_again(self):
+		self.parse()
+		hashes = self.cached()
+		self.write({self.urls[1]: f'<html>{self.urls[1]} v2</html>'})
+		records = self.parse()
+		self.assertEqual(self.scraper.parsed, [self.urls[1]])
+		self.assertEqual(records['p1'], f'<html>{self.urls[1]} v2</html>')
+		self.assertEqual(len(records), 5)
+		self.assertNotEqual(self.cached()[self.urls[1]], hashes[self.urls[1]])
+		# A 304 or a refetch of the same body keeps the cached record
+		self.write({self.urls[2]: f'<html>{self.urls[2]} v1</html>'})
+		self.parse()
+		self.assertEqual(self.scraper.parsed, [])
+
+	def test_stale_only(self):
+		self.parse()
+		self.write({self.urls[3]: f'<html>{self.urls[3]} v2</html>'})
+		self.assertEqual(self.parse(stale_only=True), {'p3': f'<html>{self.urls[3]} v2</html>'})
+
+	def test_rows_without_content_hash(self):
+		self.parse()
+		# Rows stored before content_hash existed match the cache on the hash of their body
+		self.conn.execute("UPDATE product_src SET content_hash = NULL")
+		self.parse()
+		self.assertEqual(self.scraper.parsed, [])
+
+	def test_skipped_pages_are_not_cached(self):
+		self.write({self.urls[4]: '<html>broken</html>'})
+		self.assertNotIn('p4', self.parse())
+		self.assertNotIn(self.urls[4], self.cached())
+		self.parse()
+		self.assertEqual(self.scraper.parsed, [self.urls[4]])
@@ -0,0 +1,69 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import duckdb
+
+from scraper import FTScraper, FetchResult
+
+logging.getLogger('scraper').setLevel(logging.CRITICAL)
+
+
+class PageScraper(FTScraper):
+	# Parses a page into a record of its url and body, process pool workers import it from this module
+
+	def parse_product_html(self, url, html, product_schema):
+		record = product_schema.new_record()
+		record['Handle'] = url.rsplit('/', 1)[-1]
+		record['Body (HTML)'] = html.decode()
+
+		return record
+
+
+class ParseProductsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.conn = duckdb.connect(os.path.join(self.directory, 'thelashop.db'))
+		self.scraper = PageScraper()
+		self.scraper.create_tables(self.conn, 'product_src')
+		self.urls = [f'https://thelashop.com/products/p{i:02}' for i in range(23)]
+		# Written in reverse so table order differs from url order
+		self.scraper.write_pages(self.conn, 'product_src', [FetchResult(url, html=f'<html>{url}</html>'.encode(), http_status=200) for url in reversed(self.urls)])
+
+	def tearDown(self):
+		self.conn.close()
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def batches(self, **kwargs):
+		query = self.scraper.product_query(self.conn)
+
+		return [[record['Handle'] for record in records] for records in self.scraper.parse_products(self.conn, query, **kwargs)]
+
+	def test_batches(self):
+		# Rows are pulled chunk_size at a time and parsed in table order
+		batches = self.batches(chunk_size=5)
+		self.assertEqual([len(batch) for batch in batches], [5, 5, 5, 5, 3])
+		self.assertEqual(batches[0], ['p22', 'p21', 'p20', 'p19', 'p18'])
+
+		curr = self.conn.cursor()
+		try:
+			curr.execute("SELECT url FROM product_src ORDER BY rowid")
+			self.assertEqual([len(rows) for rows in self.scraper.iter_batches(curr, 10)], [10, 10, 3])
+		finally:
+			curr.close()
+
+	def test_changed_only(self):
+		self.scraper.write_pages(self.conn, 'product_src', [FetchResult(url, http_status=304) for url in self.urls[1:]])
+		query = self.scraper.product_query(self.conn, changed_only=True)
+		records = [record for records in self.scraper.parse_products(self.conn, query) for record in records]
+		self.assertEqual([record['Handle'] for record in records], ['p00'])
+
+	def test_workers_keep_table_order(self):
+		expected = [url.rsplit('/', 1)[-1] for url in reversed(self.urls)]
+		for incremental in (False, True, True):
+			batches = self.batches(workers=3, chunk_size=2, incremental=incremental)
+			self.assertEqual(sum(batches, []), expected)
+			self.assertEqual(batches, self.batches(workers=1, chunk_size=2, incremental=incremental))
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import duckdb
+
+from scraper import FTScraper, FetchResult
+
+logging.getLogger('scraper').setLevel(logging.WARNING)
+logging.getLogger('proxy_pool').setLevel(logging.WARNING)
+
+SEARCH_URL = 'https://thelashop.com/collections/all'
+
+
+class ListingScraper(FTScraper):
+	# Three listing pages, the last one slow, that share some products. Records the order in which
+	# requests start and finish
+
+	def setup(self):
+		self.events = list()
+
+		return self
+
+	def get_product_count(self, url):
+		return 3
+
+	def page(self, url):
+		if '?page=' in url:
+			page = int(url.rsplit('=', 1)[1])
+			return ''.join(f'<a class="item__name" href="/products/p{i}">' for i in range(page, page + 3)).encode()
+
+		return f'<html>{url}</html>'.encode()
+
+	async def fetch_page(self, aclient, url, limit, policy, etag=None, last_modified=None):
+		self.events.append(('start', url, etag))
+		await asyncio.sleep(0.05 if url.endswith('?page=3') else 0)
+		self.events.append(('end', url, etag))
+		if etag == f'"{url}"':
+			return FetchResult(url, http_status=304, etag=etag)
+
+		return FetchResult(url, html=self.page(url), http_status=200, etag=f'"{url}"')
+
+
+class PipelinedCrawlTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.database_name = os.path.join(self.directory, 'thelashop.db')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def crawl(self, **kwargs):
+		scraper = ListingScraper(proxies=['direct'], max_concurrency=4, initial_concurrency=4).setup()
+		failed_urls = asyncio.run(scraper.crawl_to_db(SEARCH_URL, self.database_name, **kwargs))
+
+		return scraper, failed_urls
+
+	def products(self, events, kind='start'):
+		return [url for event, url, _ in events if (event == kind) and ('/products/' in url)]
+
+	def test_products_are_fetched_while_listing(self):
+		scraper, failed_urls = self.crawl()
+		self.assertEqual(failed_urls, [])
+		# Five distinct products on three listing pages, each fetched once
+		self.assertEqual(sorted(self.products(scraper.events)), [f'https://thelashop.com/products/p{i}' for i in range(1, 6)])
+		last_listing = scraper.events.index(('end', f'{SEARCH_URL}?page=3', None))
+		self.assertTrue(self.products(scraper.events[:last_listing], 'end'))
+
+		conn = duckdb.connect(self.database_name)
+		try:
+			counts = [conn.execute(f"SELECT count(*) FROM {table_name}").fetchone()[0] for table_name in ('search_src', 'product_src')]
+			run = conn.execute("SELECT status, discovered, fetched, failed FROM crawl_runs WHERE mode = 'crawl'").fetchall()
+		finally:
+			conn.close()
+		self.assertEqual(counts, [3, 5])
+		self.assertEqual(run, [('success', 5, 8, 0)])
+
+	def test_not_modified_listing_pages_are_read_back(self):
+		self.crawl()
+		scraper, _ = self.crawl(resume=False)
+		# Every listing page comes back as a 304, the products are found on the stored copies
+		self.assertEqual(len(self.products(scraper.events)), 5)
+		self.assertTrue(all(etag is not None for event, _, etag in scraper.events))
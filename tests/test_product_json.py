@@ -0,0 +1,92 @@
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import duckdb
+
+from records import ProductSchema
+from scraper import FTScraper, FetchResult
+
+logging.getLogger('scraper').setLevel(logging.WARNING)
+
+URL = 'https://thelashop.com/products/mink-lashes'
+PAYLOAD = {
+	'title': 'Mink Lashes',
+	'description': '<p>Soft <b>lashes</b></p>',
+	'vendor': 'The Lash Shop',
+	'type': 'Lashes',
+	'tags': ['mink', 'volume'],
+	'options': [{'name': 'Length'}, {'name': 'Curl'}],
+	'variants': [
+		{'option1': '10mm', 'option2': 'C', 'sku': 'ML-10-C', 'price': 1999, 'compare_at_price': 2499, 'available': True, 'featured_image': {'src': '//cdn.shopify.com/v1.jpg'}},
+		{'option1': '12mm', 'option2': 'D', 'sku': 'ML-12-D', 'price': 0, 'compare_at_price': None, 'available': False, 'requires_shipping': False, 'taxable': False},
+	],
+	'images': ['//cdn.shopify.com/files/a.jpg?v=1', {'src': 'https://cdn.shopify.com/files/b.jpg'}],
+}
+
+
+class ParseProductJsonTest(unittest.TestCase):
+
+	def parse(self, payload, url=URL):
+		with contextlib.redirect_stdout(io.StringIO()):
+			return FTScraper().parse_product_json(url, json.dumps(payload).encode(), ProductSchema.load())
+
+	def test_product(self):
+		record = self.parse(PAYLOAD)
+		self.assertEqual(record['Handle'], 'mink-lashes')
+		self.assertEqual(record['Title'], 'Mink Lashes')
+		self.assertEqual(record['Body (HTML)'], '<p>Soft <b>lashes</b></p>')
+		self.assertEqual((record['Vendor'], record['Product Category'], record['Type']), ('The Lash Shop', 'Lashes', 'Lashes'))
+		self.assertEqual(record['Tags'], 'mink, volume')
+		self.assertEqual((record['Option1 Name'], record['Option2 Name'], record['Option3 Name']), ('Length', 'Curl', ''))
+		self.assertEqual(record['Option1 Value'], ['10mm', '12mm'])
+		self.assertEqual(record['Option2 Value'], ['C', 'D'])
+		self.assertEqual(record['Option3 Value'], '')
+		self.assertEqual(record['Variant SKU'], ['ML-10-C', 'ML-12-D'])
+		self.assertEqual(record['Variant Inventory Qty'], [10, 0])
+		self.assertEqual(record['Cost per item'], [19.99, 0.0])
+		self.assertEqual(record['Variant Price'], ['18.99', '0.00'])
+		self.assertEqual(record['Variant Compare At Price'], [24.99, ''])
+		self.assertEqual(record['Variant Requires Shipping'], [True, False])
+		self.assertEqual(record['Variant Taxable'], [True, False])
+		self.assertEqual(record['Variant Image'], ['https://cdn.shopify.com/v1.jpg', ''])
+		self.assertEqual(record['Image Src'], ['https://cdn.shopify.com/files/a.jpg?v=1', 'https://cdn.shopify.com/files/b.jpg'])
+		self.assertEqual(record['Image Alt Text'], ['a.jpg', 'b.jpg'])
+
+	def test_default_title_is_no_option(self):
+		payload = dict(PAYLOAD, options=['Title'], variants=[{'title': 'Default Title', 'option1': 'Default Title', 'sku': 'ML', 'price': 500}])
+		record = self.parse(payload)
+		self.assertEqual(record['Option1 Name'], '')
+		self.assertEqual(record['Option1 Value'], '')
+		self.assertEqual(record['Variant SKU'], ['ML'])
+
+	def test_json_url(self):
+		scraper = FTScraper()
+		self.assertEqual(scraper.product_json_url(f'{URL}?variant=1'), f'{URL}.js')
+		self.assertEqual(scraper.product_json_url(f'{URL}/'), f'{URL}.js')
+
+
+class JsonSourceTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.conn = duckdb.connect(os.path.join(self.directory, 'thelashop.db'))
+
+	def tearDown(self):
+		self.conn.close()
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def test_pages_without_payload_fall_back_to_html(self):
+		scraper = FTScraper()
+		other = 'https://thelashop.com/products/glue'
+		for table_name in ('product_src', 'product_json_src'):
+			scraper.create_tables(self.conn, table_name)
+		scraper.write_pages(self.conn, 'product_src', [FetchResult(url, html=b'<html></html>', http_status=200) for url in (URL, other)])
+		scraper.write_pages(self.conn, 'product_json_src', [FetchResult(f'{URL}.js', html=b'{}', http_status=200)])
+		rows = self.conn.execute(f"SELECT url, format, html FROM ({scraper.product_query(self.conn, source='json')}) ORDER BY part, row_order").fetchall()
+		self.assertEqual(rows, [(URL, 'json', b'{}'), (other, 'html', b'<html></html>')])
@@ -0,0 +1,153 @@
+import logging
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from httpx import ConnectError, MockTransport, Response
+
+from proxy_pool import DEFAULT_PROXIES, ProxyPool, ProxyState, load_proxies
+
+logging.getLogger('proxy_pool').setLevel(logging.ERROR)
+
+
+class LoadProxiesTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cwd = os.getcwd()
+		os.chdir(self.directory)
+		self.addCleanup(os.chdir, self.cwd)
+		patch = mock.patch.dict(os.environ)
+		patch.start()
+		self.addCleanup(patch.stop)
+		os.environ.pop('PROXIES', None)
+
+	def test_fallbacks(self):
+		self.assertEqual(load_proxies(), list(DEFAULT_PROXIES))
+		with open('proxies.txt', 'w') as file:
+			file.write('# pool\nhttp://a:1\n\n  http://b:2 \n')
+		self.assertEqual(load_proxies(), ['http://a:1', 'http://b:2'])
+		os.environ['PROXIES'] = 'http://c:3, direct,'
+		self.assertEqual(load_proxies(), ['http://c:3', 'direct'])
+		self.assertEqual(load_proxies(proxy_file='proxies.txt'), ['http://a:1', 'http://b:2'])
+		self.assertEqual(load_proxies(['direct']), ['direct'])
+
+
+class ProxyPoolTest(unittest.TestCase):
+
+	def setUp(self):
+		self.now = 1000.0
+		patch = mock.patch('proxy_pool.time', SimpleNamespace(monotonic=lambda: self.now))
+		patch.start()
+		self.addCleanup(patch.stop)
+
+	def pool(self, proxies=('a', 'b'), **kwargs):
+		return ProxyPool(list(proxies), **kwargs)
+
+	def test_needs_a_proxy(self):
+		with self.assertRaises(ValueError):
+			ProxyPool([])
+
+	def test_score(self):
+		state = ProxyState('a')
+		self.assertEqual(state.score(2.0), 2.0)
+		state.latency, state.requests, state.failures, state.in_flight = 0.5, 4, 1, 1
+		self.assertEqual(state.error_rate, 0.25)
+		self.assertEqual(state.score(2.0), 0.5 * 2 * 2)
+
+	def test_choose_the_better_of_two(self):
+		pool = self.pool()
+		pool.record(pool.states['a'], 0.1, True)
+		pool.record(pool.states['b'], 1.0, True)
+		self.assertEqual({pool.choose().url for _ in range(20)}, {'a'})
+		# Requests already queued on a proxy count against it
+		pool.states['a'].in_flight = 10
+		self.assertEqual(pool.choose().url, 'b')
+		# A proxy without latency samples is scored as the fastest known one
+		pool = self.pool(('a', 'b', 'c'))
+		pool.record(pool.states['a'], 0.1, True)
+		pool.states['a'].in_flight = 1
+		with mock.patch('proxy_pool.random.sample', lambda candidates, k: candidates[:k]):
+			self.assertEqual(pool.choose().url, 'b')
+
+	def test_cooldown_doubles_and_is_capped(self):
+		pool = self.pool(failure_threshold=2, cooldown=30, max_cooldown=100)
+		state = pool.states['a']
+		pool.record(state, 0.1, False)
+		self.assertEqual(state.cooldown_until, 0.0)
+		delays = list()
+		for _ in range(4):
+			pool.record(state, 0.1, False)
+			delays.append(state.cooldown_until - self.now)
+		self.assertEqual(delays, [30, 60, 100, 100])
+		self.assertEqual(state.cooldowns, 4)
+		self.assertEqual([healthy.url for healthy in pool.healthy()], ['b'])
+		self.assertEqual(pool.choose().url, 'b')
+		# A success resets the run of failures, the cool-down still has to expire
+		pool.record(state, 0.1, True)
+		self.assertEqual(state.consecutive_failures, 0)
+		self.assertEqual([healthy.url for healthy in pool.healthy()], ['b'])
+		self.now += 100
+		self.assertEqual(len(pool.healthy()), 2)
+
+	def test_all_cooling_down_uses_the_first_to_recover(self):
+		pool = self.pool(failure_threshold=1)
+		pool.record(pool.states['a'], 0.1, False)
+		pool.record(pool.states['a'], 0.1, False)
+		pool.record(pool.states['b'], 0.1, False)
+		self.assertEqual(pool.healthy(), [])
+		self.assertEqual(pool.choose().url, 'b')
+
+	def test_latency_average(self):
+		pool = self.pool(('a',), latency_alpha=0.5)
+		state = pool.states['a']
+		pool.record(state, 1.0, True)
+		pool.record(state, 3.0, True)
+		self.assertEqual(state.latency, 2.0)
+
+
+class ProxyPoolClientTest(unittest.IsolatedAsyncioTestCase):
+
+	def transport(self, status_code=200, error=None):
+		def handler(request):
+			if error is not None:
+				raise error
+			return Response(status_code, content=b'<html></html>')
+
+		return MockTransport(handler)
+
+	async def test_get_scores_the_proxy(self):
+		pool = ProxyPool(['direct'], failure_threshold=2)
+		state = pool.states['direct']
+		async with pool.open(transport=self.transport(403)):
+			for _ in range(2):
+				response = await pool.get('https://thelashop.com/')
+				self.assertEqual(response.status_code, 403)
+		self.assertEqual((state.requests, state.failures, state.cooldowns, state.in_flight), (2, 2, 1, 0))
+		self.assertEqual(pool.clients, {})
+
+		async with pool.open(transport=self.transport(404)):
+			await pool.get('https://thelashop.com/')
+		self.assertEqual((state.requests, state.failures, state.consecutive_failures), (3, 2, 0))
+
+	async def test_transport_errors_count_against_the_proxy(self):
+		pool = ProxyPool(['direct'])
+		state = pool.states['direct']
+		async with pool.open(transport=self.transport(error=ConnectError('refused'))):
+			with self.assertRaises(ConnectError):
+				await pool.get('https://thelashop.com/')
+			with self.assertRaises(ConnectError):
+				async with pool.stream('GET', 'https://thelashop.com/'):
+					pass
+		self.assertEqual((state.requests, state.failures, state.in_flight), (2, 2, 0))
+
+	async def test_stream_is_scored_after_the_body(self):
+		pool = ProxyPool(['direct'])
+		state = pool.states['direct']
+		async with pool.open(transport=self.transport(429)):
+			async with pool.stream('GET', 'https://thelashop.com/') as response:
+				self.assertEqual(await response.aread(), b'<html></html>')
+				self.assertEqual(state.requests, 0)
+		self.assertEqual((state.requests, state.failures), (1, 1))
@@ -0,0 +1,70 @@
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from records import ProductColumns, ProductSchema
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shopify_schema.json')
+
+
+class ProductRecordTest(unittest.TestCase):
+
+	def test_reads_like_the_schema_dict(self):
+		schema = ProductSchema.load(SCHEMA_PATH)
+		record = schema.new_record()
+		self.assertEqual(record.to_dict(), schema.defaults)
+		self.assertEqual(list(record.keys()), list(schema.defaults))
+		self.assertEqual(len(record), len(schema.defaults))
+
+		column = next(iter(schema.defaults))
+		record[column] = 'changed'
+		self.assertEqual(record[column], 'changed')
+		# Records share the column index, never the values
+		self.assertEqual(schema.new_record()[column], schema.defaults[column])
+		with self.assertRaises(KeyError):
+			record['Not A Column']
+		with self.assertRaises(KeyError):
+			record['Not A Column'] = 1
+
+
+class ProductColumnsTest(unittest.TestCase):
+
+	def assert_from_records(self, records):
+		columns = ProductColumns()
+		columns.extend(records)
+		expected = pd.DataFrame.from_records([dict(record.items()) for record in records])
+		pd.testing.assert_frame_equal(columns.to_frame(), expected)
+		self.assertEqual(columns.columns, {})
+
+	def test_schema_records(self):
+		schema = ProductSchema.load(SCHEMA_PATH)
+		names = list(schema.defaults)
+		records = list()
+		for i in range(5):
+			record = schema.new_record()
+			record[names[0]] = f'product-{i}'
+			record[names[1]] = i * 1.5 if i % 2 else i
+			record[names[2]] = [f'image-{i}', f'image-{i + 1}']
+			record[names[3]] = None if i == 3 else True
+			records.append(record)
+		self.assert_from_records(records)
+
+	def test_ragged_records(self):
+		self.assert_from_records([
+			{'Handle': 'a', 'Price': 1},
+			{'Handle': 'b', 'Tags': ['x'], 'Price': 2},
+			{'Grams': 10.5},
+			{'Price': 3, 'Handle': 'd', 'Published': False},
+			{'Handle': 'e', 'Tags': ['y', 'z']},
+		])
+
+	def test_empty(self):
+		self.assertEqual(ProductColumns().to_frame().shape, (0, 0))
+
+	def test_column_dtypes(self):
+		columns = ProductColumns()
+		columns.extend([{'Qty': 1, 'Price': 1.5, 'Published': True}, {'Qty': 2, 'Price': np.nan, 'Published': False}])
+		df = columns.to_frame()
+		self.assertEqual(df.dtypes.to_dict(), {'Qty': np.dtype('int64'), 'Price': np.dtype('float64'), 'Published': np.dtype('bool')})
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+import duckdb
+from httpx import AsyncClient
+
+from replay_server import ReplayConfig, ReplayServer, synthetic_pages
+from scraper import FTScraper
+
+logging.getLogger('scraper').setLevel(logging.WARNING)
+logging.getLogger('proxy_pool').setLevel(logging.WARNING)
+logging.getLogger('fetch_policy').setLevel(logging.ERROR)
+logging.getLogger('replay_server').setLevel(logging.WARNING)
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+def free_port():
+	with socket.socket() as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+
+class RouteTest(unittest.TestCase):
+
+	def setUp(self):
+		self.server = ReplayServer(synthetic_pages(5, size=1000), ReplayConfig(per_page=2))
+		self.server.base_url = 'http://127.0.0.1:8765'
+
+	def test_routes(self):
+		status, _, body = self.server.route('/products/synthetic-product-3')
+		self.assertEqual((status, body), (200, self.server.products['synthetic-product-3']))
+		self.assertEqual(self.server.route('/products/missing')[0], 404)
+		# Absolute-form targets from proxies are routed on their path
+		self.assertEqual(self.server.route('http://thelashop.com/products/synthetic-product-0')[0], 200)
+
+	def test_listing_pages(self):
+		self.assertEqual(self.server.total_pages, 3)
+		_, _, body = self.server.route('/collections/all?page=3')
+		self.assertIn(b'href="/products/synthetic-product-4"', body)
+		self.assertNotIn(b'synthetic-product-3"', body)
+		self.assertEqual(self.server.route('/collections/all?page=4')[0], 404)
+
+	def test_sitemap(self):
+		_, _, index = self.server.route('/sitemap.xml')
+		self.assertIn(b'<loc>http://127.0.0.1:8765/sitemap_products_1.xml</loc>', index)
+		_, _, urlset = self.server.route('/sitemap_products_1.xml')
+		self.assertEqual(urlset.count(b'<url>'), 5)
+
+
+class ReplayServerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	async def serving(self, server, client):
+		# Runs client(base_url) against server
+		port = free_port()
+		ready = asyncio.Event()
+		task = asyncio.create_task(server.serve(port=port, ready=ready))
+		await ready.wait()
+		try:
+			return await client(f'http://127.0.0.1:{port}')
+		finally:
+			task.cancel()
+			await asyncio.gather(task, return_exceptions=True)
+
+	def test_revalidation(self):
+		async def client(base_url):
+			async with AsyncClient() as aclient:
+				response = await aclient.get(f'{base_url}/products/synthetic-product-1')
+				again = await aclient.get(f'{base_url}/products/synthetic-product-1', headers={'if-none-match': response.headers['etag']})
+				stats = await aclient.get(f'{base_url}/__stats')
+			return response, again, stats.json()
+
+		server = ReplayServer(synthetic_pages(2, size=1000), ReplayConfig(latency=0))
+		response, again, stats = asyncio.run(self.serving(server, client))
+		self.assertEqual(response.content, server.products['synthetic-product-1'])
+		self.assertEqual(again.status_code, 304)
+		self.assertEqual(stats, {'requests': 3, '200': 2, '304': 1})
+
+	def test_injected_errors_are_seeded(self):
+		async def client(base_url):
+			async with AsyncClient() as aclient:
+				return [(await aclient.get(f'{base_url}/products/synthetic-product-0')).status_code for _ in range(30)]
+
+		def statuses():
+			config = ReplayConfig(latency=0, rate_429=0.2, rate_5xx=0.2, seed=7)
+			return asyncio.run(self.serving(ReplayServer(synthetic_pages(1, size=1000), config), client))
+
+		first = statuses()
+		self.assertEqual(first, statuses())
+		self.assertEqual(set(first) - {200, 429, 500, 502, 503}, set())
+		self.assertTrue({200, 429} <= set(first))
+
+	def test_sitemap_crawl(self):
+		pages = synthetic_pages(12, size=1000)
+		database_name = os.path.join(self.directory, 'thelashop.db')
+
+		async def client(base_url):
+			scraper = FTScraper(base_url=base_url, proxies=['direct'], requests_per_second=1000)
+			return await scraper.sitemap_crawl_to_db(f'{base_url}/sitemap.xml', database_name)
+
+		config = ReplayConfig(latency=0.001, rate_5xx=0.1, seed=3)
+		self.assertEqual(asyncio.run(self.serving(ReplayServer(pages, config), client)), [])
+		conn = duckdb.connect(database_name)
+		try:
+			stored = conn.execute("SELECT count(DISTINCT url) FROM product_src").fetchone()[0]
+		finally:
+			conn.close()
+		self.assertEqual(stored, 12)
@@ -0,0 +1,155 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+import duckdb
+from httpx import MockTransport, Response
+
+from proxy_pool import ProxyPool
+from scraper import FTScraper
+
+logging.getLogger('scraper').setLevel(logging.WARNING)
+logging.getLogger('proxy_pool').setLevel(logging.WARNING)
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+BASE_URL = 'https://thelashop.com'
+OLD = '2020-01-01'
+NEW = '2100-01-01T00:00:00Z'
+
+
+def urlset(tag, entries):
+	items = ''.join(
+		f'<{tag}><loc>{BASE_URL}{path}</loc>' + (f'<lastmod>{lastmod}</lastmod>' if lastmod else '') + f'</{tag}>'
+		for path, lastmod in entries
+	)
+	root = 'sitemapindex' if tag == 'sitemap' else 'urlset'
+
+	return f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{items}</{root}>'.encode()
+
+
+class ReplayPool(ProxyPool):
+	transport = None
+
+	def open(self, **client_kwargs):
+		return super().open(transport=self.transport, **client_kwargs)
+
+
+class SitemapScraper(FTScraper):
+	# Serves the sitemaps in self.sitemaps (path -> bytes) and a page for every product path
+
+	def setup(self, sitemaps):
+		self.sitemaps = sitemaps
+		self.requests = list()
+
+		return self
+
+	def handler(self, request):
+		self.requests.append(request.url.path)
+		if request.url.path in self.sitemaps:
+			return Response(200, content=self.sitemaps[request.url.path])
+		if request.url.path.startswith('/products/'):
+			return Response(200, content=f'<html>{request.url.path}</html>'.encode())
+
+		return Response(404)
+
+	def proxy_pool(self):
+		pool = ReplayPool(['direct'])
+		pool.transport = MockTransport(self.handler)
+
+		return pool
+
+
+class ParseLastmodTest(unittest.TestCase):
+
+	def test_formats(self):
+		parse_lastmod = FTScraper().parse_lastmod
+		self.assertEqual(parse_lastmod('2025-10-01'), datetime(2025, 10, 1))
+		self.assertEqual(parse_lastmod(' 2025-10-01T10:30:00Z '), datetime(2025, 10, 1, 10, 30))
+		self.assertEqual(parse_lastmod('2025-10-01T10:30:00-04:00'), datetime(2025, 10, 1, 14, 30))
+		self.assertEqual(parse_lastmod('2025-10-01T10:30:00.5+02:00'), datetime(2025, 10, 1, 8, 30, 0, 500000))
+		self.assertEqual(parse_lastmod('2025-10-01T10:30:00'), datetime(2025, 10, 1, 10, 30))
+
+	def test_missing_or_malformed(self):
+		parse_lastmod = FTScraper().parse_lastmod
+		for value in (None, '', 'yesterday', '2025-13-01'):
+			self.assertIsNone(parse_lastmod(value), value)
+
+
+class SitemapTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.database_name = os.path.join(self.directory, 'thelashop.db')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def sitemaps(self, first=OLD, second=OLD, products=None):
+		products = {'/products/p1': OLD, '/products/p2': None, '/products/p3': OLD, **(products or {})}
+		return {
+			'/sitemap.xml': urlset('sitemap', [
+				('/sitemap_products_1.xml', first),
+				('/sitemap_products_2.xml.gz', second),
+				('/sitemap_pages_1.xml', NEW),
+			]),
+			'/sitemap_products_1.xml': urlset('url', [
+				('/products/p1', products['/products/p1']),
+				('/products/p2', products['/products/p2']),
+				('/collections/all', NEW),
+			]),
+			'/sitemap_products_2.xml.gz': gzip.compress(urlset('url', [('/products/p3', products['/products/p3'])])),
+		}
+
+	def scraper(self, sitemaps):
+		return SitemapScraper(proxies=['direct']).setup(sitemaps)
+
+	def product_urls(self, scraper, since=None):
+		async def run():
+			limit = scraper.concurrency_controller()
+			policy = scraper.fetch_policy()
+			async with scraper.proxy_pool().open() as aclient:
+				return await scraper.sitemap_product_urls(aclient, f'{BASE_URL}/sitemap.xml', limit, policy, since=since)
+
+		return asyncio.run(run())
+
+	def crawl(self, scraper):
+		return asyncio.run(scraper.sitemap_crawl_to_db(f'{BASE_URL}/sitemap.xml', self.database_name))
+
+	def test_product_urls(self):
+		scraper = self.scraper(self.sitemaps())
+		products = self.product_urls(scraper)
+		self.assertEqual(products, {
+			f'{BASE_URL}/products/p1': datetime(2020, 1, 1),
+			f'{BASE_URL}/products/p2': None,
+			f'{BASE_URL}/products/p3': datetime(2020, 1, 1),
+		})
+		self.assertNotIn('/sitemap_pages_1.xml', scraper.requests)
+
+	def test_unchanged_sitemaps_are_not_fetched(self):
+		scraper = self.scraper(self.sitemaps(second=NEW))
+		products = self.product_urls(scraper, since=datetime(2025, 1, 1))
+		self.assertEqual(scraper.requests, ['/sitemap.xml', '/sitemap_products_2.xml.gz'])
+		self.assertEqual(list(products), [f'{BASE_URL}/products/p3'])
+
+	def test_rerun_fetches_changed_products(self):
+		scraper = self.scraper(self.sitemaps())
+		self.assertEqual(self.crawl(scraper), [])
+		self.assertEqual(sorted(path for path in scraper.requests if path.startswith('/products/')), ['/products/p1', '/products/p2', '/products/p3'])
+
+		# p1 changed, p2 has no lastmod and is always revalidated, the second product sitemap is unchanged
+		scraper = self.scraper(self.sitemaps(first=NEW, products={'/products/p1': NEW}))
+		self.assertEqual(self.crawl(scraper), [])
+		self.assertEqual(scraper.requests[:2], ['/sitemap.xml', '/sitemap_products_1.xml'])
+		self.assertEqual(sorted(scraper.requests[2:]), ['/products/p1', '/products/p2'])
+
+		conn = duckdb.connect(self.database_name)
+		try:
+			runs = conn.execute("SELECT status, discovered, fetched, failed FROM crawl_runs WHERE mode = 'sitemap' ORDER BY started_at").fetchall()
+		finally:
+			conn.close()
+		self.assertEqual(runs, [('success', 3, 3, 0), ('success', 2, 2, 0)])